@@ -0,0 +1,67 @@
+"""
+adc.py - Select the real or simulated ADS1115 backend
+
+sensors.py and calibration.py import ADS, AnalogIn and open_i2c() from
+here. start_conversion() / read_conversion() split a single-shot read in
+two so several boards can convert at once (see multiads.py). With
+FYTO_SIMULATE=1 in the environment they get simads instead of the
+Adafruit driver, so the sensor logic runs on any Linux host.
+
+    FYTO_SIMULATE      1 to use the simulator
+    FYTO_SIM_SPEED     simulated seconds per real second (default 1)
+    FYTO_SIM_ERRORS    probability of an injected I2C error per transaction
+"""
+
+import os
+
+SIMULATE = os.environ.get('FYTO_SIMULATE', '') not in ('', '0')
+
+if SIMULATE:
+    import simads as ADS
+    from simads import AnalogIn, Mode
+
+    def open_i2c():
+        clock = ADS.SimClock(speed=float(os.environ.get('FYTO_SIM_SPEED', '1')))
+        return ADS.I2C(clock=clock, error_rate=float(os.environ.get('FYTO_SIM_ERRORS', '0')))
+
+    def start_conversion(ads, pin):
+        ads.start_conversion(pin)
+
+    def read_conversion(ads):
+        return ads.read_conversion()
+else:
+    import board
+    import busio
+    import adafruit_ads1x15.ads1115 as ADS
+    from adafruit_ads1x15.ads1x15 import Mode
+    from adafruit_ads1x15.analog_in import AnalogIn
+
+    # ADS1115 registers and config bits (datasheet section 8.6)
+    _POINTER_CONVERSION = 0x00
+    _POINTER_CONFIG = 0x01
+    _CONFIG_OS_SINGLE = 0x8000
+    _CONFIG_MUX_OFFSET = 12
+    _CONFIG_COMP_QUE_DISABLE = 0x0003
+    _CONFIG_GAIN = {2/3: 0x0000, 1: 0x0200, 2: 0x0400, 4: 0x0600, 8: 0x0800, 16: 0x0A00}
+
+    def open_i2c():
+        return busio.I2C(board.SCL, board.SDA)
+
+    def start_conversion(ads, pin):
+        """Start a single-shot conversion of a single-ended pin without waiting for it."""
+        config = (_CONFIG_OS_SINGLE | ((pin + 0x04) << _CONFIG_MUX_OFFSET) | _CONFIG_GAIN[ads.gain]
+                  | Mode.SINGLE | ads.rate_config[ads.data_rate] | _CONFIG_COMP_QUE_DISABLE)
+        with ads.i2c_device as i2c:
+            i2c.write(bytes([_POINTER_CONFIG, (config >> 8) & 0xFF, config & 0xFF]))
+
+    def read_conversion(ads):
+        """Wait for the conversion started by start_conversion() and return the signed result."""
+        buf = bytearray(2)
+        with ads.i2c_device as i2c:
+            while True:
+                i2c.write_then_readinto(bytes([_POINTER_CONFIG]), buf)
+                if buf[0] & 0x80:
+                    break
+            i2c.write_then_readinto(bytes([_POINTER_CONVERSION]), buf)
+        value = buf[0] << 8 | buf[1]
+        return value - 0x10000 if value & 0x8000 else value
@@ -0,0 +1,272 @@
+"""
+animation.py - Emotion animations as intro, loop and outro segments
+
+main.show() used to play frames 0-179 from the start on every switch and
+every repeat. An emotion folder can now carry a manifest.json that splits
+its frames into segments and holds single frames longer:
+
+    {
+        "intro": [0, 29],           # played once when the emotion starts
+        "loop": [30, 149],          # repeated while the emotion stays
+        "outro": [150, 179],        # played when switching away
+        "hold": {"30": 3}           # frame 30 stays up for 3 frame periods
+    }
+
+Ranges are inclusive frame numbers; intro, outro and hold are optional.
+Without a manifest the whole folder is the loop, which is what the shipped
+180-frame animations are drawn as.
+
+The Player follows intro -> loop (repeating) and, on a switch, the old
+emotion's outro -> the new emotion's intro -> its loop. Its position
+survives between main.show() calls, so an interrupted animation continues
+where it stopped.
+
+Usage:
+    player = Player('emotion')
+    player.switch('happy')
+    while True:
+        folder, frame, hold = player.next()
+        ...show emotion/<folder>/frame<frame>.png for hold frame periods...
+
+    python3 animation.py happy                # segments of one emotion
+    python3 animation.py happy --suggest      # loop points found by frame similarity
+"""
+
+import os
+import re
+import sys
+import json
+import threading
+
+EMOTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emotion')
+MANIFEST_NAME = 'manifest.json'
+SEGMENTS = ('intro', 'loop', 'outro')
+_FRAME = re.compile(r'frame(\d+)\.png$')
+
+
+def count_frames(path):
+    """Number of consecutive frameN.png files from frame0 in a folder."""
+    numbers = set()
+    for name in os.listdir(path):
+        match = _FRAME.match(name)
+        if match:
+            numbers.add(int(match.group(1)))
+    n = 0
+    while n in numbers:
+        n += 1
+    return n
+
+
+class Manifest:
+    """
+    Segments and frame holds of one emotion.
+
+    Args:
+        frames (int): Number of frames in the folder
+        intro, loop, outro (list): Inclusive [first, last] frame ranges
+        hold (dict): frame -> number of frame periods it stays up
+    """
+
+    def __init__(self, frames, intro=None, loop=None, outro=None, hold=None):
+        self.frames = frames
+        self.segments = {}
+        for name, bounds in (('intro', intro), ('loop', loop or [0, frames - 1]), ('outro', outro)):
+            if not bounds:
+                self.segments[name] = []
+                continue
+            first, last = bounds
+            if not 0 <= first <= last < frames:
+                raise ValueError('%s range %s outside frames 0-%d' % (name, bounds, frames - 1))
+            self.segments[name] = list(range(first, last + 1))
+        if not self.segments['loop']:
+            raise ValueError('empty loop')
+        self.holds = {int(frame): max(1, int(count)) for frame, count in (hold or {}).items()}
+
+    @classmethod
+    def from_config(cls, config, frames):
+        unknown = set(config) - set(SEGMENTS) - {'hold'}
+        if unknown:
+            raise ValueError('unknown manifest keys: %s' % ', '.join(sorted(unknown)))
+        return cls(frames, config.get('intro'), config.get('loop'), config.get('outro'), config.get('hold'))
+
+    @classmethod
+    def from_folder(cls, path):
+        """Manifest of an emotion folder; the whole folder loops without manifest.json."""
+        frames = count_frames(path)
+        if frames == 0:
+            raise ValueError('no frames in %s' % path)
+        manifest = os.path.join(path, MANIFEST_NAME)
+        if not os.path.exists(manifest):
+            return cls(frames)
+        with open(manifest) as f:
+            return cls.from_config(json.load(f), frames)
+
+    def hold(self, frame):
+        return self.holds.get(frame, 1)
+
+    def buffer(self, frame):
+        """Encoded panel bytes of a frame; None = decode the PNG (see framecache.py)."""
+        return None
+
+    def segment_of(self, frame):
+        """(segment, position) of a frame number; the loop wins where segments overlap."""
+        for name in ('loop', 'intro', 'outro'):
+            if frame in self.segments[name]:
+                return name, self.segments[name].index(frame)
+        return 'intro', 0
+
+
+class Player:
+    """
+    Frame sequence across emotion switches.
+
+    Args:
+        directory (str): Folder holding one sub-folder per emotion
+    """
+
+    def __init__(self, directory=EMOTION_DIR):
+        self.directory = directory
+        self.manifests = {}
+        self.folder = None
+        self.pending = None
+        self.segment = 'loop'
+        self.pos = 0
+        self.count = 0
+        self.boundary = False
+        self.replacements = {}
+        self._lock = threading.Lock()
+
+    def manifest(self, folder):
+        if folder not in self.manifests:
+            self.manifests[folder] = Manifest.from_folder(os.path.join(self.directory, folder))
+        return self.manifests[folder]
+
+    @property
+    def target(self):
+        """Emotion being played or switched to."""
+        return self.pending or self.folder
+
+    def replace(self, folder, manifest):
+        """New manifest for folder (any thread); the playing emotion takes it at its next loop boundary."""
+        with self._lock:
+            self.replacements[folder] = manifest
+
+    def _apply(self, boundary):
+        with self._lock:
+            for folder in list(self.replacements):
+                if boundary or folder != self.folder:
+                    self.manifests[folder] = self.replacements.pop(folder)
+
+    def _start(self, folder):
+        self._apply(True)
+        self.folder = folder
+        self.pending = None
+        self.segment = 'intro'
+        self.pos = 0
+
+    def switch(self, folder):
+        """Go to another emotion (through the current outro); False if already there."""
+        self.manifest(folder)       # raises before anything changes if the folder is unusable
+        if folder == self.target:
+            return False
+        if self.folder is None or folder == self.folder:
+            # First emotion, or back to the one whose outro is playing
+            if self.folder is None:
+                self._start(folder)
+            else:
+                self.pending = None
+            return True
+        self.pending = folder
+        if self.segment != 'outro':
+            self.segment = 'outro'
+            self.pos = 0
+        return True
+
+    def settle(self):
+        """Skip outro and intro: straight into the target's loop (static display)."""
+        if self.pending is not None:
+            self._start(self.pending)
+        if self.segment != 'loop':
+            self.segment = 'loop'
+            self.pos = 0
+
+    def seek(self, folder, frame):
+        """Continue folder at a frame number (warm restart)."""
+        self.folder = folder
+        self.pending = None
+        self.segment, self.pos = self.manifest(folder).segment_of(frame)
+
+    def next(self):
+        """(folder, frame, hold) to show next; at_boundary() tells if it ends the loop."""
+        if self.replacements:
+            self._apply(False)
+        manifest = self.manifest(self.folder)
+        frames = manifest.segments[self.segment]
+        while self.pos >= len(frames):
+            if self.segment == 'outro' and self.pending is not None:
+                self._start(self.pending)
+            else:
+                if self.segment == 'loop':
+                    # Loop boundary: an edited animation comes in here, never mid-loop
+                    self._apply(True)
+                # intro -> loop, loop -> loop, outro without a switch -> loop
+                self.segment = 'loop'
+                self.pos = 0
+            manifest = self.manifest(self.folder)
+            frames = manifest.segments[self.segment]
+        frame = frames[self.pos]
+        self.pos += 1
+        self.count += 1
+        self.boundary = self.segment == 'loop' and self.pos == len(frames)
+        return self.folder, frame, manifest.hold(frame)
+
+    def at_boundary(self):
+        """True if the last frame from next() was the last of a loop pass."""
+        return self.boundary
+
+
+def suggest_loops(path, count=5, min_length=30, size=(80, 60)):
+    """
+    Loop ranges whose last frame leads smoothly back to the first.
+
+    Returns:
+        list: (mean abs difference 0-255, first, last), best first
+    """
+    import numpy as np
+    from PIL import Image
+    frames = count_frames(path)
+    small = np.stack([np.asarray(Image.open(os.path.join(path, 'frame%d.png' % i)).convert('RGB').resize(size),
+                                 dtype=np.int16) for i in range(frames)])
+    candidates = []
+    for first in range(frames):
+        for last in range(first + min_length, frames):
+            # last -> first should look like an ordinary step between neighbours
+            candidates.append((float(np.abs(small[last] - small[first]).mean()), first, last - 1))
+    candidates.sort()
+    return candidates[:count]
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Show the segments of an emotion animation')
+    parser.add_argument('emotion', help='folder in emotion/')
+    parser.add_argument('--suggest', action='store_true', help='look for seamless loop ranges')
+    parser.add_argument('--min-length', type=int, default=30, help='shortest loop for --suggest')
+    args = parser.parse_args(argv)
+    path = os.path.join(EMOTION_DIR, args.emotion)
+    manifest = Manifest.from_folder(path)
+    print('%s: %d frames%s' % (args.emotion, manifest.frames,
+                               '' if os.path.exists(os.path.join(path, MANIFEST_NAME)) else ' (no manifest)'))
+    for name in SEGMENTS:
+        frames = manifest.segments[name]
+        print('  %-6s %s' % (name, '%d-%d' % (frames[0], frames[-1]) if frames else '-'))
+    if manifest.holds:
+        print('  hold   %s' % ', '.join('%d x%d' % item for item in sorted(manifest.holds.items())))
+    if args.suggest:
+        for diff, first, last in suggest_loops(path, min_length=args.min_length):
+            print('  loop %d-%d: %.2f' % (first, last, diff))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+broker.py - Single owner of the I2C bus, sharing readings with local clients
+
+The broker opens the ADS1115 boards from plants.json, samples them with
+the adaptive rates from sampling.json and publishes every reading twice:
+
+    - a snapshot in shared memory (/dev/shm/fyto-readings) guarded by a
+      sequence counter, so readers just copy it out of an mmap with no
+      syscall and no round trip to the broker
+    - a Unix socket (/tmp/fyto-broker.sock) taking JSON line requests:
+        {"cmd": "subscribe", "rate": 2, "channels": ["0x48:2"]}
+            -> one {"time": ..., "values": {...}} line per update, at most
+               `rate` per second; a slow client only ever gets the newest state
+        {"cmd": "burst", "channel": "0x48:2", "samples": 1024}
+            -> {"values": [...], "elapsed": ...} (used by calibration.py),
+               or {"error": ...} when the I2C read failed
+
+sensors.py and calibration.py use the broker automatically when its socket
+exists, so they can run side by side (plus a dashboard) with the bus read
+once per sample. A snapshot not updated for `stale` seconds (broker
+stopped or hung) makes BrokerClient.read() raise OSError, like a failed
+bus read.
+
+Usage:
+    python3 broker.py
+    client = BrokerClient()
+    client.read(['0x48:2'])                    # latest values from the snapshot
+    for update in client.subscribe(1.0): ...   # pushed updates, max 1 Hz
+"""
+
+import os
+import sys
+import mmap
+import json
+import time
+import struct
+import signal
+import socket
+import logging
+import selectors
+
+SOCKET_PATH = os.environ.get('FYTO_BROKER_SOCKET', '/tmp/fyto-broker.sock')
+SNAPSHOT_PATH = os.environ.get('FYTO_BROKER_SNAPSHOT',
+                               '/dev/shm/fyto-readings' if os.path.isdir('/dev/shm') else '/tmp/fyto-readings')
+
+MAX_CHANNELS = 16
+# seq, channel count, conversions, errors, busy seconds, broker start, last update (wall clock)
+_HEADER = struct.Struct('<IIQIddd')
+# channel name, raw value, wall clock time of the reading
+_SLOT = struct.Struct('<8sid')
+SNAPSHOT_SIZE = _HEADER.size + MAX_CHANNELS * _SLOT.size
+# Seconds without a snapshot update before clients treat the broker as gone;
+# the slowest channel (min_rate 0.05 in sampling.json) is read every 20 s
+STALE_AFTER = 60.0
+
+
+def available(path=SOCKET_PATH):
+    """True if a broker is listening on `path`."""
+    if not os.path.exists(path):
+        return False
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+class SnapshotWriter:
+    """Seqlock-protected latest readings in a shared mmap."""
+
+    def __init__(self, path, channels):
+        if len(channels) > MAX_CHANNELS:
+            raise ValueError('at most %d channels' % MAX_CHANNELS)
+        self.channels = list(channels)
+        self.index = {channel: i for i, channel in enumerate(self.channels)}
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(fd, SNAPSHOT_SIZE)
+        self.mm = mmap.mmap(fd, SNAPSHOT_SIZE)
+        os.close(fd)
+        self.seq = 0
+        self.values = {channel: (0, 0.0) for channel in self.channels}
+        self.started = time.time()
+        self.publish({}, 0, 0, 0.0)
+
+    def publish(self, values, conversions, errors, busy):
+        now = time.time()
+        for channel, value in values.items():
+            self.values[channel] = (value, now)
+        # Odd sequence number while the snapshot is being written
+        self.seq += 1
+        struct.pack_into('<I', self.mm, 0, self.seq)
+        for i, channel in enumerate(self.channels):
+            value, t = self.values[channel]
+            _SLOT.pack_into(self.mm, _HEADER.size + i * _SLOT.size, channel.encode(), value, t)
+        _HEADER.pack_into(self.mm, 0, self.seq, len(self.channels), conversions, errors, busy, self.started, now)
+        # Even again only after everything else is written
+        self.seq += 1
+        struct.pack_into('<I', self.mm, 0, self.seq)
+
+
+def read_snapshot(mm, retries=100):
+    """
+    Consistent copy of the snapshot.
+
+    Returns:
+        tuple: (header tuple, {channel: (raw value, time)})
+    """
+    for _ in range(retries):
+        seq = struct.unpack_from('<I', mm, 0)[0]
+        if seq & 1:
+            continue
+        data = mm[:SNAPSHOT_SIZE]
+        if struct.unpack_from('<I', mm, 0)[0] != seq:
+            continue
+        header = _HEADER.unpack_from(data, 0)
+        slots = {}
+        for i in range(header[1]):
+            name, value, t = _SLOT.unpack_from(data, _HEADER.size + i * _SLOT.size)
+            slots[name.rstrip(b'\0').decode()] = (value, t)
+        return header, slots
+    raise RuntimeError('snapshot kept changing while reading')
+
+
+class _Subscriber:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.inbuf = b''
+        self.outbuf = b''
+        self.interval = None
+        self.channels = None
+        self.next_time = 0.0
+        self.version_seen = -1
+
+
+class Broker:
+    """
+    Owns the bus: samples it and serves snapshots/subscriptions.
+
+    Args:
+        bus (RoundRobin): Boards to read
+        sampler (AdaptiveSampler): Per-channel read rates
+        socket_path (str): Unix socket for requests
+        snapshot_path (str): Shared memory file for the snapshot
+    """
+
+    def __init__(self, bus, sampler, socket_path=SOCKET_PATH, snapshot_path=SNAPSHOT_PATH):
+        self.bus = bus
+        self.sampler = sampler
+        self.snapshot = SnapshotWriter(snapshot_path, sorted(sampler.channels))
+        self.socket_path = socket_path
+        if os.path.exists(socket_path):
+            if available(socket_path):
+                raise RuntimeError('another broker is running on %s' % socket_path)
+            os.remove(socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(socket_path)
+        self.server.listen(8)
+        self.server.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ)
+        self.clients = {}
+        self.version = 0
+        self.dropped = 0
+
+    def run(self):
+        try:
+            while True:
+                self.step()
+        finally:
+            self.close()
+
+    def step(self):
+        timeout = self.sampler.sleep_time(time.monotonic())
+        for key, events in self.selector.select(timeout):
+            if key.fileobj is self.server:
+                self._accept()
+            else:
+                client = self.clients.get(key.fileobj)
+                if client is None:
+                    continue
+                if events & selectors.EVENT_READ:
+                    self._receive(client)
+                if events & selectors.EVENT_WRITE and client.conn in self.clients:
+                    self._flush(client)
+        now = time.monotonic()
+        due = self.sampler.due(now)
+        if due:
+            values = self.bus.read(due)
+            for channel, value in values.items():
+                self.sampler.record(channel, value, now)
+            if values:
+                self.version += 1
+                self.snapshot.publish(values, self.bus.conversions, self.bus.errors, self.bus.busy)
+        self._push(now)
+
+    def _accept(self):
+        conn, _ = self.server.accept()
+        conn.setblocking(False)
+        self.clients[conn] = _Subscriber(conn)
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def _drop(self, client):
+        self.selector.unregister(client.conn)
+        del self.clients[client.conn]
+        client.conn.close()
+
+    def _receive(self, client):
+        try:
+            data = client.conn.recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            return self._drop(client)
+        client.inbuf += data
+        while b'\n' in client.inbuf:
+            line, client.inbuf = client.inbuf.split(b'\n', 1)
+            try:
+                request = json.loads(line)
+                reply = self._handle(client, request)
+            except (ValueError, KeyError) as e:
+                reply = {'error': str(e)}
+            if reply is not None:
+                self._send(client, reply)
+
+    def _handle(self, client, request):
+        cmd = request['cmd']
+        if cmd == 'subscribe':
+            rate = float(request.get('rate', 1.0))
+            client.interval = 1.0 / rate if rate > 0 else 0.0
+            client.channels = request.get('channels')
+            client.next_time = 0.0
+            return None
+        if cmd == 'burst':
+            # Exclusive use of the bus; sampling pauses for the burst
+            try:
+                values, elapsed = self.bus.burst(request['channel'], int(request.get('samples', 1024)))
+            except OSError as e:
+                # I2C error (e.g. errno 121): the client retries, the broker keeps running
+                logging.warning('broker: burst on %s failed (%s)', request['channel'], e)
+                return {'error': str(e)}
+            return {'values': values, 'elapsed': elapsed}
+        raise ValueError('unknown cmd %r' % cmd)
+
+    def _send(self, client, message):
+        client.outbuf += (json.dumps(message) + '\n').encode()
+        self._flush(client)
+
+    def _flush(self, client):
+        try:
+            sent = client.conn.send(client.outbuf)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            return self._drop(client)
+        client.outbuf = client.outbuf[sent:]
+        self.selector.modify(client.conn, selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbuf else 0))
+
+    def _push(self, now):
+        for client in list(self.clients.values()):
+            if client.interval is None or now < client.next_time or client.version_seen == self.version:
+                continue
+            if client.outbuf:
+                # Still sending the previous update; skip this one, the next carries newer data
+                self.dropped += 1
+                continue
+            client.version_seen = self.version
+            client.next_time = now + client.interval
+            values = self.snapshot.values
+            channels = client.channels or self.snapshot.channels
+            self._send(client, {'time': time.time(),
+                                'values': {c: values[c][0] for c in channels if c in values}})
+
+    def close(self):
+        for client in list(self.clients.values()):
+            self._drop(client)
+        self.server.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class BrokerClient:
+    """
+    Local client of a running broker. read() and throughput() match
+    multiads.RoundRobin, so it can stand in for the bus.
+
+    Args:
+        stale (float): Seconds without a snapshot update after which read() raises OSError
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, snapshot_path=SNAPSHOT_PATH, stale=STALE_AFTER):
+        self.socket_path = socket_path
+        self.stale = stale
+        with open(snapshot_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), SNAPSHOT_SIZE, access=mmap.ACCESS_READ)
+
+    def snapshot(self):
+        """{channel: (raw value, time)} of the latest readings."""
+        return read_snapshot(self.mm)[1]
+
+    def read(self, channels):
+        header, slots = read_snapshot(self.mm)
+        age = time.time() - header[6]
+        if age > self.stale:
+            raise OSError('broker snapshot not updated for %.0f s' % age)
+        return {channel: slots[channel][0] for channel in channels if channel in slots and slots[channel][1] > 0}
+
+    def throughput(self):
+        _, _, conversions, errors, busy, started, updated = read_snapshot(self.mm)[0]
+        elapsed = max(time.time() - started, 1e-9)
+        return conversions / elapsed, busy / elapsed, errors
+
+    def _request(self, request):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(self.socket_path)
+        conn.sendall((json.dumps(request) + '\n').encode())
+        return conn, conn.makefile('r')
+
+    def subscribe(self, rate=1.0, channels=None):
+        """Yield {'time': ..., 'values': {...}} updates, at most `rate` per second."""
+        conn, lines = self._request({'cmd': 'subscribe', 'rate': rate, 'channels': channels})
+        try:
+            for line in lines:
+                yield json.loads(line)
+        finally:
+            conn.close()
+
+    def burst(self, channel, samples):
+        """Same as RoundRobin.burst(), run by the broker."""
+        conn, lines = self._request({'cmd': 'burst', 'channel': channel, 'samples': samples})
+        try:
+            line = lines.readline()
+        finally:
+            conn.close()
+        if not line:
+            raise OSError('broker closed the connection during the burst')
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise OSError(reply['error'])
+        return reply['values'], reply['elapsed']
+
+
+def main():
+    from adc import open_i2c
+    from multiads import RoundRobin
+    from plants import read_config, channel_roles
+    from sampler import AdaptiveSampler
+
+    logging.basicConfig(level=logging.INFO)
+    # Sample off the display core, see scheduling.json
+    import cpusched
+    cpusched.setup('sensors')
+    # systemd stops services with SIGTERM; exit through run()'s cleanup
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    boards, entries = read_config()
+    roles = channel_roles(entries)
+    broker = Broker(RoundRobin(open_i2c(), boards), AdaptiveSampler.from_file(roles=roles))
+    logging.info('broker: %d channels on %d boards, socket %s, snapshot %s',
+                 len(roles), len(boards), broker.socket_path, SNAPSHOT_PATH)
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,183 @@
-import board
-import busio
+"""
+calibration.py - Guided sensor calibration
+
+Walks through the dry/wet moisture and dark/bright light steps, samples
+each channel in a high-rate burst (ADS1115 continuous mode at 860 SPS),
+computes robust statistics with NumPy and writes calibration.json, which
+sensors.py loads at startup.
+
+Usage:
+    python3 calibration.py                      # full guided calibration
+    python3 calibration.py --only moisture      # redo one sensor
+    python3 calibration.py --watch moisture     # print raw values every 0.1 s
+    python3 calibration.py --plant mint         # sensors of another plant in plants.json
+    FYTO_SIMULATE=1 python3 calibration.py      # try it without hardware
+
+When broker.py is running the bursts are done by the broker, which owns
+the bus; otherwise the boards are opened directly.
+"""
+
+import os
+import sys
+import json
 import time
-i2c = busio.I2C(board.SCL, board.SDA)
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-ads = ADS.ADS1115(i2c)
-chan = AnalogIn(ads, ADS.P2)
-while True:
-   print(chan.value)
-   time.sleep(0.1)
+import argparse
+import numpy as np
+import broker
+from adc import open_i2c
+from multiads import RoundRobin, parse_channel
+from plants import CODE_DIR, read_config
+from thresholds import CALIBRATION_FILE, load_calibration, ads_bit_Voltage, lm35_constant
+
+ROLES = ('light', 'moisture', 'temperature')
+
+# (channel, profile key, instruction)
+STEPS = [
+    ('moisture', 'dry', 'Take the moisture sensor out of the soil and wipe it dry.'),
+    ('moisture', 'wet', 'Put the moisture sensor in a glass of water up to the line.'),
+    ('light', 'dark', 'Cover the LDR completely (thumb or opaque cap).'),
+    ('light', 'bright', 'Hold a bright lamp or torch right above the LDR.'),
+]
+
+def robust_stats(values):
+    """Median, percentiles and noise floor (scaled MAD) of a burst."""
+    p1, p5, p50, p95, p99 = np.percentile(values, [1, 5, 50, 95, 99])
+    mad = np.median(np.abs(values - p50))
+    return {
+        'median': int(round(p50)),
+        'p1': int(p1), 'p5': int(p5), 'p95': int(p95), 'p99': int(p99),
+        'noise': round(float(1.4826 * mad), 1),
+        'std': round(float(values.std()), 1),
+    }
+
+
+def measure(bus, channel, samples, retries=3):
+    """Burst-read one channel (RoundRobin or BrokerClient) and return its statistics."""
+    for attempt in range(retries):
+        try:
+            values, elapsed = bus.burst(channel, samples)
+            break
+        except OSError as e:
+            print('  I2C error (%s), retrying' % e)
+    else:
+        sys.exit('Giving up on %s after %d I2C errors' % (channel, retries))
+    values = np.asarray(values, dtype=np.int32)
+    stats = robust_stats(values)
+    print('  %d samples in %.2f s: median %d, p5..p95 %d..%d, noise %.1f counts'
+          % (samples, elapsed, stats['median'], stats['p5'], stats['p95'], stats['noise']))
+    return stats
+
+
+def check_span(channel, low_key, high_key, a, b):
+    """False (with a warning) when two calibration points overlap or are within the noise."""
+    gap = abs(a['median'] - b['median'])
+    noise = max(a['noise'], b['noise'], 1.0)
+    overlap = not (a['p95'] < b['p5'] or b['p95'] < a['p5'])
+    if overlap or gap < 10 * noise:
+        print('  WARNING: %s %s/%s are only %d counts apart (noise %.1f). Not saving %s, check the sensor and retry.'
+              % (channel, low_key, high_key, gap, noise, channel))
+        return False
+    return True
+
+
+def calibrate(bus, inputs, channels, samples, interactive=True):
+    """
+    Run the guided steps.
+
+    Args:
+        bus: RoundRobin or BrokerClient
+        inputs (dict): sensor type -> "<address>:<pin>" of the plant
+        channels (list): Sensor types to calibrate
+    """
+    profile = {'channels': {}, 'stats': {}}
+    for channel, key, instruction in STEPS:
+        if channel not in channels:
+            continue
+        print('\n[%s / %s] %s' % (channel, key, instruction))
+        if interactive:
+            input('  Press Enter when ready...')
+        stats = measure(bus, inputs[channel], samples)
+        profile['channels'].setdefault(channel, {})[key] = stats['median']
+        profile['stats']['%s_%s' % (channel, key)] = stats
+    for channel, low_key, high_key in (('moisture', 'dry', 'wet'), ('light', 'dark', 'bright')):
+        if channel in channels and not check_span(channel, low_key, high_key,
+                                                  profile['stats']['%s_%s' % (channel, low_key)],
+                                                  profile['stats']['%s_%s' % (channel, high_key)]):
+            del profile['channels'][channel]
+    if 'temperature' in channels:
+        print('\n[temperature] Leave the LM35 at room temperature.')
+        stats = measure(bus, inputs['temperature'], samples)
+        measured = stats['median'] * ads_bit_Voltage / lm35_constant
+        profile['stats']['temperature'] = stats
+        offset = 0.0
+        if interactive:
+            answer = input('  Reads %.1f C. Reference thermometer reading in C (Enter to keep): ' % measured).strip()
+            if answer:
+                offset = round(float(answer) - measured, 2)
+        profile['channels']['temperature'] = {'offset': offset}
+    return profile
+
+
+def watch(bus, channel):
+    while True:
+        values = bus.read([channel])
+        if channel in values:
+            print(values[channel])
+        time.sleep(0.1)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Calibrate the Fyto sensors')
+    parser.add_argument('--only', action='append', choices=ROLES, help='calibrate only this sensor (repeatable)')
+    parser.add_argument('--plant', help='plant in plants.json (default: the first one)')
+    parser.add_argument('--samples', type=int, default=1024, help='conversions per burst')
+    parser.add_argument('--output', help='profile to write (default: the plant\'s calibration file)')
+    parser.add_argument('--watch', choices=ROLES, help='print raw values of one sensor every 0.1 s')
+    parser.add_argument('--yes', action='store_true', help='do not wait for Enter between steps')
+    args = parser.parse_args(argv)
+
+    boards, entries = read_config()
+    if args.plant is None:
+        entry = entries[0]
+    else:
+        entry = dict((e['name'], e) for e in entries).get(args.plant)
+        if entry is None:
+            parser.error('no plant %r in plants.json' % args.plant)
+    inputs = entry['channels']
+    output = args.output
+    if output is None:
+        output = os.path.join(CODE_DIR, entry['calibration']) if 'calibration' in entry else CALIBRATION_FILE
+
+    if broker.available():
+        bus = broker.BrokerClient()
+    else:
+        bus = RoundRobin(open_i2c(), sorted(set(parse_channel(c)[0] for c in inputs.values())))
+    if args.watch:
+        return watch(bus, inputs[args.watch])
+
+    channels = args.only or list(ROLES)
+    profile = calibrate(bus, inputs, channels, args.samples, interactive=not args.yes)
+
+    # Keep values of sensors that were not recalibrated this time
+    merged = {'channels': load_calibration(output), 'stats': {}}
+    try:
+        with open(output) as f:
+            merged['stats'] = json.load(f).get('stats', {})
+    except (OSError, ValueError):
+        pass
+    for name, values in profile['channels'].items():
+        merged['channels'].setdefault(name, {}).update(values)
+    merged['stats'].update(profile['stats'])
+    merged['created'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    with open(output, 'w') as f:
+        json.dump(merged, f, indent=4, sort_keys=True)
+    print('\nWrote %s:' % output)
+    for name, values in sorted(merged['channels'].items()):
+        print('  %-12s %s' % (name, ', '.join('%s=%s' % kv for kv in sorted(values.items()))))
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        print()
@@ -0,0 +1,228 @@
+"""
+cpusched.py - CPU affinity and real-time priority per process role
+
+The display loop (PNG decode, RGB565 conversion and the SPI writes in
+ShowImage), the sensor loop and the telemetry writer all share the Pi's
+cores with no scheduling hints, so a burst of I2C reads or a slow log
+write can delay a frame. scheduling.json places each role on its own
+cores and optionally gives it SCHED_FIFO or SCHED_RR:
+
+    "display": {"cpus": [3], "policy": "fifo", "priority": 10},
+    "background": {"cpus": [0, 1, 2]},      # helper threads of main.py
+    "sensors": {"cpus": [0, 1, 2]}          # sensors.py / broker.py and their telemetry thread
+
+Policies: "other" (the normal time-sharing scheduler, with an optional
+"nice"), "fifo" and "rr" (real-time, priority 1-99, needs root or
+CAP_SYS_NICE). A placement applies to the calling thread; threads it
+starts afterwards inherit it. CPUs the system does not have are ignored.
+Each process logs what it got at startup.
+
+Frame jitter of a paced ShowImage loop with and without the display
+placement, optionally with busy processes competing for the CPUs:
+
+    sudo python3 cpusched.py --jitter --load 4
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+SCHED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scheduling.json')
+POLICIES = {
+    'other': os.SCHED_OTHER,
+    'fifo': os.SCHED_FIFO,
+    'rr': os.SCHED_RR,
+}
+_POLICY_NAMES = {value: name for name, value in POLICIES.items()}
+
+
+class Placement:
+    """
+    Cores and scheduling policy for one role.
+
+    Args:
+        cpus (list): CPU numbers to run on, None = leave as is
+        policy (str): 'other', 'fifo' or 'rr'
+        priority (int): Real-time priority (fifo/rr), 1-99
+        nice (int): Nice value for 'other', None = leave as is
+    """
+
+    def __init__(self, cpus=None, policy='other', priority=0, nice=None):
+        if policy not in POLICIES:
+            raise ValueError('scheduling policy must be one of %s' % ', '.join(POLICIES))
+        self.cpus = None if cpus is None else sorted(set(cpus))
+        self.policy = policy
+        self.priority = priority if policy != 'other' else 0
+        self.nice = nice
+
+    @classmethod
+    def from_config(cls, entry):
+        return cls(entry.get('cpus'), entry.get('policy', 'other'), entry.get('priority', 0), entry.get('nice'))
+
+    def apply(self, tid=0):
+        """
+        Place a thread (0 = the calling one). Failures (missing CPUs, no
+        permission for real-time) are logged and leave that part unchanged.
+
+        Returns:
+            dict: The thread's scheduling afterwards, see current()
+        """
+        if self.cpus is not None:
+            cpus = set(self.cpus) & _online_cpus()
+            if cpus:
+                os.sched_setaffinity(tid, cpus)
+            else:
+                logging.warning('sched: none of cpus %s available, affinity unchanged', self.cpus)
+        try:
+            os.sched_setscheduler(tid, POLICIES[self.policy], os.sched_param(self.priority))
+        except (PermissionError, OSError) as e:
+            logging.warning('sched: cannot use SCHED_%s priority %d (%s)', self.policy.upper(), self.priority, e)
+        if self.policy == 'other' and self.nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+            except (PermissionError, OSError) as e:
+                logging.warning('sched: cannot set nice %d (%s)', self.nice, e)
+        return current(tid)
+
+
+def _online_cpus():
+    try:
+        with open('/sys/devices/system/cpu/online') as f:
+            cpus = set()
+            for part in f.read().strip().split(','):
+                first, _, last = part.partition('-')
+                cpus.update(range(int(first), int(last or first) + 1))
+            return cpus
+    except (OSError, ValueError):
+        return set(range(os.cpu_count() or 1))
+
+
+def current(tid=0):
+    """Affinity and policy of a thread (0 = the calling one)."""
+    policy = os.sched_getscheduler(tid)
+    return {
+        'cpus': sorted(os.sched_getaffinity(tid)),
+        'policy': _POLICY_NAMES.get(policy, str(policy)),
+        'priority': os.sched_getparam(tid).sched_priority,
+        'nice': os.getpriority(os.PRIO_PROCESS, tid),
+    }
+
+
+def describe(sched):
+    text = 'cpus %s SCHED_%s' % (','.join(map(str, sched['cpus'])), sched['policy'].upper())
+    if sched['policy'] == 'other':
+        return text + ' nice %d' % sched['nice']
+    return text + ' priority %d' % sched['priority']
+
+
+def load(path=SCHED_FILE):
+    """role -> Placement from scheduling.json; no file = no placements."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {role: Placement.from_config(entry) for role, entry in json.load(f).items()}
+
+
+def setup(role, path=SCHED_FILE):
+    """Apply the role's placement to the calling thread and log the result."""
+    placement = load(path).get(role)
+    if placement is not None:
+        placement.apply()
+    sched = current()
+    logging.info('sched: %s (%s) on %s', role, threading.current_thread().name, describe(sched))
+    return sched
+
+
+def _frame_loop(seconds, fps):
+    """Lateness in seconds of each frame of a paced ShowImage loop on the mock backend."""
+    import numpy as np
+    from PIL import Image
+    from lib import LCD_2inch, hwbackend
+    disp = LCD_2inch.LCD_2inch(spi=(0, 0), backend=hwbackend.MockBackend(), backlight='gpio')
+    disp.Init()
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=np.uint8))
+    period = 1.0 / fps
+    late = []
+    due = time.monotonic() + period
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        time.sleep(max(0.0, due - time.monotonic()))
+        late.append(time.monotonic() - due)
+        disp.ShowImage(image)
+        due += period
+    return late
+
+
+def _busy(stop):
+    while not stop.is_set():
+        sum(range(10000))
+
+
+def jitter(placement, seconds=10.0, fps=20.0, load=0):
+    """
+    Frame lateness statistics (ms) with default scheduling and with placement.
+
+    Args:
+        load (int): Busy processes competing for the CPUs during both runs
+    """
+    import multiprocessing
+    stop = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=_busy, args=(stop,), daemon=True) for _ in range(load)]
+    for worker in workers:
+        worker.start()
+    before = current()
+    try:
+        results = {'default': _frame_loop(seconds, fps)}
+        placement.apply()
+        results['placed'] = _frame_loop(seconds, fps)
+    finally:
+        os.sched_setaffinity(0, before['cpus'])
+        try:
+            os.sched_setscheduler(0, POLICIES.get(before['policy'], os.SCHED_OTHER), os.sched_param(before['priority']))
+        except OSError:
+            pass
+        stop.set()
+        for worker in workers:
+            worker.join()
+    report = {}
+    for name, late in results.items():
+        late = sorted(late)
+        report[name] = {
+            'frames': len(late),
+            'p50': late[len(late) // 2] * 1000,
+            'p99': late[min(len(late) - 1, int(len(late) * 0.99))] * 1000,
+            'max': late[-1] * 1000,
+        }
+    return report
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Show or measure the CPU placements in scheduling.json')
+    parser.add_argument('--config', default=SCHED_FILE, help='placement file')
+    parser.add_argument('--jitter', action='store_true', help='measure frame lateness with and without the placement')
+    parser.add_argument('--role', default='display', help='placement to measure')
+    parser.add_argument('--seconds', type=float, default=10.0, help='length of each run')
+    parser.add_argument('--fps', type=float, default=20.0, help='paced frame rate')
+    parser.add_argument('--load', type=int, default=0, help='busy processes competing for the CPUs')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    placements = load(args.config)
+    if not args.jitter:
+        for role, p in sorted(placements.items()):
+            print('%-12s cpus %-10s %s%s' % (role, 'any' if p.cpus is None else ','.join(map(str, p.cpus)),
+                                             p.policy, ' priority %d' % p.priority if p.priority else ''))
+        print('this process: %s, online cpus %s' % (describe(current()), sorted(_online_cpus())))
+        return 0
+    report = jitter(placements.get(args.role, Placement()), args.seconds, args.fps, args.load)
+    print('%-8s %7s %9s %9s %9s' % ('run', 'frames', 'p50 ms', 'p99 ms', 'max ms'))
+    for name, r in report.items():
+        print('%-8s %7d %9.2f %9.2f %9.2f' % (name, r['frames'], r['p50'], r['p99'], r['max']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
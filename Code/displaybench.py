@@ -0,0 +1,329 @@
+"""
+displaybench.py - Benchmark every LCD driver in lib/ against the mock SPI bus
+
+For each driver the benchmark runs Init(), a series of ShowImage() calls
+with a random image of the panel's size (and of the rotated size where the
+driver supports it) and clear(), all on lib/hwbackend.MockBackend. It
+reports per driver:
+
+    init    host CPU time, delays, bus time, SPI transfers and bytes
+    show    per frame: RGB565 conversion time, host time spent in SPI
+            writes, bus time at the SPI clock, bytes, transfers (one
+            ioctl each), GPIO writes, and the FPS the panel would reach
+    clear   host CPU time, bus time, transfers and bytes
+    regions partial updates: one SetWindows + write per 16x16 tile over the
+            whole panel, the DC-toggle-heavy case
+
+GPIO writes are free on the mock. --toggle-bench measures the real cost of
+one GPIO.output() with a hardware backend (pi = RPi.GPIO, gpiod =
+libgpiod) on the Pi; that cost, or one given with --gpio-cost, is added as
+gpio_s = gpio_writes x cost to every section and to the FPS estimate.
+
+Timings are medians over --frames runs. The results are written as JSON;
+with --baseline the run is compared to an earlier result and every metric
+that got worse is reported (timings beyond --tolerance and --min-delta,
+counts and bus time on any increase), with exit status 1.
+
+--warm-check constructs every driver on the libgpiod backend (over
+hwbackend.FakeGpiod) with RST high, as main.py's warm restart does, and
+fails if RST is driven low before Init() (the panel would be held in
+reset and go blank).
+
+Usage:
+    python3 displaybench.py --output bench.json
+    python3 displaybench.py --baseline bench.json --tolerance 0.2
+    python3 displaybench.py --drivers LCD_2inch LCD_1inch28 --frames 50
+    python3 displaybench.py --toggle-bench pi gpiod --drivers LCD_2inch   # on the Pi
+    python3 displaybench.py --warm-check
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+import statistics
+
+import numpy as np
+from PIL import Image
+
+from lib import hwbackend
+
+DRIVERS = ('LCD_0inch96', 'LCD_1inch14', 'LCD_1inch28', 'LCD_1inch3', 'LCD_1inch47',
+           'LCD_1inch54', 'LCD_1inch8', 'LCD_2inch', 'LCD_2inch4')
+
+# Metrics that only depend on the code path, not on the host: any increase is a regression
+EXACT = ('bytes', 'transfers', 'gpio_writes', 'bus_s', 'delay_s')
+# Reported but not compared
+DERIVED = ('fps', 'gpio_s')
+TILE = 16
+
+
+def open_driver(name, spi_freq):
+    """Driver instance on a fresh MockBackend."""
+    module = importlib.import_module('lib.' + name)
+    backend = hwbackend.MockBackend()
+    disp = getattr(module, name)(spi=(0, 0), spi_freq=spi_freq, backend=backend)
+    # Time spent in SPI writes on the host (list slicing, the ioctl stand-in)
+    write = disp.spi_writebyte
+    disp.spi_time = 0.0
+
+    def timed_write(data):
+        t0 = time.perf_counter()
+        write(data)
+        disp.spi_time += time.perf_counter() - t0
+    disp.spi_writebyte = timed_write
+    return disp, backend
+
+
+def measure(disp, backend, call):
+    """Run call() once; host time split into conversion and SPI writes, plus mock counters."""
+    backend.reset_stats()
+    disp.spi_time = 0.0
+    t0 = time.perf_counter()
+    call()
+    host = time.perf_counter() - t0
+    return {
+        'host_s': host,
+        'convert_s': host - disp.spi_time,
+        'write_s': disp.spi_time,
+        'bus_s': backend.spi_time,
+        'delay_s': backend.sleep_time,
+        'bytes': backend.spi_bytes,
+        'transfers': backend.spi_transfers,
+        'gpio_writes': backend.gpio_writes,
+    }
+
+
+def draw_regions(disp, tile=TILE):
+    """Partial updates: one small window per tile, as a dirty-rectangle renderer sends them."""
+    data = [0x55] * (tile * tile * 2)
+    for y in range(0, disp.height, tile):
+        for x in range(0, disp.width, tile):
+            disp.SetWindows(x, y, x + tile, y + tile)
+            disp.digital_write(disp.DC_PIN, disp.GPIO.HIGH)
+            disp.spi_writebyte(data)
+
+
+def toggle_cost(name, pin=25, count=20000):
+    """Seconds per GPIO.output() on a hardware backend, and per two-line bulk change."""
+    gpio = hwbackend.open_backend(name).GPIO
+    gpio.setmode(gpio.BCM)
+    gpio.setup(pin, gpio.OUT)
+    t0 = time.perf_counter()
+    for i in range(count):
+        gpio.output(pin, i & 1)
+    single = (time.perf_counter() - t0) / count
+    other = 27 if pin != 27 else 24
+    gpio.setup(other, gpio.OUT)
+    t0 = time.perf_counter()
+    for i in range(count):
+        gpio.output([pin, other], [i & 1, 1])
+    bulk = (time.perf_counter() - t0) / count
+    gpio.cleanup()
+    return single, bulk
+
+
+def warm_check(names, rst=27):
+    """Drivers that drive RST low in their constructor or module_init() on the gpiod backend."""
+    failed = []
+    for name in names:
+        module = importlib.import_module('lib.' + name)
+        backend = hwbackend.FakeGpiodBackend(levels={rst: 1})
+        disp = getattr(module, name)(spi=(0, 0), rst=rst, backend=backend)
+        disp.module_init()
+        if ('set', rst, 0) in backend.gpiod.log or backend.gpiod.levels.get(rst) != 1:
+            failed.append(name)
+    return failed
+
+
+def add_gpio_cost(results, cost):
+    """Project GPIO time from the write counts and fold it into the FPS estimate."""
+    results['meta']['gpio_cost'] = cost
+    for r in results['drivers'].values():
+        for section in r.values():
+            if isinstance(section, dict) and 'gpio_writes' in section:
+                section['gpio_s'] = section['gpio_writes'] * cost
+                if 'fps' in section:
+                    section['fps'] = 1.0 / (section['host_s'] + section['bus_s'] + section['gpio_s'])
+
+
+def median(runs):
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def bench_driver(name, frames=20, spi_freq=40000000, seed=0):
+    disp, backend = open_driver(name, spi_freq)
+    result = {'width': disp.width, 'height': disp.height, 'spi_hz': backend.bus_hz(spi_freq)}
+    init = measure(disp, backend, disp.Init)
+    del init['convert_s']
+    result['init'] = init
+    rng = np.random.default_rng(seed)
+    sizes = [('show', (disp.width, disp.height))]
+    if disp.width != disp.height:
+        sizes.append(('show_rotated', (disp.height, disp.width)))
+    for key, size in sizes:
+        image = Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+        try:
+            runs = [measure(disp, backend, lambda: disp.ShowImage(image)) for _ in range(frames)]
+        except (ValueError, AttributeError, TypeError, IndexError) as error:
+            result[key] = {'error': '%s: %s' % (type(error).__name__, error)}
+            continue
+        show = median(runs)
+        del show['delay_s']
+        show['fps'] = 1.0 / (show['host_s'] + show['bus_s'])
+        result[key] = show
+    try:
+        clear = median([measure(disp, backend, disp.clear) for _ in range(max(1, frames // 4))])
+        del clear['delay_s']
+        result['clear'] = clear
+    except (ValueError, AttributeError, TypeError, IndexError) as error:
+        result['clear'] = {'error': '%s: %s' % (type(error).__name__, error)}
+    regions = median([measure(disp, backend, lambda: draw_regions(disp)) for _ in range(max(1, frames // 4))])
+    del regions['delay_s']
+    result['regions'] = regions
+    return result
+
+
+def run(drivers=DRIVERS, frames=20, spi_freq=40000000):
+    results = {}
+    for name in drivers:
+        try:
+            results[name] = bench_driver(name, frames, spi_freq)
+        except Exception as error:
+            results[name] = {'error': '%s: %s' % (type(error).__name__, error)}
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'frames': frames,
+            'spi_freq': spi_freq,
+        },
+        'drivers': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2, min_delta=1e-4):
+    """List (driver, section, metric, baseline, current) for every metric that got worse."""
+    regressions = []
+    for name, result in current['drivers'].items():
+        old = baseline.get('drivers', {}).get(name)
+        if old is None:
+            continue
+        for section, metrics in result.items():
+            if not isinstance(metrics, dict):
+                continue
+            before = old.get(section)
+            if not isinstance(before, dict):
+                continue
+            if 'error' in metrics and 'error' not in before:
+                regressions.append((name, section, 'error', None, metrics['error']))
+                continue
+            for metric, value in metrics.items():
+                if metric in DERIVED or metric == 'error' or metric not in before:
+                    continue
+                limit = before[metric] * (1 + (1e-9 if metric in EXACT else tolerance))
+                # Timing differences below min_delta seconds are scheduler noise
+                if value > limit and (metric in EXACT or value - before[metric] > min_delta):
+                    regressions.append((name, section, metric, before[metric], value))
+    return regressions
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%.3g' % value
+    return str(value)
+
+
+def print_table(results):
+    print('%-12s %9s %7s %9s %9s %9s %8s %6s %7s %9s %9s' % (
+        'driver', 'init ms', 'init xf', 'conv ms', 'write ms', 'bus ms', 'bytes', 'xfers', 'fps', 'clear ms', 'clr bus'))
+    for name, r in results['drivers'].items():
+        if 'error' in r:
+            print('%-12s %s' % (name, r['error']))
+            continue
+        show = r.get('show', {})
+        if 'error' in show:
+            show = r.get('show_rotated', show)
+        clear = r.get('clear', {})
+        if 'error' in show:
+            print('%-12s %9.2f %7d  ShowImage: %s' % (name, r['init']['host_s'] * 1e3,
+                                                   r['init']['transfers'], show['error']))
+            continue
+        print('%-12s %9.2f %7d %9.2f %9.2f %9.2f %8d %6d %7.1f %9s %9s' % (
+            name, r['init']['host_s'] * 1e3, r['init']['transfers'], show['convert_s'] * 1e3, show['write_s'] * 1e3,
+            show['bus_s'] * 1e3, show['bytes'], show['transfers'], show['fps'],
+            _format(clear['host_s'] * 1e3) if 'host_s' in clear else '-',
+            _format(clear['bus_s'] * 1e3) if 'bus_s' in clear else '-'))
+    print()
+    print('%-12s %9s %9s %9s %9s' % ('regions', 'host ms', 'bus ms', 'gpio', 'gpio ms'))
+    for name, r in results['drivers'].items():
+        regions = r.get('regions')
+        init = r.get('init')
+        if regions is None:
+            continue
+        print('%-12s %9.2f %9.2f %9d %9s   (init: %d writes, %s ms)' % (
+            name, regions['host_s'] * 1e3, regions['bus_s'] * 1e3, regions['gpio_writes'],
+            _format(regions['gpio_s'] * 1e3) if 'gpio_s' in regions else '-',
+            init['gpio_writes'], _format(init['gpio_s'] * 1e3) if 'gpio_s' in init else '-'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the lib/ LCD drivers on a mock SPI bus')
+    parser.add_argument('--drivers', nargs='+', default=list(DRIVERS), help='driver modules to run')
+    parser.add_argument('--frames', type=int, default=20, help='ShowImage runs per driver (default 20)')
+    parser.add_argument('--spi-freq', type=int, default=40000000, help='requested SPI clock in Hz')
+    parser.add_argument('--toggle-bench', nargs='+', metavar='BACKEND', choices=('pi', 'gpiod'),
+                        help='measure GPIO.output() cost with these hardware backends (on the Pi)')
+    parser.add_argument('--gpio-cost', type=float, help='cost of one GPIO write in us, added to the results')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this earlier JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown of timings (default 0.2)')
+    parser.add_argument('--min-delta', type=float, default=0.1,
+                        help='ignore timing differences below this many ms (default 0.1)')
+    parser.add_argument('--warm-check', action='store_true',
+                        help='check that the drivers keep RST high on the gpiod backend, then exit')
+    args = parser.parse_args(argv)
+
+    if args.warm_check:
+        failed = warm_check(args.drivers)
+        for name in failed:
+            print('FAIL %s: RST driven low without Init()' % name)
+        if failed:
+            return 1
+        print('RST stays high on the gpiod backend for %d drivers' % len(args.drivers))
+        return 0
+    results = run(args.drivers, args.frames, args.spi_freq)
+    cost = None if args.gpio_cost is None else args.gpio_cost / 1e6
+    for name in args.toggle_bench or ():
+        try:
+            single, bulk = toggle_cost(name)
+        except (ImportError, OSError, RuntimeError) as error:
+            parser.error('%s backend unavailable: %s' % (name, error))
+        print('%-5s GPIO.output: %.2f us per toggle, %.2f us per 2-line bulk change' % (name, single * 1e6, bulk * 1e6))
+        results['meta']['toggle_%s' % name] = {'single': single, 'bulk': bulk}
+        cost = single
+    if cost is not None:
+        add_gpio_cost(results, cost)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta / 1e3)
+        for name, section, metric, before, after in regressions:
+            print('REGRESSION %s %s.%s: %s -> %s' % (name, section, metric, _format(before), _format(after)))
+        if regressions:
+            return 1
+        print('No regressions against %s' % args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
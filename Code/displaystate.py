@@ -0,0 +1,117 @@
+"""
+displaystate.py - Display state kept across main.py restarts
+
+main.py used to reset and re-initialize the panel and start the happy
+animation from frame 0 on every start, so a restart (crash, update,
+systemctl restart) blanked the screen and lost the current emotion. The
+state file records the emotion, the frame index and whether the panel
+has been initialized. It is written on every emotion change and every
+few frames, to /run (tmpfs, no SD card wear) when writable.
+
+The panel keeps its configuration as long as it stays powered, that is
+for the rest of the boot. The state therefore carries the kernel boot
+id: after a reboot or power cut the panel counts as unconfigured again
+and gets the full reset and Init sequence.
+
+Usage:
+    state = DisplayState.load()
+    if state.warm():
+        disp.module_init()                  # panel still set up, no reset
+    state.save(emotion='thirs', frame=0)
+"""
+
+import os
+import json
+import logging
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIRS = ('/run/fyto', os.path.join(CODE_DIR, 'cache'))
+STATE_NAME = 'display-state.json'
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+
+def boot_id():
+    """Kernel boot id, changes on every boot; None where unavailable."""
+    try:
+        with open(BOOT_ID_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def state_path():
+    """First writable directory of STATE_DIRS, joined with the state file name."""
+    for directory in STATE_DIRS:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            continue
+        if os.access(directory, os.W_OK):
+            return os.path.join(directory, STATE_NAME)
+    return os.path.join(STATE_DIRS[-1], STATE_NAME)
+
+
+class DisplayState:
+    """
+    Emotion, frame index and panel initialization, saved atomically.
+
+    Args:
+        path (str): State file; default from state_path()
+    """
+
+    def __init__(self, path=None):
+        self.path = path or state_path()
+        self.emotion = None
+        self.frame = 0
+        self.initialized = False
+        self.boot_id = None
+        self._written = None
+
+    @classmethod
+    def load(cls, path=None):
+        """State from the file; a missing or damaged file gives a cold state."""
+        state = cls(path)
+        try:
+            with open(state.path) as f:
+                data = json.load(f)
+            state.emotion = data.get('emotion')
+            state.frame = int(data.get('frame') or 0)
+            state.initialized = bool(data.get('initialized'))
+            state.boot_id = data.get('boot_id')
+            state._written = data
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.warning('display state %s ignored (%s)', state.path, e)
+        return state
+
+    def warm(self):
+        """True if the panel was initialized during this boot and needs no reset."""
+        return self.initialized and self.boot_id is not None and self.boot_id == boot_id()
+
+    def save(self, emotion=None, frame=None, initialized=None):
+        """Update the given fields and write the file (write + rename) if anything changed."""
+        if emotion is not None:
+            self.emotion = emotion
+        if frame is not None:
+            self.frame = frame
+        if initialized is not None:
+            self.initialized = initialized
+        self.boot_id = boot_id()
+        data = {
+            'emotion': self.emotion,
+            'frame': self.frame,
+            'initialized': self.initialized,
+            'boot_id': self.boot_id,
+        }
+        if data == self._written:
+            # Nothing new; the fallback in Code/cache is on the SD card
+            return
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+            self._written = data
+        except OSError as e:
+            logging.warning('display state not saved (%s)', e)
@@ -0,0 +1,339 @@
+"""
+framecache.py - Precompiled emotion frames, recompiled when the assets change
+
+Playing a frame used to mean decoding its PNG, rotating it and converting
+it to RGB565 on every pass of every loop. The cache keeps each frame as
+the exact bytes the driver sends (LCD_2inch.ImageBuffer), so playback only
+reads a file and writes it to the bus.
+
+Cache files live in cache/frames/<emotion>/<sha1 of the PNG>.raw. A frame
+is only re-encoded when its PNG content changes; renaming frames or
+reverting an edit reuses the existing files. A changed encoding (another
+driver or rotation) empties the cache.
+
+The Reloader watches emotion/ with inotify (polling where inotify is not
+available). A changed folder is recompiled in the background, and the new
+animation (frames plus manifest.json) goes to the Player. The Player swaps
+it in at the next loop boundary, so playback never stops and a loop never
+mixes old and new frames. Files made unused by an edit stay until the next
+start.
+
+Usage:
+    cache = FrameCache('emotion', 'cache/frames', encode, encoding='LCD_2inch-rot180')
+    reloader = Reloader(cache, player)
+    reloader.start()
+    data = player.manifest('happy').buffer(12)     # None until compiled
+"""
+
+import io
+import os
+import sys
+import time
+import errno
+import shutil
+import select
+import struct
+import hashlib
+import logging
+import threading
+
+from animation import Manifest, EMOTION_DIR, MANIFEST_NAME
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'frames')
+ENCODING_NAME = 'encoding'
+# What main.py shows: LCD_2inch landscape RGB565 of the frame rotated by 180 degrees
+ENCODING = 'LCD_2inch-rgb565-landscape-rot180'
+
+
+class CompiledAnimation(Manifest):
+    """A Manifest whose frames are cache files of encoded panel bytes."""
+
+    def __init__(self, manifest, files):
+        self.frames = manifest.frames
+        self.segments = manifest.segments
+        self.holds = manifest.holds
+        self.files = files
+
+    def buffer(self, frame):
+        try:
+            with open(self.files[frame], 'rb') as f:
+                return f.read()
+        except (KeyError, OSError):
+            return None
+
+
+class FrameCache:
+    """
+    Content-addressed store of encoded frames.
+
+    Args:
+        emotion_dir (str): Folder holding one sub-folder per emotion
+        cache_dir (str): Where the encoded frames go
+        encode (callable): PIL RGB image -> bytes sent to the panel
+        encoding (str): Name of encode's output format; a change empties the cache
+    """
+
+    def __init__(self, emotion_dir=EMOTION_DIR, cache_dir=CACHE_DIR, encode=None, encoding='raw'):
+        self.emotion_dir = emotion_dir
+        self.cache_dir = cache_dir
+        self.encode = encode
+        self.encoding = encoding
+        self.encoded = 0
+        self.reused = 0
+        # PNG path -> (mtime_ns, size, sha1), so unchanged files are not even re-hashed
+        self._hashes = {}
+        self._check_encoding()
+
+    def _check_encoding(self):
+        path = os.path.join(self.cache_dir, ENCODING_NAME)
+        try:
+            with open(path) as f:
+                if f.read().strip() == self.encoding:
+                    return
+        except OSError:
+            pass
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(self.encoding + '\n')
+
+    def folders(self):
+        return sorted(name for name in os.listdir(self.emotion_dir)
+                      if os.path.isdir(os.path.join(self.emotion_dir, name)))
+
+    def _hash(self, path):
+        st = os.stat(path)
+        known = self._hashes.get(path)
+        if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+            return known[2], None
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        self._hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest, data
+
+    def compile(self, folder, prune=False):
+        """
+        Encode the frames of one emotion that are not cached yet.
+
+        Args:
+            prune (bool): Delete cache files no frame uses any more (only
+                safe while no animation of this folder is playing from the cache)
+
+        Returns:
+            CompiledAnimation
+        """
+        from PIL import Image
+        source = os.path.join(self.emotion_dir, folder)
+        target = os.path.join(self.cache_dir, folder)
+        os.makedirs(target, exist_ok=True)
+        manifest = Manifest.from_folder(source)
+        files = {}
+        for n in range(manifest.frames):
+            png = os.path.join(source, 'frame%d.png' % n)
+            digest, data = self._hash(png)
+            raw = os.path.join(target, digest + '.raw')
+            if os.path.exists(raw):
+                self.reused += 1
+            else:
+                if data is None:
+                    with open(png, 'rb') as f:
+                        data = f.read()
+                with Image.open(io.BytesIO(data)) as image:
+                    encoded = self.encode(image.convert('RGB'))
+                tmp = raw + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(encoded)
+                os.replace(tmp, raw)
+                self.encoded += 1
+            files[n] = raw
+        if prune:
+            used = set(os.path.basename(path) for path in files.values())
+            for name in os.listdir(target):
+                if name not in used:
+                    os.remove(os.path.join(target, name))
+        return CompiledAnimation(manifest, files)
+
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """Minimal inotify binding over ctypes; raises OSError where unsupported."""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify not available')
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = {}
+
+    def watch(self, path, mask):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch %s failed' % path)
+        self.paths[wd] = path
+        return wd
+
+    def read(self, timeout):
+        """(watched path, mask, name) events within timeout seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b'\0').decode('utf-8', 'replace')
+            events.append((self.paths.get(wd), mask, name))
+            pos += _EVENT.size + length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Reloader:
+    """
+    Compile every emotion once, then recompile the ones whose files change.
+
+    Args:
+        cache (FrameCache): Where frames are compiled
+        player (animation.Player): Gets each new animation via replace()
+        quiet (float): Seconds without further changes before a folder is recompiled
+        poll (float): Scan interval when inotify is not available
+    """
+
+    FOLDER_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    ROOT_EVENTS = IN_CREATE | IN_MOVED_TO
+
+    def __init__(self, cache, player, quiet=0.5, poll=2.0):
+        self.cache = cache
+        self.player = player
+        self.quiet = quiet
+        self.poll = poll
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, setup=None):
+        """Run in a daemon thread; setup() is called first inside it (e.g. CPU placement)."""
+        def run():
+            if setup is not None:
+                setup()
+            self.run()
+        self._thread = threading.Thread(target=run, name='framecache', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _compile(self, folder, prune=False):
+        t0 = time.monotonic()
+        encoded = self.cache.encoded
+        try:
+            animation = self.cache.compile(folder, prune)
+        except (OSError, ValueError) as e:
+            # Half-written file or broken manifest: keep playing the old animation
+            logging.warning('framecache: %s not compiled (%s)', folder, e)
+            return False
+        self.player.replace(folder, animation)
+        logging.info('framecache: %s compiled, %d of %d frames encoded in %.2f s', folder,
+                     self.cache.encoded - encoded, animation.frames, time.monotonic() - t0)
+        return True
+
+    def run(self):
+        # Watch first, so edits made during the first compilation are not missed
+        root = self.cache.emotion_dir
+        try:
+            inotify = Inotify()
+            inotify.watch(root, self.ROOT_EVENTS)
+            for folder in self.cache.folders():
+                inotify.watch(os.path.join(root, folder), self.FOLDER_EVENTS)
+        except OSError as e:
+            logging.info('framecache: inotify unavailable (%s), polling every %g s', e, self.poll)
+            inotify = None
+        for folder in self.cache.folders():
+            if self._stop.is_set():
+                return
+            self._compile(folder, prune=True)
+        if inotify is None:
+            self._watch_poll()
+        else:
+            self._watch_inotify(inotify)
+
+    def _watch_inotify(self, inotify):
+        root = self.cache.emotion_dir
+        try:
+            dirty = {}
+            while not self._stop.is_set():
+                for path, mask, name in inotify.read(self.quiet if dirty else 1.0):
+                    if path == root:
+                        if mask & IN_ISDIR:
+                            inotify.watch(os.path.join(root, name), self.FOLDER_EVENTS)
+                            dirty[name] = time.monotonic()
+                    elif path is not None and (name.endswith('.png') or name == MANIFEST_NAME):
+                        dirty[os.path.basename(path)] = time.monotonic()
+                self._flush(dirty)
+        finally:
+            inotify.close()
+
+    def _watch_poll(self):
+        def scan():
+            state = {}
+            for folder in self.cache.folders():
+                path = os.path.join(self.cache.emotion_dir, folder)
+                state[folder] = sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                                       for entry in os.scandir(path) if entry.is_file())
+            return state
+        last = scan()
+        dirty = {}
+        while not self._stop.wait(self.quiet if dirty else self.poll):
+            state = scan()
+            for folder, files in state.items():
+                if last.get(folder) != files:
+                    dirty[folder] = time.monotonic()
+            last = state
+            self._flush(dirty)
+
+    def _flush(self, dirty):
+        # Recompile folders that have been quiet for a while (editors write in steps)
+        now = time.monotonic()
+        for folder in [f for f, t in dirty.items() if now - t >= self.quiet]:
+            del dirty[folder]
+            if os.path.isdir(os.path.join(self.cache.emotion_dir, folder)) and self._compile(folder):
+                self.reloads += 1
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile the emotion frames into the panel byte cache')
+    parser.add_argument('emotions', nargs='*', help='folders to compile (default: all)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    from lib import LCD_2inch, hwbackend
+    disp = LCD_2inch.LCD_2inch(backend=hwbackend.MockBackend(), backlight='gpio')
+    cache = FrameCache(encode=lambda image: disp.ImageBuffer(image.rotate(180)), encoding=ENCODING)
+    t0 = time.monotonic()
+    for folder in args.emotions or cache.folders():
+        animation = cache.compile(folder, prune=True)
+        print('%s: %d frames' % (folder, animation.frames))
+    print('%d encoded, %d reused in %.1f s' % (cache.encoded, cache.reused, time.monotonic() - t0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+framerate.py - Playback frame rate and backlight by emotion and ambient light
+
+main.py used to push frames as fast as the CPU and SPI bus allowed, for
+every emotion and at any time of day. The policy here gives each emotion
+its own frame rate and scales it down, together with the backlight duty,
+as the room gets darker; below the darkest level the display shows a
+single static frame. The light level (LDR %) reaches main.py as a
+"L042%" message from sensors.py, see thresholds.light_message().
+
+framerate.json:
+
+    "fps": {"happy": 20, "sleepy": 8},      # per emotion folder, else default_fps
+    "light": [                              # checked darkest first
+        {"below": 3, "scale": 0, "backlight": 5},    # scale 0: static frame
+        {"below": 15, "scale": 0.5, "backlight": 35}
+    ],
+    "hysteresis": 2                         # % above a level before leaving it
+
+Brighter than every level (or before the first light report) the emotion
+plays at its full rate with the backlight at 100 %.
+
+Savings over a simulated day (simads.DailyLight) against full-speed
+playback:
+
+    python3 framerate.py --day
+    python3 framerate.py --day --frame-cpu 45    # CPU ms per frame measured on the Pi
+"""
+
+import os
+import sys
+import json
+
+FRAMERATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'framerate.json')
+
+
+class FrameRatePolicy:
+    """
+    Frame rate and backlight for an emotion at a light level.
+
+    Args:
+        fps (dict): emotion folder -> frames per second
+        default_fps (float): Rate of emotions not in fps
+        light (list): Levels {"below": %, "scale": factor, "backlight": %}
+        hysteresis (float): Light % above a level's bound needed to leave it
+    """
+
+    def __init__(self, fps=None, default_fps=15.0, light=(), hysteresis=2.0):
+        self.fps_by_emotion = dict(fps or {})
+        self.default_fps = default_fps
+        self.levels = sorted((dict(level) for level in light), key=lambda level: level['below'])
+        self.hysteresis = hysteresis
+        self.index = len(self.levels)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('fps'), config.get('default_fps', 15.0),
+                   config.get('light', ()), config.get('hysteresis', 2.0))
+
+    @classmethod
+    def from_file(cls, path=FRAMERATE_FILE):
+        with open(path) as f:
+            return cls.from_config(json.load(f))
+
+    def update(self, light):
+        """Fold in a light reading (% or None); returns the level index (len(levels) = bright)."""
+        if light is None:
+            self.index = len(self.levels)
+            return self.index
+        index = len(self.levels)
+        for i, level in enumerate(self.levels):
+            if light < level['below']:
+                index = i
+                break
+        # Getting darker takes effect at once, getting brighter only past the hysteresis band
+        if index < self.index or (index > self.index and
+                                  light >= self.levels[self.index]['below'] + self.hysteresis):
+            self.index = index
+        return self.index
+
+    def level(self):
+        if self.index < len(self.levels):
+            return self.levels[self.index]
+        return {'scale': 1.0, 'backlight': 100}
+
+    def fps(self, emotion):
+        """Frames per second for an emotion folder at the current light level; 0 = static."""
+        return self.fps_by_emotion.get(emotion, self.default_fps) * self.level().get('scale', 1.0)
+
+    def backlight(self):
+        """Backlight duty in % at the current light level."""
+        return self.level().get('backlight', 100)
+
+    def static(self):
+        return self.level().get('scale', 1.0) <= 0
+
+
+def frame_cost(speed=90000000):
+    """
+    (CPU seconds, SPI bus seconds, SPI bytes) for one frame of main.py's
+    pipeline: PNG decode, rotate and ShowImage on the mock backend.
+    """
+    import time
+    from PIL import Image
+    from lib import LCD_2inch, hwbackend
+    backend = hwbackend.MockBackend()
+    disp = LCD_2inch.LCD_2inch(spi=(0, 0), spi_freq=speed, backend=backend, backlight='gpio')
+    disp.Init()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emotion', 'happy', 'frame%d.png')
+    cpu = []
+    for i in range(10):
+        backend.reset_stats()
+        t0 = time.process_time()
+        disp.ShowImage(Image.open(path % i).rotate(180))
+        cpu.append(time.process_time() - t0)
+    cpu.sort()
+    return cpu[len(cpu) // 2], backend.spi_time, backend.spi_bytes
+
+
+def day_report(policy, cpu, bus, nbytes, emotion='happy', dark_emotion='sleepy', sleepy_below=20,
+               step=60, start=None):
+    """
+    Frames, CPU and SPI over 24 simulated hours, with the policy and at full speed.
+
+    The emotion is dark_emotion below sleepy_below % light (the light rule in
+    rules.json) and emotion otherwise. Full speed is one frame per cpu + bus
+    seconds.
+    """
+    import time
+    from simads import DailyLight
+    from thresholds import convert, DEFAULT_CALIBRATION, ads_bit_Voltage
+    light_volts = DailyLight()
+    start = start if start is not None else time.mktime(time.strptime('2024-06-01', '%Y-%m-%d'))
+    full_fps = 1.0 / (cpu + bus)
+    frames = 0.0
+    static = 0
+    for t in range(0, 86400, step):
+        raw = int(light_volts(start + t) / ads_bit_Voltage)
+        light = max(0, min(100, convert(raw, 0, 0, DEFAULT_CALIBRATION)[0]))
+        policy.update(light)
+        if policy.static():
+            static += step
+            continue
+        fps = min(full_fps, policy.fps(dark_emotion if light < sleepy_below else emotion))
+        frames += fps * step
+    full = full_fps * 86400
+    return {
+        'full_fps': full_fps,
+        'frames': (full, frames),
+        'cpu_s': (full * cpu, frames * cpu),
+        'spi_mb': (full * nbytes / 1e6, frames * nbytes / 1e6),
+        'bus_s': (full * bus, frames * bus),
+        'static_h': static / 3600.0,
+    }
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Frame rate policy and its day/night savings')
+    parser.add_argument('--config', default=FRAMERATE_FILE, help='policy file')
+    parser.add_argument('--day', action='store_true', help='simulate 24 h of daylight and report savings')
+    parser.add_argument('--frame-cpu', type=float, help='CPU ms per frame (default: measured here)')
+    parser.add_argument('--emotion', default='happy', help='emotion folder shown in daylight')
+    args = parser.parse_args(argv)
+    policy = FrameRatePolicy.from_file(args.config)
+    if not args.day:
+        for level in policy.levels + [None]:
+            policy.index = policy.levels.index(level) if level else len(policy.levels)
+            name = 'light < %g%%' % level['below'] if level else 'bright'
+            rates = ', '.join('%s %g' % (e, policy.fps(e)) for e in sorted(policy.fps_by_emotion))
+            print('%-14s backlight %3g%%  %s' % (name, policy.backlight(), 'static' if policy.static() else rates))
+        return 0
+    cpu, bus, nbytes = frame_cost()
+    if args.frame_cpu is not None:
+        cpu = args.frame_cpu / 1000.0
+    report = day_report(policy, cpu, bus, nbytes, args.emotion)
+    print('frame: %.1f ms CPU + %.1f ms SPI (%d bytes), full speed %.1f fps'
+          % (cpu * 1000, bus * 1000, nbytes, report['full_fps']))
+    print('static %.1f h of 24' % report['static_h'])
+    print('%-10s %14s %14s %8s' % ('per day', 'full speed', 'policy', 'saved'))
+    for key in ('frames', 'cpu_s', 'spi_mb', 'bus_s'):
+        full, used = report[key]
+        print('%-10s %14.0f %14.0f %7.1f%%' % (key, full, used, 100.0 * (1 - used / full) if full else 0.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,27 @@
 import time
 from . import lcdconfig
 
+# (command, parameters, delay in ms after the command)
+INIT_SEQUENCE = (
+    (0x36, [0x70], 0),  # self.data(0x00)
+    (0x3A, [0x05], 0),
+    (0xB2, [0x0C, 0x0C, 0x00, 0x33, 0x33], 0),
+    (0xB7, [0x35], 0),
+    (0xBB, [0x19], 0),
+    (0xC0, [0x2C], 0),
+    (0xC2, [0x01], 0),
+    (0xC3, [0x12], 0),
+    (0xC4, [0x20], 0),
+    (0xC6, [0x0F], 0),
+    (0xD0, [0xA4, 0xA1], 0),
+    (0xE0, [0xD0, 0x04, 0x0D, 0x11, 0x13, 0x2B, 0x3F, 0x54, 0x4C, 0x18, 0x0D, 0x0B, 0x1F, 0x23], 0),
+    (0xE1, [0xD0, 0x04, 0x0C, 0x11, 0x13, 0x2C, 0x3F, 0x44, 0x51, 0x2F, 0x1F, 0x1F, 0x20, 0x23], 0),
+    (0x21, [], 0),
+    (0x11, [], 0),
+    (0x29, [], 0),
+)
+
+
 class LCD_1inch3(lcdconfig.RaspberryPi):
 
     width = 240
@@ -16,91 +37,16 @@ class LCD_1inch3(lcdconfig.RaspberryPi):
     def reset(self):
         """Reset the display"""
         self.GPIO.output(self.RST_PIN,self.GPIO.HIGH)
-        time.sleep(0.01)
+        self.delay_ms(10)
         self.GPIO.output(self.RST_PIN,self.GPIO.LOW)
-        time.sleep(0.01)
+        self.delay_ms(10)
         self.GPIO.output(self.RST_PIN,self.GPIO.HIGH)
-        time.sleep(0.01)
+        self.delay_ms(10)
     def Init(self):
         """Initialize dispaly"""  
         self.module_init()
         self.reset()
-
-        self.command(0x36)
-        self.data(0x70)                 #self.data(0x00)
-
-        self.command(0x3A) 
-        self.data(0x05)
-
-        self.command(0xB2)
-        self.data(0x0C)
-        self.data(0x0C)
-        self.data(0x00)
-        self.data(0x33)
-        self.data(0x33)
-
-        self.command(0xB7)
-        self.data(0x35) 
-
-        self.command(0xBB)
-        self.data(0x19)
-
-        self.command(0xC0)
-        self.data(0x2C)
-
-        self.command(0xC2)
-        self.data(0x01)
-
-        self.command(0xC3)
-        self.data(0x12)   
-
-        self.command(0xC4)
-        self.data(0x20)
-
-        self.command(0xC6)
-        self.data(0x0F) 
-
-        self.command(0xD0)
-        self.data(0xA4)
-        self.data(0xA1)
-
-        self.command(0xE0)
-        self.data(0xD0)
-        self.data(0x04)
-        self.data(0x0D)
-        self.data(0x11)
-        self.data(0x13)
-        self.data(0x2B)
-        self.data(0x3F)
-        self.data(0x54)
-        self.data(0x4C)
-        self.data(0x18)
-        self.data(0x0D)
-        self.data(0x0B)
-        self.data(0x1F)
-        self.data(0x23)
-
-        self.command(0xE1)
-        self.data(0xD0)
-        self.data(0x04)
-        self.data(0x0C)
-        self.data(0x11)
-        self.data(0x13)
-        self.data(0x2C)
-        self.data(0x3F)
-        self.data(0x44)
-        self.data(0x51)
-        self.data(0x2F)
-        self.data(0x1F)
-        self.data(0x1F)
-        self.data(0x20)
-        self.data(0x23)
-        
-        self.command(0x21)
-
-        self.command(0x11)
-
-        self.command(0x29)
+        self.send_sequence(INIT_SEQUENCE)
   
     def SetWindows(self, Xstart, Ystart, Xend, Yend):
         #set the X coordinates
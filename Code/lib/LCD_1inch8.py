@@ -21,6 +21,38 @@ SCAN_DIR_DFT = U2D_R2L
 LCD_WIDTH  = 160
 LCD_HEIGHT = 128
 
+# (command, parameters, delay in ms after the command)
+INIT_SEQUENCE = (
+    (0xB1, [0x01, 0x2C, 0x2D], 0),
+    (0xB2, [0x01, 0x2C, 0x2D], 0),
+    (0xB3, [0x01, 0x2C, 0x2D, 0x01, 0x2C, 0x2D], 0),
+    #Column inversion
+    (0xB4, [0x07], 0),
+    #ST7735R Power Sequence
+    (0xC0, [0xA2, 0x02, 0x84], 0),
+    (0xC1, [0xC5], 0),
+    (0xC2, [0x0A, 0x00], 0),
+    (0xC3, [0x8A, 0x2A], 0),
+    (0xC4, [0x8A, 0xEE], 0),
+    (0xC5, [0x0E], 0),  # VCOM
+    #ST7735R Gamma Sequence
+    (0xE0, [0x0F, 0x1A, 0x0F, 0x18, 0x2F, 0x28, 0x20, 0x22, 0x1F, 0x1B, 0x23, 0x37, 0x00, 0x07, 0x02, 0x10], 0),
+    (0xE1, [0x0F, 0x1B, 0x0F, 0x17, 0x33, 0x2C, 0x29, 0x2E, 0x30, 0x30, 0x39, 0x3F, 0x00, 0x07, 0x03, 0x10], 0),
+    #Enable test command
+    (0xF0, [0x01], 0),
+    #Disable ram power save mode
+    (0xF6, [0x00], 0),
+    #65k mode
+    (0x3A, [0x05], 0),
+)
+
+# Sleep out, then display on
+DISPLAY_ON = (
+    (0x11, [], 120),
+    (0x29, [], 0),
+)
+
+
 class LCD_1inch8(lcdconfig.RaspberryPi):
     LCD_Dis_Column  = LCD_WIDTH
     LCD_Dis_Page    = LCD_HEIGHT
@@ -82,98 +114,7 @@ class LCD_1inch8(lcdconfig.RaspberryPi):
         self.data( MemoryAccessReg_Data & 0xf7)    #RGB color filter panel    
     def Init_reg(self):
         """Initialize dispaly"""  
-        self.command(0xB1)
-        self.data(0x01)
-        self.data(0x2C)
-        self.data(0x2D)
-
-        self.command(0xB2)
-        self.data(0x01)
-        self.data(0x2C)
-        self.data(0x2D)
-
-        self.command(0xB3)
-        self.data(0x01)
-        self.data(0x2C)
-        self.data(0x2D)
-        self.data(0x01)
-        self.data(0x2C)
-        self.data(0x2D)
-        
-        #Column inversion 
-        self.command(0xB4)
-        self.data(0x07)
-        
-        #ST7735R Power Sequence
-        self.command(0xC0)
-        self.data(0xA2)
-        self.data(0x02)
-        self.data(0x84)
-        self.command(0xC1)
-        self.data(0xC5)
-
-        self.command(0xC2)
-        self.data(0x0A)
-        self.data(0x00)
-
-        self.command(0xC3)
-        self.data(0x8A)
-        self.data(0x2A)
-        self.command(0xC4)
-        self.data(0x8A)
-        self.data(0xEE)
-        
-        self.command(0xC5)#VCOM 
-        self.data(0x0E)
-        
-        #ST7735R Gamma Sequence
-        self.command(0xe0)
-        self.data(0x0f)
-        self.data(0x1a)
-        self.data(0x0f)
-        self.data(0x18)
-        self.data(0x2f)
-        self.data(0x28)
-        self.data(0x20)
-        self.data(0x22)
-        self.data(0x1f)
-        self.data(0x1b)
-        self.data(0x23)
-        self.data(0x37)
-        self.data(0x00)
-        self.data(0x07)
-        self.data(0x02)
-        self.data(0x10)
-
-        self.command(0xe1)
-        self.data(0x0f)
-        self.data(0x1b)
-        self.data(0x0f)
-        self.data(0x17)
-        self.data(0x33)
-        self.data(0x2c)
-        self.data(0x29)
-        self.data(0x2e)
-        self.data(0x30)
-        self.data(0x30)
-        self.data(0x39)
-        self.data(0x3f)
-        self.data(0x00)
-        self.data(0x07)
-        self.data(0x03)
-        self.data(0x10) 
-        
-        #Enable test command
-        self.command(0xF0)
-        self.data(0x01)
-        
-        #Disable ram power save mode
-        self.command(0xF6)
-        self.data(0x00)
-        
-        #65k mode
-        self.command(0x3A)
-        self.data(0x05)
+        self.send_sequence(INIT_SEQUENCE)
         
     def Init(self,Lcd_ScanDir=U2D_R2L):
         self.module_init()
@@ -186,12 +127,8 @@ class LCD_1inch8(lcdconfig.RaspberryPi):
         self.SetGramScanWay( Lcd_ScanDir )
         self.delay_ms(200);
 
-        #sleep out
-        self.command(0x11)
-        self.delay_ms(120);
-
-        #Turn on the LCD display
-        self.command(0x29)
+        #Sleep out, turn on the LCD display
+        self.send_sequence(DISPLAY_ON)
 
         self.clear()   
   
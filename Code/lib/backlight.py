@@ -0,0 +1,257 @@
+# /*****************************************************************************
+# * | File        :	  backlight.py
+# * | Function    :   Backlight backends for lcdconfig.RaspberryPi
+# * | Info        :
+# *----------------
+# * | sysfs       :   kernel hardware PWM (/sys/class/pwm), no CPU cost
+# * | gpio        :   constant on/off
+# * | soft        :   RPi.GPIO software PWM (background thread), the old default
+# ******************************************************************************
+"""
+Backlight backends.
+
+All backends share set(duty) (0-100 %), set_frequency(hz), ramp(duty,
+seconds) and close(). A ramp runs on a background thread that sleeps on an
+Event between steps, so it never busy-waits and a later set() or ramp()
+cancels it.
+
+Hardware PWM needs `dtoverlay=pwm` (GPIO18, the BL pin of the Waveshare
+HATs, is PWM0 channel 0) in /boot/config.txt. The mode is chosen by the
+`backlight=` argument of the driver or FYTO_BACKLIGHT (auto, sysfs, gpio,
+soft); "auto" uses sysfs when the pin has a hardware PWM channel and the
+chip is present, and software PWM otherwise.
+
+The sysfs backend takes the sysfs root as an argument, so it can be run
+against a fake tree:
+
+    root = fake_pwmchip('/tmp/pwm')
+    light = SysfsPWMBacklight(channel=0, root=root)
+    light.set(40)        # /tmp/pwm/pwmchip0/pwm0/duty_cycle == 400000
+"""
+
+import os
+import time
+import threading
+
+PWM_ROOT = '/sys/class/pwm'
+# BCM pin -> hardware PWM channel on pwmchip0
+PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+MODES = ('auto', 'sysfs', 'gpio', 'soft')
+# Called first in every ramp thread, e.g. to move it off the display core
+# (a new thread inherits the CPU placement of the one starting it)
+thread_setup = None
+
+
+class Backlight:
+    """Common part: current duty and ramps on a background thread."""
+
+    rate = 60.0     # ramp steps per second
+
+    def __init__(self):
+        self.duty = 0.0
+        self._ramp = None
+        self._stop = threading.Event()
+
+    def _apply(self, duty):
+        raise NotImplementedError
+
+    def set(self, duty):
+        """Set the duty cycle in percent, cancelling a running ramp."""
+        self._cancel()
+        self._set(duty)
+
+    def _set(self, duty):
+        duty = min(100.0, max(0.0, float(duty)))
+        self._apply(duty)
+        self.duty = duty
+
+    def set_frequency(self, frequency):
+        pass
+
+    def ramp(self, duty, seconds, wait=False):
+        """Fade linearly to duty over seconds; returns at once unless wait."""
+        self._cancel()
+        start = self.duty
+        steps = max(1, int(seconds * self.rate))
+        if steps == 1 or start == duty:
+            self._set(duty)
+            return
+        stop = threading.Event()
+
+        def run():
+            if thread_setup is not None:
+                thread_setup()
+            t0 = time.monotonic()
+            for i in range(1, steps + 1):
+                # Sleep until the step is due; a cancel wakes us up at once
+                if stop.wait(max(0.0, t0 + i * seconds / steps - time.monotonic())):
+                    return
+                self._set(start + (duty - start) * i / steps)
+
+        self._stop = stop
+        self._ramp = threading.Thread(target=run, name='backlight-ramp', daemon=True)
+        self._ramp.start()
+        if wait:
+            self._ramp.join()
+
+    def ramping(self):
+        return self._ramp is not None and self._ramp.is_alive()
+
+    def _cancel(self):
+        if self.ramping():
+            self._stop.set()
+            self._ramp.join()
+        self._ramp = None
+
+    def close(self, duty=100):
+        """Stop ramps and leave the backlight at duty (full on, like module_exit did)."""
+        self._cancel()
+        self._set(duty)
+
+
+class SysfsPWMBacklight(Backlight):
+    """
+    Kernel hardware PWM through /sys/class/pwm/pwmchipN/pwmM.
+
+    Args:
+        chip (int): pwmchip number
+        channel (int): PWM channel on the chip
+        frequency (float): PWM frequency in Hz
+        root (str): sysfs PWM class directory (a fake tree for tests)
+        timeout (float): Wait this long for pwmM to appear after export
+    """
+
+    def __init__(self, chip=0, channel=0, frequency=1000, root=PWM_ROOT, timeout=1.0):
+        super().__init__()
+        self.chip_path = os.path.join(root, 'pwmchip%d' % chip)
+        self.path = os.path.join(self.chip_path, 'pwm%d' % channel)
+        if not os.path.isdir(self.path):
+            _write(os.path.join(self.chip_path, 'export'), channel)
+            # udev creates the directory and fixes its permissions asynchronously
+            deadline = time.monotonic() + timeout
+            while not os.access(os.path.join(self.path, 'enable'), os.W_OK):
+                if time.monotonic() > deadline:
+                    raise OSError('%s did not appear after export' % self.path)
+                time.sleep(0.01)
+        # A channel set up by an earlier run (warm restart, the splash) keeps
+        # its brightness instead of blinking off
+        self.period = _read_int(os.path.join(self.path, 'period'))
+        if self.period > 0:
+            self.duty = min(100.0, 100.0 * _read_int(os.path.join(self.path, 'duty_cycle')) / self.period)
+        self.set_frequency(frequency)
+        _write(os.path.join(self.path, 'enable'), 1)
+
+    def set_frequency(self, frequency):
+        period = int(round(1e9 / frequency))
+        if period == self.period:
+            return
+        # duty_cycle may never exceed the period: lower it first only if it would
+        duty_cycle = int(period * self.duty / 100)
+        if _read_int(os.path.join(self.path, 'duty_cycle')) > period:
+            _write(os.path.join(self.path, 'duty_cycle'), duty_cycle)
+        _write(os.path.join(self.path, 'period'), period)
+        self.period = period
+        self._apply(self.duty)
+
+    def _apply(self, duty):
+        _write(os.path.join(self.path, 'duty_cycle'), int(self.period * duty / 100))
+
+
+class GPIOBacklight(Backlight):
+    """Plain GPIO: on for any duty above 0; ramps become a single step."""
+
+    def __init__(self, gpio, pin):
+        super().__init__()
+        self.gpio = gpio
+        self.pin = pin
+        gpio.setup(pin, gpio.OUT)
+
+    def ramp(self, duty, seconds, wait=False):
+        self.set(duty)
+
+    def _apply(self, duty):
+        self.gpio.output(self.pin, self.gpio.HIGH if duty > 0 else self.gpio.LOW)
+
+
+class SoftPWMBacklight(Backlight):
+    """RPi.GPIO software PWM (a thread toggling the pin), started on the first set()."""
+
+    def __init__(self, gpio, pin, frequency=1000):
+        super().__init__()
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self._pwm = None
+        gpio.setup(pin, gpio.OUT)
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+        if self._pwm is not None:
+            self._pwm.ChangeFrequency(frequency)
+
+    def _apply(self, duty):
+        if self._pwm is None:
+            self._pwm = self.gpio.PWM(self.pin, self.frequency)
+            self._pwm.start(duty)
+        else:
+            self._pwm.ChangeDutyCycle(duty)
+
+    def close(self, duty=100):
+        # Stop the PWM thread and drive the pin statically
+        self._cancel()
+        if self._pwm is not None:
+            self._pwm.stop()
+            self._pwm = None
+        self.gpio.output(self.pin, self.gpio.HIGH if duty > 0 else self.gpio.LOW)
+        self.duty = 100.0 if duty > 0 else 0.0
+
+
+def _write(path, value):
+    with open(path, 'w') as f:
+        f.write(str(value))
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def open_backlight(gpio, pin, frequency=1000, mode=None, root=PWM_ROOT):
+    """
+    Backlight for pin in the given mode (default: FYTO_BACKLIGHT or auto).
+
+    Returns:
+        Backlight: not driven yet; call set() for the brightness
+    """
+    mode = mode or os.environ.get('FYTO_BACKLIGHT', 'auto')
+    if mode not in MODES:
+        raise ValueError('backlight mode must be one of %s' % ', '.join(MODES))
+    if mode in ('auto', 'sysfs') and pin in PWM_CHANNELS:
+        try:
+            return SysfsPWMBacklight(0, PWM_CHANNELS[pin], frequency, root)
+        except OSError:
+            if mode == 'sysfs':
+                raise
+    elif mode == 'sysfs':
+        raise ValueError('GPIO%d has no hardware PWM channel' % pin)
+    if mode == 'gpio' or not hasattr(gpio, 'PWM'):
+        # libgpiod has no software PWM: constant on
+        return GPIOBacklight(gpio, pin)
+    return SoftPWMBacklight(gpio, pin, frequency)
+
+
+def fake_pwmchip(root, chip=0, npwm=2):
+    """Create a /sys/class/pwm look-alike under root with exported channels; returns root."""
+    chip_path = os.path.join(root, 'pwmchip%d' % chip)
+    os.makedirs(chip_path, exist_ok=True)
+    _write(os.path.join(chip_path, 'npwm'), npwm)
+    _write(os.path.join(chip_path, 'export'), '')
+    for channel in range(npwm):
+        path = os.path.join(chip_path, 'pwm%d' % channel)
+        os.makedirs(path, exist_ok=True)
+        for name, value in (('period', 0), ('duty_cycle', 0), ('enable', 0), ('polarity', 'normal')):
+            _write(os.path.join(path, name), value)
+    return root
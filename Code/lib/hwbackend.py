@@ -0,0 +1,549 @@
+# /*****************************************************************************
+# * | File        :	  hwbackend.py
+# * | Function    :   GPIO/SPI backends for lcdconfig.RaspberryPi
+# * | Info        :
+# *----------------
+# * | PiBackend   :   RPi.GPIO + spidev, imported only when used
+# * | GpiodBackend:   libgpiod character device (v1 or v2 bindings) + spidev
+# * | MockBackend :   records every GPIO write and SPI transfer, simulates
+# * |                 the bus time from the SPI clock; runs on any Linux box
+# ******************************************************************************
+"""
+Hardware backends for the LCD drivers.
+
+A backend provides `GPIO` (the RPi.GPIO API subset the drivers use),
+`SpiDev(bus, device)`, `sleep(seconds)` and `name_pins(**pins)`.
+lcdconfig.RaspberryPi takes one as `backend=`; without it the backend is
+chosen by FYTO_DISPLAY: "pi" (RPi.GPIO), "gpiod", "mock", or "auto", the
+default, which uses RPi.GPIO and falls back to libgpiod where RPi.GPIO
+does not work (Pi 5, kernels without /sys/class/gpio):
+
+    FYTO_DISPLAY=mock python3 main.py
+    FYTO_DISPLAY=gpiod FYTO_GPIOCHIP=/dev/gpiochip4 python3 main.py
+
+The libgpiod backend requests the output lines once and keeps the request
+open, so a DC toggle is a single ioctl; GPIO.output([pins], [values])
+changes several lines in one call. GPIO.setup() without `initial` keeps
+the level a line already has (RST of a panel that is still running
+after a warm restart), as RPi.GPIO does.
+
+    from lib import LCD_2inch, hwbackend
+    mock = hwbackend.MockBackend(panel=panelsim.Panel.for_driver('LCD_2inch'))
+    disp = LCD_2inch.LCD_2inch(spi_freq=40000000, backend=mock)
+    disp.Init(); disp.ShowImage(image)
+    print(mock.stats())      # transfers, bytes, toggles, simulated bus time
+"""
+
+import os
+import time
+
+# Largest write spidev accepts by default (/sys/module/spidev/parameters/bufsiz)
+SPIDEV_BUFSIZ = 4096
+
+
+class PiBackend:
+    """RPi.GPIO and spidev on a Raspberry Pi."""
+
+    name = 'pi'
+    backlight = 'auto'
+
+    def __init__(self):
+        import RPi.GPIO
+        import spidev
+        self.GPIO = RPi.GPIO
+        # Raises RuntimeError where RPi.GPIO cannot map the SoC (Pi 5)
+        self.GPIO.setmode(self.GPIO.BCM)
+        self._spidev = spidev
+
+    def SpiDev(self, bus=0, device=0):
+        return self._spidev.SpiDev(bus, device)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def name_pins(self, **pins):
+        pass
+
+
+class _GpiodGPIO:
+    """
+    RPi.GPIO-style outputs on libgpiod line requests held open.
+
+    Each setup() call requests its line(s) once; lines set up earlier are
+    never released on the way, so RST, DC and BL keep being driven while
+    the driver adds pins. setup() with a list of pins makes one request,
+    whose lines output_many() then changes with one ioctl.
+    """
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, gpiod, chip_path, consumer='fyto-lcd'):
+        self._gpiod = gpiod
+        self.chip_path = chip_path
+        self.consumer = consumer
+        self.levels = {}
+        # pin -> request (v2) or line (v1) holding it
+        self._requests = {}
+        self._v2 = hasattr(gpiod, 'request_lines')
+        if self._v2:
+            self._direction = gpiod.line.Direction.OUTPUT
+            self._values = (gpiod.line.Value.INACTIVE, gpiod.line.Value.ACTIVE)
+        else:
+            self._chip = gpiod.Chip(chip_path)
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, initial=None):
+        if direction != self.OUT:
+            raise ValueError('the libgpiod backend only drives outputs')
+        pins = list(pin) if isinstance(pin, (list, tuple)) else [pin]
+        held = [p for p in pins if p in self._requests]
+        if initial is not None and held:
+            self.output(held, initial)
+        new = [p for p in pins if p not in self._requests]
+        if not new:
+            return
+        if initial is None:
+            self._request_as_is(new)
+            return
+        for p in new:
+            self.levels[p] = 1 if initial else 0
+        self._request_lines(new)
+
+    def _request_lines(self, pins):
+        # A new request for just these lines; the ones already held stay driven
+        if self._v2:
+            gpiod = self._gpiod
+            config = {pin: gpiod.LineSettings(direction=self._direction,
+                                              output_value=self._values[self.levels[pin]])
+                      for pin in pins}
+            request = gpiod.request_lines(self.chip_path, consumer=self.consumer, config=config)
+            for pin in pins:
+                self._requests[pin] = request
+        else:
+            for pin in pins:
+                line = self._chip.get_line(pin)
+                line.request(consumer=self.consumer, type=self._gpiod.LINE_REQ_DIR_OUT,
+                             default_val=self.levels[pin])
+                self._requests[pin] = line
+
+    def _request_as_is(self, pins):
+        # Take the lines without changing them, read their level, then make
+        # them outputs driving that level; requesting an output right away
+        # would drive it low
+        if self._v2:
+            gpiod = self._gpiod
+            as_is = gpiod.LineSettings(direction=gpiod.line.Direction.AS_IS)
+            request = gpiod.request_lines(self.chip_path, consumer=self.consumer,
+                                          config={pin: as_is for pin in pins})
+            for pin in pins:
+                self.levels[pin] = 1 if request.get_value(pin) == self._values[1] else 0
+                self._requests[pin] = request
+            request.reconfigure_lines({pin: gpiod.LineSettings(direction=self._direction,
+                                                               output_value=self._values[self.levels[pin]])
+                                       for pin in pins})
+        else:
+            gpiod = self._gpiod
+            for pin in pins:
+                line = self._chip.get_line(pin)
+                line.request(consumer=self.consumer, type=gpiod.LINE_REQ_DIR_AS_IS)
+                self.levels[pin] = line.get_value()
+                if hasattr(line, 'set_config'):
+                    line.set_config(gpiod.LINE_REQ_DIR_OUT, 0, self.levels[pin])
+                else:
+                    line.release()
+                    line.request(consumer=self.consumer, type=gpiod.LINE_REQ_DIR_OUT,
+                                 default_val=self.levels[pin])
+                self._requests[pin] = line
+
+    def output(self, pin, value):
+        if isinstance(pin, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                value = [value] * len(pin)
+            self.output_many(dict(zip(pin, value)))
+            return
+        value = 1 if value else 0
+        if self._v2:
+            self._requests[pin].set_value(pin, self._values[value])
+        else:
+            self._requests[pin].set_value(value)
+        self.levels[pin] = value
+
+    def output_many(self, values):
+        """Change several lines, one ioctl per request they belong to: {pin: value}."""
+        for pin, value in values.items():
+            self.levels[pin] = 1 if value else 0
+        if not self._v2:
+            for pin in values:
+                self._requests[pin].set_value(self.levels[pin])
+            return
+        groups = {}
+        for pin in values:
+            groups.setdefault(id(self._requests[pin]), (self._requests[pin], {}))[1][pin] = \
+                self._values[self.levels[pin]]
+        for request, group in groups.values():
+            request.set_values(group)
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def cleanup(self, *pins):
+        released = set()
+        for request in self._requests.values():
+            if id(request) not in released:
+                released.add(id(request))
+                request.release()
+        self._requests = {}
+
+
+def find_chip(gpiod):
+    """Path of the gpiochip that drives the 40-pin header."""
+    labels = ('pinctrl-rp1', 'pinctrl-bcm2712', 'pinctrl-bcm2711', 'pinctrl-bcm2835')
+    paths = sorted(p for p in (os.path.join('/dev', n) for n in os.listdir('/dev'))
+                   if os.path.basename(p).startswith('gpiochip'))
+    for path in paths:
+        try:
+            if hasattr(gpiod, 'request_lines'):
+                with gpiod.Chip(path) as chip:
+                    label = chip.get_info().label
+            else:
+                label = gpiod.Chip(path).label()
+        except OSError:
+            continue
+        if label in labels:
+            return path
+    return '/dev/gpiochip0'
+
+
+class GpiodBackend:
+    """
+    libgpiod character-device GPIO and spidev.
+
+    Args:
+        chip (str): gpiochip path (default FYTO_GPIOCHIP or the header's chip)
+    """
+
+    name = 'gpiod'
+    backlight = 'auto'
+
+    def __init__(self, chip=None):
+        import gpiod
+        import spidev
+        self._spidev = spidev
+        chip = chip or os.environ.get('FYTO_GPIOCHIP') or find_chip(gpiod)
+        self.GPIO = _GpiodGPIO(gpiod, chip)
+
+    def SpiDev(self, bus=0, device=0):
+        return self._spidev.SpiDev(bus, device)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def name_pins(self, **pins):
+        pass
+
+
+class _MockPWM:
+    def __init__(self, backend, pin, frequency):
+        self.backend = backend
+        self.pin = pin
+        self.frequency = frequency
+        self.duty = None
+
+    def start(self, duty):
+        self.duty = duty
+        self.backend._record('pwm', self.pin, duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+        self.backend._record('pwm', self.pin, duty)
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.duty = None
+        self.backend._record('pwm', self.pin, 0)
+
+
+class _MockGPIO:
+    """Module-like stand-in for RPi.GPIO."""
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.levels = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, initial=None):
+        if initial is not None:
+            self.output(pin, initial)
+
+    def output(self, pin, value):
+        if isinstance(pin, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                value = [value] * len(pin)
+            self.output_many(dict(zip(pin, value)))
+            return
+        value = 1 if value else 0
+        previous = self.levels.get(pin)
+        self.levels[pin] = value
+        self._backend._gpio(pin, value, previous)
+
+    def output_many(self, values):
+        for pin, value in values.items():
+            value = 1 if value else 0
+            previous = self.levels.get(pin)
+            self.levels[pin] = value
+            self._backend._gpio(pin, value, previous)
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def PWM(self, pin, frequency):
+        return _MockPWM(self._backend, pin, frequency)
+
+    def cleanup(self, *pins):
+        pass
+
+
+class _MockSpiDev:
+    def __init__(self, backend, bus, device):
+        self.backend = backend
+        self.bus = bus
+        self.device = device
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self.closed = False
+
+    def writebytes(self, data):
+        if len(data) > SPIDEV_BUFSIZ:
+            raise OSError(90, 'Message too long')
+        self.backend._spi(self, data)
+
+    def writebytes2(self, data):
+        # spidev splits long buffers into bufsiz transfers itself
+        for i in range(0, len(data), SPIDEV_BUFSIZ):
+            self.backend._spi(self, data[i:i + SPIDEV_BUFSIZ])
+
+    def xfer2(self, data, *args):
+        self.writebytes(data)
+        return [0] * len(data)
+
+    def close(self):
+        self.closed = True
+
+
+class MockBackend:
+    """
+    Record GPIO writes and SPI transfers instead of driving hardware.
+
+    Nothing sleeps: driver delays and SPI transfers advance a simulated
+    bus clock (`elapsed`), so the host CPU time of the display pipeline can
+    be measured separately and the two added up for an on-panel FPS
+    estimate.
+
+    Args:
+        panel: Optional panelsim.Panel fed with the DC/RST lines and SPI bytes
+        core_clock (float): SPI source clock in Hz; the bus runs at
+            core_clock / (even divider) as on the BCM283x. None = exact
+        overhead (float): Fixed cost per SPI transfer in seconds (ioctl, CS)
+        record (bool): Keep every event in `events` (kind, pin/bytes, value, time)
+        realtime (bool): Really sleep for driver delays and bus time
+    """
+
+    name = 'mock'
+    backlight = 'soft'
+
+    def __init__(self, panel=None, core_clock=250e6, overhead=20e-6, record=False, realtime=False):
+        self.panel = panel
+        self.core_clock = core_clock
+        self.overhead = overhead
+        self.record = record
+        self.realtime = realtime
+        self.GPIO = _MockGPIO(self)
+        self.pins = {}
+        self.events = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.elapsed = 0.0
+        self.spi_time = 0.0
+        self.sleep_time = 0.0
+        self.spi_transfers = 0
+        self.spi_bytes = 0
+        self.gpio_writes = 0
+        self.gpio_toggles = 0
+        self.events.clear()
+
+    def SpiDev(self, bus=0, device=0):
+        return _MockSpiDev(self, bus, device)
+
+    def name_pins(self, **pins):
+        """Tell the mock which pin is which (dc=25, rst=27, bl=18)."""
+        self.pins = {pin: role for role, pin in pins.items()}
+
+    def bus_hz(self, requested):
+        """SPI clock actually reached for a requested max_speed_hz."""
+        if not self.core_clock:
+            return requested
+        divider = max(2, -(-int(self.core_clock) // int(requested)))
+        divider += divider % 2
+        return self.core_clock / divider
+
+    def sleep(self, seconds):
+        self.elapsed += seconds
+        self.sleep_time += seconds
+        if self.realtime:
+            time.sleep(seconds)
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'spi_transfers': self.spi_transfers,
+            'spi_bytes': self.spi_bytes,
+            'spi_time': self.spi_time,
+            'gpio_writes': self.gpio_writes,
+            'gpio_toggles': self.gpio_toggles,
+            'sleep_time': self.sleep_time,
+            'elapsed': self.elapsed,
+        }
+
+    def _record(self, kind, what, value):
+        if self.record:
+            self.events.append((kind, what, value, self.elapsed))
+
+    def _gpio(self, pin, value, previous):
+        self.gpio_writes += 1
+        if value != previous:
+            self.gpio_toggles += 1
+        self._record('gpio', pin, value)
+        if self.panel is not None and pin in self.pins:
+            self.panel.pin(self.pins[pin], value)
+
+    def _spi(self, device, data):
+        n = len(data)
+        duration = self.overhead + n * 8 / self.bus_hz(device.max_speed_hz)
+        self.spi_transfers += 1
+        self.spi_bytes += n
+        self.spi_time += duration
+        self.elapsed += duration
+        self._record('spi', n, duration)
+        if self.panel is not None:
+            self.panel.write(data)
+        if self.realtime:
+            time.sleep(duration)
+
+
+class FakeGpiod:
+    """
+    The part of the libgpiod v2 module _GpiodGPIO uses, on simulated lines.
+    Line levels survive a released request like on the chip, and every
+    request and write is kept in `log`, so the gpiod code path can be
+    checked off the Pi (the mock GPIO does not go through it).
+
+    Args:
+        levels (dict): pin -> level the lines start at
+    """
+
+    class line:
+        class Direction:
+            AS_IS = 'as-is'
+            INPUT = 'input'
+            OUTPUT = 'output'
+
+        class Value:
+            INACTIVE = 0
+            ACTIVE = 1
+
+    class LineSettings:
+        def __init__(self, direction='as-is', output_value=0):
+            self.direction = direction
+            self.output_value = output_value
+
+    class _Request:
+        def __init__(self, gpiod, config):
+            self.gpiod = gpiod
+            self.pins = list(config)
+            self.reconfigure_lines(config)
+
+        def reconfigure_lines(self, config):
+            for pin, settings in config.items():
+                if settings.direction == 'output':
+                    self.set_value(pin, settings.output_value)
+
+        def set_value(self, pin, value):
+            self.gpiod.levels[pin] = value
+            self.gpiod.log.append(('set', pin, value))
+
+        def set_values(self, values):
+            for pin, value in values.items():
+                self.set_value(pin, value)
+
+        def get_value(self, pin):
+            return self.gpiod.levels.get(pin, 0)
+
+        def release(self):
+            self.gpiod.log.append(('release', tuple(self.pins)))
+
+    def __init__(self, levels=None):
+        self.levels = dict(levels or {})
+        self.log = []
+
+    def request_lines(self, path, consumer=None, config=None):
+        self.log.append(('request', {pin: settings.direction for pin, settings in config.items()}))
+        return self._Request(self, config)
+
+
+class FakeGpiodBackend(MockBackend):
+    """MockBackend whose GPIO is the libgpiod backend on a FakeGpiod (SPI stays mocked)."""
+
+    name = 'gpiod-fake'
+    backlight = 'gpio'
+
+    def __init__(self, levels=None, **kwargs):
+        super().__init__(**kwargs)
+        self.gpiod = FakeGpiod(levels)
+        self.GPIO = _GpiodGPIO(self.gpiod, '/dev/gpiochip-fake')
+
+
+BACKENDS = {'pi': PiBackend, 'gpiod': GpiodBackend, 'mock': MockBackend}
+
+
+def open_backend(name=None):
+    """Backend by name (pi, gpiod, mock or auto; default FYTO_DISPLAY or auto)."""
+    name = name or os.environ.get('FYTO_DISPLAY', 'auto')
+    if name == 'auto':
+        try:
+            return PiBackend()
+        except (ImportError, RuntimeError):
+            # RPi.GPIO missing or unable to map the SoC (Pi 5)
+            return GpiodBackend()
+    if name not in BACKENDS:
+        raise ValueError('display backend must be auto or one of %s' % ', '.join(BACKENDS))
+    return BACKENDS[name]()
+
+
+def default_backend():
+    """Backend selected by FYTO_DISPLAY."""
+    return open_backend()
@@ -30,28 +30,39 @@
 import os
 import sys
 import time
-import spidev
 import logging
 import numpy as np
+from . import hwbackend
+from . import backlight as _backlight
 
 class RaspberryPi:
-    def __init__(self,spi=spidev.SpiDev(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = 18,bl_freq=1000,i2c=None,i2c_freq=100000):
-        import RPi.GPIO      
+    # spi: (bus, device) to open through the backend, a SpiDev-like object, or None
+    # backend: hwbackend.PiBackend/MockBackend, default picked by FYTO_DISPLAY
+    # backlight: 'auto', 'sysfs', 'gpio' or 'soft', see backlight.py
+    def __init__(self,spi=(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = 18,bl_freq=1000,i2c=None,i2c_freq=100000,backend=None,backlight=None):
+        if backend is None:
+            backend = hwbackend.default_backend()
+        self.backend = backend
         self.np=np
         self.RST_PIN= rst
         self.DC_PIN = dc
         self.BL_PIN = bl
         self.SPEED  =spi_freq
         self.BL_freq=bl_freq
-        self.GPIO = RPi.GPIO
+        self.GPIO = backend.GPIO
+        backend.name_pins(rst=rst, dc=dc, bl=bl)
         #self.GPIO.cleanup()
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN,   self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN,    self.GPIO.OUT)
-        self.GPIO.setup(self.BL_PIN,    self.GPIO.OUT)
-        self.GPIO.output(self.BL_PIN,   self.GPIO.HIGH)        
+        #Hardware PWM owns the BL pin, so it is not set up as a GPIO here
+        mode = backlight or os.environ.get('FYTO_BACKLIGHT') or backend.backlight
+        self.backlight = _backlight.open_backlight(self.GPIO, self.BL_PIN, bl_freq, mode)
+        self.backlight.set(100)
         #Initialize SPI
+        if isinstance(spi, tuple):
+            spi = backend.SpiDev(*spi)
         self.SPI = spi
         if self.SPI!=None :
             self.SPI.max_speed_hz = spi_freq
@@ -64,23 +75,42 @@ class RaspberryPi:
         return self.GPIO.input(pin)
 
     def delay_ms(self, delaytime):
-        time.sleep(delaytime / 1000.0)
+        self.backend.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
         if self.SPI!=None :
             self.SPI.writebytes(data)
+
+    def send_sequence(self, sequence):
+        # (command, parameters, delay_ms) rows as in the drivers' INIT_SEQUENCE:
+        # one transfer for the command byte and one for all of its parameters,
+        # DC only driven when it changes
+        dc = None
+        for cmd, params, delay in sequence:
+            if dc != self.GPIO.LOW:
+                dc = self.GPIO.LOW
+                self.digital_write(self.DC_PIN, dc)
+            self.spi_writebyte([cmd])
+            if params:
+                dc = self.GPIO.HIGH
+                self.digital_write(self.DC_PIN, dc)
+                self.spi_writebyte(list(params))
+            if delay:
+                self.delay_ms(delay)
     def bl_DutyCycle(self, duty):
-        self._pwm.ChangeDutyCycle(duty)
+        self.backlight.set(duty)
         
     def bl_Frequency(self,freq):
-        self._pwm.ChangeFrequency(freq)
+        self.backlight.set_frequency(freq)
+
+    def bl_Ramp(self, duty, seconds):
+        # Fade in the background, see backlight.Backlight.ramp
+        self.backlight.ramp(duty, seconds)
            
     def module_init(self):
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.BL_PIN, self.GPIO.OUT)
-        self._pwm=self.GPIO.PWM(self.BL_PIN,self.BL_freq)
-        self._pwm.start(100)
+        self.backlight.set(100)
         if self.SPI!=None :
             self.SPI.max_speed_hz = self.SPEED        
             self.SPI.mode = 0b00     
@@ -94,9 +124,7 @@ class RaspberryPi:
         logging.debug("gpio cleanup...")
         self.GPIO.output(self.RST_PIN, 1)
         self.GPIO.output(self.DC_PIN, 0)        
-        self._pwm.stop()
-        time.sleep(0.001)
-        self.GPIO.output(self.BL_PIN, 1)
+        self.backlight.close(100)
         #self.GPIO.cleanup()
 
 
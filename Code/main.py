@@ -1,11 +1,15 @@
 import os
 import sys 
+import time
+import select
 import logging
-import spidev as SPI
+import threading
 sys.path.append("..")
-from lib import LCD_2inch
-from PIL import Image,ImageDraw,ImageFont
-import socket
+from lib import hwbackend
+from lib import backlight
+import cpusched
+import splash
+import displaystate
 
 
 # Raspberry Pi pin configuration:
@@ -14,62 +18,196 @@ DC = 25
 BL = 18
 bus = 0 
 device = 0 
+SPI_FREQ = 90000000
+STATE_EVERY = 30 #Save the frame index every this many frames
 logging.basicConfig(level=logging.DEBUG)
 directory = os.getcwd()
 
+#Backlight fades run off the display core; the render thread itself is
+#placed in show() once the driver (and its soft PWM thread) exists, so no
+#helper thread inherits the display placement (scheduling.json)
+_background = cpusched.load().get('background')
+backlight.thread_setup = _background.apply if _background is not None else None
+
+#Warm restart: the panel is still configured and shows the last frame,
+#so it is neither reset nor re-initialized and playback resumes there
+state = displaystate.DisplayState.load()
+backend = hwbackend.default_backend()
+if state.warm():
+    logging.info("warm restart: resuming %s at frame %d", state.emotion, state.frame)
+else:
+    #Boot fast path: the raw first frame goes out before PIL, NumPy and the
+    #drivers are imported; they load while it is on the glass
+    state.save(initialized=False)
+    if splash.show(backend=backend, rst=RST, dc=DC, bl=BL, bus=bus, device=device, speed=SPI_FREQ) is not None:
+        state.save(emotion='happy', frame=0, initialized=True)
+
+from lib import LCD_2inch
+from PIL import Image
+import socket
+import framerate
+import animation
+import framecache
+import thermal
+from thresholds import EMOTIONS, parse_light
+
 #Server For Data Reception
 server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 server.bind(('0.0.0.0', 1013))
 server.listen(2)
 
-doInterrupt = 0
+#Frame rate and backlight by emotion and ambient light, see framerate.json
+policy = framerate.FrameRatePolicy.from_file()
+#Steps playback down before the SoC throttles, see thermal.json
+governor = thermal.ThermalGovernor.from_file()
+
+#Intro/loop/outro segments per emotion, see emotion/<name>/manifest.json;
+#keeps its position, so an interrupted animation continues where it stopped
+player = animation.Player(directory+'/emotion')
+
 showOn = 0
+disp = None
+conn = None
+shownFrame = None #(folder, frame) on the panel
+backlightDuty = None
 
 
+def waitInput(seconds):
+    #Sleep up to seconds; True as soon as sensors.py has sent something
+    if conn is None:
+        time.sleep(max(0, seconds))
+        return False
+    readable, _, _ = select.select([conn], [], [], max(0, seconds))
+    return bool(readable)
 
+def pushFrame(folder, i):
+    #Precompiled panel bytes once framecache has them, else decode the PNG
+    buf = player.manifest(folder).buffer(i)
+    if buf is not None:
+        disp.ShowBuffer(buf)
+    else:
+        image = Image.open(directory+'/emotion/'+folder+'/frame'+str(i)+'.png')	
+        image = image.rotate(180)
+        disp.ShowImage(image)
 
 def show(emotion):
-    global doInterrupt, showOn, disp
+    global showOn, disp, shownFrame, backlightDuty
+    folder = EMOTIONS.get(emotion, emotion)
     try:
-        disp = LCD_2inch.LCD_2inch(spi=SPI.SpiDev(bus, device),spi_freq=90000000,rst=RST,dc=DC,bl=BL)
-        disp.Init() # Initialize library.
+        if disp is None:
+            disp = LCD_2inch.LCD_2inch(spi=(bus, device),spi_freq=SPI_FREQ,rst=RST,dc=DC,bl=BL,backend=backend)
+            if state.warm():
+                #Initialized by the splash or the previous run: a reset would blank it
+                disp.module_init()
+            else:
+                state.save(initialized=False)
+                disp.Init() # Initialize library.
+                state.save(initialized=True)
+            #Render/transmit thread on its own core, optionally real-time
+            cpusched.setup('display')
         #disp.clear() # Clear display.
-        bg = Image.new("RGB", (disp.width, disp.height), "BLACK")
-        draw = ImageDraw.Draw(bg)
-        # display with hardware SPI:
-        for i in range(180):
-            if (doInterrupt==1):
-                doInterrupt = 0
+        if backlightDuty != policy.backlight():
+            backlightDuty = policy.backlight()
+            disp.bl_Ramp(backlightDuty, 1.0)
+        if player.switch(folder) or state.emotion != emotion:
+            state.save(emotion=emotion)
+        governor.update()
+        if policy.fps(folder) * governor.scale() <= 0:
+            #Too dark to be watched or too hot: one static frame, then only wait for news
+            if shownFrame is None or shownFrame[0] != folder:
+                player.settle()
+                playing, i, hold = player.next()
+                pushFrame(playing, i)
+                shownFrame = (playing, i)
+            waitInput(1.0)
+            return
+        due = time.monotonic()
+        # display with hardware SPI, one pass of the loop segment
+        # (after the old outro and the new intro on a switch):
+        while True:
+            playing, i, hold = player.next()
+            pushFrame(playing, i)
+            shownFrame = (playing, i)
+            if playing == folder and player.count % STATE_EVERY == 0:
+                state.save(frame=i)
+            governor.update()
+            fps = policy.fps(playing) * governor.scale()
+            if fps <= 0:
+                #Got too hot to animate: hold this frame
+                return
+            #Pace to the policy's frame rate, a held frame stays up for several
+            #periods; no catching up after a slow frame
+            period = 1.0 / fps
+            due = max(due + period * hold, time.monotonic() - period)
+            if waitInput(due - time.monotonic()):
+                #A message is waiting: let main() read it, the player resumes after this frame
+                return
+            if player.at_boundary():
                 break
-            else:
-                image = Image.open(directory+'/emotion/'+emotion+'/frame'+str(i)+'.png')	
-                image = image.rotate(180)
-                disp.ShowImage(image)
         showOn = 0
-        disp.module_exit()
         logging.info("quit:")
-    except IOError as e:
+    except (IOError, ValueError) as e:
         logging.info(e)    
     except KeyboardInterrupt:
-        disp.module_exit()
+        if disp is not None:
+            disp.module_exit()
         logging.info("quit:")
         exit()
 
+def refreshSplash():
+    #Record the splash for the next boot if it is missing or out of date,
+    #away from the display core
+    cpusched.setup('background')
+    config = dict(rst=RST, dc=DC, bl=BL, bus=bus, device=device, speed=SPI_FREQ)
+    if not splash.current(**config):
+        try:
+            splash.build(**config)
+            logging.info("splash: recorded %s", splash.SPLASH_FILE)
+        except (IOError, ValueError) as e:
+            logging.warning("splash: not recorded (%s)", e)
+
+def startReloader():
+    #Compile the frames into panel bytes in the background and recompile
+    #the emotions whose files change; playback swaps at a loop boundary
+    cache = framecache.FrameCache(directory+'/emotion', encode=lambda image: disp.ImageBuffer(image.rotate(180)),
+                                  encoding=framecache.ENCODING)
+    framecache.Reloader(cache, player).start(setup=lambda: cpusched.setup('background'))
+
 def main():
-    global doInterrupt, showOn
-    previousData = 'happy'
-    show('happy')
+    global showOn, conn
+    previousData = state.emotion or 'happy'
+    threading.Thread(target=refreshSplash, name='splash', daemon=True).start()
+    try:
+        player.seek(EMOTIONS.get(previousData, previousData), state.frame)
+    except (IOError, ValueError) as e:
+        logging.info(e)
+    show(previousData)
+    if disp is not None:
+        startReloader()
     conn, addr = server.accept()
     conn.settimeout(0.1)
     while True:
         try:
             data = conn.recv(5).decode()
             #print(data)
-            if (previousData != data):
+            if not data:
+                #sensors.py went away, wait for it to reconnect
+                conn.close()
+                conn, addr = server.accept()
+                conn.settimeout(0.1)
+                continue
+            light = parse_light(data)
+            if light is not None:
+                level = policy.index
+                if policy.update(light) != level:
+                    logging.info("light %d%%: backlight %d%%, %s", light, policy.backlight(),
+                                 "static" if policy.static() else "%g fps" % policy.fps(EMOTIONS.get(previousData, previousData)))
+            elif (previousData != data):
                 print(data)
-                doInterrupt = 1
                 previousData = data
-                show(data)
+            #Straight back to the animation; waiting for the next recv()
+            #timeout would hold the frame for 0.1 s on every light report
+            show(previousData)
         except socket.timeout:
             if showOn!=1:
                 show(previousData) 
@@ -0,0 +1,149 @@
+"""
+multiads.py - Round-robin sampling of up to four ADS1115 boards
+
+A Pi can watch a whole shelf of plants with one ADS1115 per address
+0x48-0x4B (ADDR pin to GND, VDD, SDA, SCL), i.e. up to 16 inputs. Reads
+are pipelined across boards: every board is given a conversion to do
+before the first result is collected, and a board gets its next
+conversion as soon as its result is read, so the other boards keep
+converting while one is on the bus.
+
+Channels are named "<address>:<pin>", e.g. "0x49:2".
+
+Usage:
+    bus = RoundRobin(open_i2c(), [0x48, 0x49])
+    values = bus.read(['0x48:1', '0x48:2', '0x49:2'])
+    print(bus.throughput())
+"""
+
+import time
+import logging
+from collections import deque
+
+from adc import ADS, AnalogIn, Mode, start_conversion, read_conversion
+
+ADDRESSES = (0x48, 0x49, 0x4A, 0x4B)
+BURST_RATE = 860
+
+
+def parse_channel(channel):
+    """'0x49:2' -> (0x49, 2)"""
+    try:
+        address, pin = channel.split(':')
+        address, pin = int(address, 0), int(pin)
+    except ValueError:
+        raise ValueError('channel %r is not "<address>:<pin>"' % (channel,))
+    if address not in ADDRESSES:
+        raise ValueError('channel %r: ADS1115 address must be one of %s'
+                         % (channel, ', '.join('0x%02X' % a for a in ADDRESSES)))
+    if not 0 <= pin <= 3:
+        raise ValueError('channel %r: pin must be 0-3' % (channel,))
+    return address, pin
+
+
+class RoundRobin:
+    """
+    Pipelined reader for several ADS1115 boards on one bus.
+
+    Args:
+        i2c: Bus from adc.open_i2c()
+        addresses (list): Board addresses to open
+        data_rate (int): ADS1115 data rate for every board
+    """
+
+    def __init__(self, i2c, addresses, data_rate=128):
+        if len(set(addresses)) != len(addresses):
+            raise ValueError('duplicate ADS1115 address')
+        self.boards = {}
+        for address in addresses:
+            if address not in ADDRESSES:
+                raise ValueError('ADS1115 address 0x%02X not in 0x48-0x4B' % address)
+            self.boards[address] = ADS.ADS1115(i2c, data_rate=data_rate, address=address)
+        self.conversions = 0
+        self.errors = 0
+        self.busy = 0.0
+        self._start = time.monotonic()
+
+    def read(self, channels):
+        """
+        Convert the given channels, overlapping conversions on different boards.
+
+        A board that fails with an I2C error is skipped for the rest of the
+        round; its channels are missing from the result.
+
+        Returns:
+            dict: channel name -> signed raw value
+        """
+        queues = {}
+        for channel in channels:
+            address, pin = parse_channel(channel)
+            if address not in self.boards:
+                raise ValueError('channel %s is on a board that is not configured' % channel)
+            queues.setdefault(address, deque()).append((channel, pin))
+        results = {}
+        inflight = {}
+        started = time.monotonic()
+        for address, queue in queues.items():
+            self._start_next(address, queue, inflight)
+        while inflight:
+            for address in list(inflight):
+                channel = inflight.pop(address)
+                try:
+                    results[channel] = read_conversion(self.boards[address])
+                except OSError as e:
+                    self._failed(address, e)
+                    continue
+                self.conversions += 1
+                self._start_next(address, queues[address], inflight)
+        self.busy += time.monotonic() - started
+        return results
+
+    def _start_next(self, address, queue, inflight):
+        while queue:
+            channel, pin = queue.popleft()
+            try:
+                start_conversion(self.boards[address], pin)
+            except OSError as e:
+                self._failed(address, e)
+                return
+            inflight[address] = channel
+            return
+
+    def _failed(self, address, error):
+        self.errors += 1
+        logging.warning('ADS1115 0x%02X: %s', address, error)
+
+    def burst(self, channel, samples):
+        """
+        Read `samples` conversions of one channel in continuous mode at 860 SPS.
+
+        Returns:
+            tuple: (list of raw values, elapsed seconds)
+        """
+        address, pin = parse_channel(channel)
+        ads = self.boards[address]
+        data_rate = ads.data_rate
+        ads.mode = Mode.CONTINUOUS
+        ads.data_rate = BURST_RATE
+        chan = AnalogIn(ads, pin)
+        values = []
+        period = 1.0 / BURST_RATE
+        start = time.perf_counter()
+        next_read = start
+        try:
+            for _ in range(samples):
+                values.append(chan.value)
+                next_read += period
+                delay = next_read - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            ads.mode = Mode.SINGLE
+            ads.data_rate = data_rate
+        self.conversions += samples
+        return values, time.perf_counter() - start
+
+    def throughput(self):
+        """(conversions per second since start, fraction of time spent reading, errors)"""
+        elapsed = max(time.monotonic() - self._start, 1e-9)
+        return self.conversions / elapsed, self.busy / elapsed, self.errors
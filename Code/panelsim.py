@@ -0,0 +1,301 @@
+"""
+panelsim.py - Software model of the ST7789/ST7735-family LCD controllers
+
+Consumes the byte stream and DC-line transitions a driver in lib/ emits and
+rebuilds the controller's frame memory as a NumPy array, so changes to
+ShowImage, SetWindows or Init can be checked pixel for pixel without a
+panel. Interpreted commands:
+
+    0x01 SWRESET  0x2A CASET  0x2B RASET  0x2C RAMWR  0x3C RAMWRC
+    0x36 MADCTL (MY, MX, MV, BGR)  0x3A COLMOD (12, 16 and 18 bit/pixel)
+    0x20/0x21 inversion, 0x28/0x29 display off/on, 0x10/0x11 sleep
+
+Every command is recorded with its parameters (log()), so an Init sequence
+can be compared byte for byte as well. `frames` counts completely written
+address windows.
+
+The frame memory is `ram`, an (rows, columns, 3) uint8 RGB array in the
+controller's native orientation (portrait for the 240x320 ST7789).
+Pixels written outside the memory are counted in `clipped`.
+
+Usage:
+    panel = Panel.for_driver('LCD_2inch')
+    panel.dc(0); panel.write([0x2C])          # what command() does
+    panel.dc(1); panel.write(pixel_bytes)     # what ShowImage() does
+    assert (panel.ram == expected).all()
+
+    spi = panel.spi()                          # SpiDev stand-in
+    spi.writebytes([0x2C])                     # DC state from panel.pin()
+"""
+
+import numpy as np
+
+# Frame memory (columns, rows) of the controller behind each driver in lib/
+CONTROLLERS = {
+    'ST7789': (240, 320),
+    'ST7735': (132, 162),
+    'ILI9341': (240, 320),
+    'GC9A01': (240, 240),
+}
+DRIVERS = {
+    'LCD_0inch96': 'ST7735',
+    'LCD_1inch14': 'ST7789',
+    'LCD_1inch28': 'GC9A01',
+    'LCD_1inch3': 'ST7789',
+    'LCD_1inch47': 'ST7789',
+    'LCD_1inch54': 'ST7789',
+    'LCD_1inch8': 'ST7735',
+    'LCD_2inch': 'ST7789',
+    'LCD_2inch4': 'ILI9341',
+}
+
+MY = 0x80
+MX = 0x40
+MV = 0x20
+BGR = 0x08
+
+# COLMOD low nibble -> bits per pixel
+_PIXEL_FORMATS = {0x3: 12, 0x5: 16, 0x6: 18}
+
+
+def rgb565(image):
+    """RGB888 array -> the RGB888 a 16 bit/pixel panel shows for it (reference output)."""
+    img = np.asarray(image, dtype=np.uint8)[..., :3]
+    out = np.empty_like(img)
+    for c, bits in enumerate((5, 6, 5)):
+        v = img[..., c] >> (8 - bits)
+        out[..., c] = (v << (8 - bits)) | (v >> (2 * bits - 8))
+    return out
+
+
+class Panel:
+    """
+    One LCD controller fed through its SPI and DC lines.
+
+    Args:
+        columns (int): Frame memory width
+        rows (int): Frame memory height
+        name (str): Controller name, for messages
+    """
+
+    def __init__(self, columns=240, rows=320, name='ST7789'):
+        self.columns = columns
+        self.rows = rows
+        self.name = name
+        self.ram = np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.dc_level = 0
+        self.dc_toggles = 0
+        self.bytes = 0
+        self.transfers = 0
+        self.commands = []
+        self.clipped = 0
+        self.pixels = 0
+        self.frames = 0
+        self.reset()
+
+    @classmethod
+    def for_driver(cls, driver):
+        """Panel behind a lib/ driver, by module or class name ('LCD_2inch')."""
+        name = DRIVERS[getattr(driver, '__name__', driver).rsplit('.', 1)[-1]]
+        columns, rows = CONTROLLERS[name]
+        return cls(columns, rows, name)
+
+    def reset(self):
+        """Hardware or software reset: registers to their defaults, memory kept."""
+        self.madctl = 0
+        self.bpp = 18
+        self.inverted = False
+        self.display_on = False
+        self.sleeping = True
+        self.caset = (0, self.columns - 1)
+        self.raset = (0, self.rows - 1)
+        self._cmd = None
+        self._params = bytearray()
+        self._writing = False
+        self._pending = b''
+        self._pos = 0
+
+    # -- wire level ---------------------------------------------------------
+
+    def dc(self, level):
+        """Drive the DC line (0 = command, 1 = data)."""
+        level = 1 if level else 0
+        if level != self.dc_level:
+            self.dc_toggles += 1
+            self.dc_level = level
+
+    def pin(self, role, level):
+        """GPIO hook: role 'dc' or 'rst' (reset on the falling edge)."""
+        if role == 'dc':
+            self.dc(level)
+        elif role == 'rst' and not level:
+            self.reset()
+
+    def write(self, data):
+        """Bytes clocked in on MOSI while CS is low."""
+        try:
+            data = bytes(data)
+        except ValueError:
+            # spidev keeps the low byte of larger ints (LCD_1inch8.clear sends 0xFFFF)
+            data = bytes(v & 0xFF for v in data)
+        self.transfers += 1
+        self.bytes += len(data)
+        if self.dc_level == 0:
+            for cmd in data:
+                self._command(cmd)
+        elif self._writing:
+            self._memory_write(data)
+        else:
+            self._params.extend(data)
+            self._parameters()
+
+    def spi(self):
+        """SpiDev stand-in that writes into this panel."""
+        return PanelSPI(self)
+
+    # -- command interpreter -----------------------------------------------
+
+    def _command(self, cmd):
+        self._writing = False
+        self._pending = b''
+        self._cmd = cmd
+        self._params = bytearray()
+        self.commands.append((cmd, self._params))
+        if cmd == 0x01:
+            self.reset()
+        elif cmd in (0x2C, 0x3C):
+            # RAMWR restarts at the window origin, RAMWRC continues
+            self._writing = True
+            if cmd == 0x2C:
+                self._pos = 0
+        elif cmd in (0x20, 0x21):
+            self.inverted = cmd == 0x21
+        elif cmd in (0x28, 0x29):
+            self.display_on = cmd == 0x29
+        elif cmd in (0x10, 0x11):
+            self.sleeping = cmd == 0x10
+
+    def _parameters(self):
+        p = self._params
+        if self._cmd == 0x2A and len(p) >= 4:
+            self.caset = ((p[0] << 8) | p[1], (p[2] << 8) | p[3])
+        elif self._cmd == 0x2B and len(p) >= 4:
+            self.raset = ((p[0] << 8) | p[1], (p[2] << 8) | p[3])
+        elif self._cmd == 0x36 and p:
+            self.madctl = p[0]
+        elif self._cmd == 0x3A and p:
+            self.bpp = _PIXEL_FORMATS.get(p[0] & 0x7, self.bpp)
+
+    def log(self):
+        """Commands seen so far as (command, parameter bytes); pixel data is not kept."""
+        return [(cmd, bytes(params)) for cmd, params in self.commands]
+
+    # -- frame memory -------------------------------------------------------
+
+    def window(self):
+        """(x0, y0, x1, y1) of the current address window, inclusive."""
+        return self.caset[0], self.raset[0], self.caset[1], self.raset[1]
+
+    def _decode(self, data):
+        """Bytes -> (n, 3) RGB888 for the current pixel format; leftovers kept."""
+        data = self._pending + data
+        if self.bpp == 16:
+            n = len(data) // 2
+            self._pending = data[2 * n:]
+            w = np.frombuffer(data[:2 * n], dtype='>u2').astype(np.uint16)
+            rgb = np.stack(((w >> 11) & 0x1F, (w >> 5) & 0x3F, w & 0x1F), axis=-1).astype(np.uint16)
+            rgb[:, 0] = (rgb[:, 0] << 3) | (rgb[:, 0] >> 2)
+            rgb[:, 1] = (rgb[:, 1] << 2) | (rgb[:, 1] >> 4)
+            rgb[:, 2] = (rgb[:, 2] << 3) | (rgb[:, 2] >> 2)
+        elif self.bpp == 18:
+            n = len(data) // 3
+            self._pending = data[3 * n:]
+            b = np.frombuffer(data[:3 * n], dtype=np.uint8).reshape(n, 3).astype(np.uint16) & 0xFC
+            rgb = b | (b >> 6)
+        else:
+            # 12 bit: two pixels in three bytes
+            n = len(data) // 3 * 2
+            self._pending = data[n // 2 * 3:]
+            b = np.frombuffer(data[:n // 2 * 3], dtype=np.uint8).reshape(-1, 3).astype(np.uint16)
+            nib = np.stack((b[:, 0] >> 4, b[:, 0] & 0xF, b[:, 1] >> 4,
+                            b[:, 1] & 0xF, b[:, 2] >> 4, b[:, 2] & 0xF), axis=-1).reshape(n, 3)
+            rgb = nib | (nib << 4)
+        rgb = rgb.astype(np.uint8)
+        if self.madctl & BGR:
+            rgb = rgb[:, ::-1]
+        return rgb
+
+    def _memory_write(self, data):
+        rgb = self._decode(data)
+        n = len(rgb)
+        if n == 0:
+            return
+        x0, y0, x1, y1 = self.window()
+        width = x1 - x0 + 1
+        height = y1 - y0 + 1
+        if width <= 0 or height <= 0:
+            self.clipped += n
+            return
+        # Past the end of the window the address counter wraps to the start.
+        index = (self._pos + np.arange(n)) % (width * height)
+        self.frames += (self._pos + n) // (width * height)
+        self._pos = (self._pos + n) % (width * height)
+        self.pixels += n
+        x = x0 + index % width
+        y = y0 + index // width
+        mv = self.madctl & MV
+        # Logical address space: columns x rows, swapped by MV.
+        lw, lh = (self.rows, self.columns) if mv else (self.columns, self.rows)
+        if self.madctl & MX:
+            x = lw - 1 - x
+        if self.madctl & MY:
+            y = lh - 1 - y
+        row, col = (x, y) if mv else (y, x)
+        inside = (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.columns)
+        if not inside.all():
+            self.clipped += int(n - inside.sum())
+            row, col, rgb = row[inside], col[inside], rgb[inside]
+        self.ram[row, col] = rgb
+
+    def image(self):
+        """
+        Frame memory as shown on the glass (inversion applied), native orientation.
+
+        Returns:
+            numpy.ndarray: (rows, columns, 3) uint8
+        """
+        return ~self.ram if self.inverted else self.ram.copy()
+
+    def stats(self):
+        return {
+            'controller': self.name,
+            'bytes': self.bytes,
+            'transfers': self.transfers,
+            'dc_toggles': self.dc_toggles,
+            'commands': len(self.commands),
+            'pixels': self.pixels,
+            'frames': self.frames,
+            'clipped': self.clipped,
+        }
+
+
+class PanelSPI:
+    """spidev.SpiDev stand-in feeding a Panel (DC comes from Panel.dc/pin)."""
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.max_speed_hz = 0
+        self.mode = 0
+
+    def writebytes(self, data):
+        self.panel.write(data)
+
+    def writebytes2(self, data):
+        self.panel.write(data)
+
+    def xfer2(self, data):
+        self.panel.write(data)
+        return [0] * len(data)
+
+    def close(self):
+        pass
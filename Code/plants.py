@@ -0,0 +1,171 @@
+"""
+plants.py - Per-plant sensor state for one or more planters
+
+plants.json maps ADS1115 inputs to plants. Each plant has its own
+calibration profile, rule engine, moisture trend and history store, and
+optionally a display server to send its emotions to:
+
+    {
+        "boards": ["0x48", "0x49"],
+        "plants": [
+            {"name": "basil", "server": "0.0.0.0:1013",
+             "channels": {"light": "0x48:3", "moisture": "0x48:2", "temperature": "0x48:1"}},
+            {"name": "mint", "calibration": "calibration-mint.json",
+             "channels": {"light": "0x48:3", "moisture": "0x49:0", "temperature": "0x48:1"}}
+        ]
+    }
+
+Plants on the same shelf may share the light and temperature inputs; a
+shared input is read once per round. An optional "stats" object is passed
+to plantstats.PlantStats (e.g. {"ppfd_full_scale": 1500, "temp_high": 28}).
+"""
+
+import os
+import json
+import time
+
+from rules import RuleEngine
+from trend import MoistureTrend
+from tsdb import TimeSeriesStore, RAW, TIERS, OPEN_BUCKETS
+from plantstats import PlantStats
+from multiads import parse_channel
+from thresholds import convert, load_calibration
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANTS_FILE = os.path.join(CODE_DIR, 'plants.json')
+HISTORY_DIR = os.path.join(CODE_DIR, 'history')
+ROLES = ('light', 'moisture', 'temperature')
+
+
+class Plant:
+    """
+    Readings, emotion state and history of one plant.
+
+    Args:
+        name (str): Plant name, also the history directory under history/
+        channels (dict): role (light/moisture/temperature) -> "<address>:<pin>"
+        calibration (dict): Profile from thresholds.load_calibration()
+        server (tuple): (host, port) of the display server, or None
+        stats (dict): Keyword arguments for PlantStats
+    """
+
+    def __init__(self, name, channels, calibration, server=None, stats=None):
+        missing = [role for role in ROLES if role not in channels]
+        if missing:
+            raise ValueError('plant %s: no channel for %s' % (name, ', '.join(missing)))
+        for channel in channels.values():
+            parse_channel(channel)
+        self.name = name
+        self.channels = channels
+        self.calibration = calibration
+        self.server = server
+        self.engine = RuleEngine.from_file()
+        self.trend = MoistureTrend()
+        self.history = TimeSeriesStore(os.path.join(HISTORY_DIR, name), channels=('ldr', 'moisture', 'temperature'))
+        self.stats = PlantStats(name, **(stats or {}))
+        self.stats_path = os.path.join(CODE_DIR, 'stats', name + '.json')
+        self.light = self.moisture = self.temperature = None
+
+    @classmethod
+    def from_config(cls, entry):
+        calibration = entry.get('calibration')
+        if calibration is not None:
+            calibration = load_calibration(os.path.join(CODE_DIR, calibration))
+        else:
+            calibration = load_calibration()
+        server = entry.get('server')
+        if server is not None:
+            host, port = server.rsplit(':', 1)
+            server = (host, int(port))
+        return cls(entry['name'], entry['channels'], calibration, server, entry.get('stats'))
+
+    def update(self, raw, due, now):
+        """
+        Process one round of readings.
+
+        Args:
+            raw (dict): channel -> latest raw value (all of this plant's channels)
+            due (collection): Channels read this round
+            now (float): time.monotonic() of the round
+
+        Returns:
+            str: New emotion message for this plant, or None
+        """
+        ldr = raw[self.channels['light']]
+        moisture = raw[self.channels['moisture']]
+        lm35 = raw[self.channels['temperature']]
+        wall = time.time()
+        self.history.append(wall, (ldr, moisture, lm35))
+        self.light, self.moisture, self.temperature = convert(ldr, moisture, lm35, self.calibration)
+        self.stats.update(wall, self.light, self.moisture, self.temperature)
+        if self.channels['moisture'] in due:
+            self.trend.update(now, self.moisture)
+        return self.engine.update({'light': self.light, 'moisture': self.moisture, 'temperature': self.temperature,
+                                   'moisture_slope': self.trend.slope})
+
+    def write_stats(self):
+        """Publish today's metrics to stats/<name>.json for the display and telemetry."""
+        os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+        self.stats.write(self.stats_path)
+
+    def close(self):
+        """Write buffered history (and its open rollups) to disk."""
+        self.history.close()
+
+
+def read_config(path=PLANTS_FILE):
+    """
+    Read and check plants.json without opening any plant state.
+
+    Returns:
+        tuple: (list of board addresses, list of plant entries)
+    """
+    with open(path) as f:
+        config = json.load(f)
+    boards = [int(address, 0) for address in config.get('boards', ['0x48'])]
+    entries = config['plants']
+    names = [entry['name'] for entry in entries]
+    if len(set(names)) != len(names):
+        raise ValueError('plant names must be unique')
+    for entry in entries:
+        for channel in entry['channels'].values():
+            if parse_channel(channel)[0] not in boards:
+                raise ValueError('plant %s uses %s but that board is not in "boards"' % (entry['name'], channel))
+    return boards, entries
+
+
+def channel_roles(entries):
+    """channel -> sensor type (light/moisture/temperature) over all plants (entries or Plant objects)."""
+    roles = {}
+    for entry in entries:
+        channels = entry.channels if isinstance(entry, Plant) else entry['channels']
+        for role, channel in channels.items():
+            roles[channel] = role
+    return roles
+
+
+def load_plants(path=PLANTS_FILE):
+    """
+    Read plants.json and set up every plant.
+
+    Returns:
+        tuple: (list of board addresses, list of Plant)
+    """
+    boards, entries = read_config(path)
+    adopt_history(entries[0]['name'])
+    return boards, [Plant.from_config(entry) for entry in entries]
+
+
+def adopt_history(name, root=HISTORY_DIR):
+    """
+    Move a single-plant history (history/raw, history/1m, ...) from before
+    plants.json into history/<name>/, unless that plant has its own already.
+    """
+    target = os.path.join(root, name)
+    tiers = [tier for tier in (RAW,) + TIERS if os.path.isdir(os.path.join(root, tier))]
+    if not tiers or name in tiers or os.path.isdir(target):
+        return False
+    os.makedirs(target)
+    for tier in tiers + ([OPEN_BUCKETS] if os.path.exists(os.path.join(root, OPEN_BUCKETS)) else []):
+        os.rename(os.path.join(root, tier), os.path.join(target, tier))
+    return True
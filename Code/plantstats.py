@@ -0,0 +1,196 @@
+"""
+plantstats.py - Streaming daily plant metrics
+
+Every sample updates O(1) accumulators per channel; nothing is stored or
+rescanned. At local midnight the day is closed and kept in a short list
+of previous days. Per channel:
+
+    count, min, max, mean, variance (Welford), time integral (trapezoid),
+    time spent above/below configured limits
+
+and per plant:
+
+    dli             daily light integral in mol/m2/day, estimated from the
+                    LDR percentage with ppfd_full_scale (umol/m2/s at 100%)
+    hot_hours       hours above temp_high, hot_degree_hours the integral
+    cold_hours      of the excess; the same below temp_low
+    wet_cycles      dry -> wet transitions of the moisture (waterings)
+
+Gaps longer than max_gap (sensors.py not running) are not integrated.
+
+Usage:
+    stats = PlantStats('fyto')
+    stats.update(time.time(), light_percent, moisture_percent, temperature)
+    stats.snapshot()        # dict for the display / telemetry
+    stats.write(path)       # same, as JSON written atomically
+"""
+
+import os
+import json
+import time
+import math
+from collections import deque
+
+
+class ChannelStats:
+    """
+    O(1) accumulators of one channel for the current day.
+
+    Args:
+        above (tuple): Limits whose dwell time above is tracked
+        below (tuple): Limits whose dwell time below is tracked
+        max_gap (float): Longest interval (s) integrated between two samples
+    """
+
+    def __init__(self, above=(), below=(), max_gap=300.0):
+        self.above = tuple(above)
+        self.below = tuple(below)
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.integral = 0.0
+        self.time = 0.0
+        self.time_above = [0.0] * len(self.above)
+        self.time_below = [0.0] * len(self.below)
+        self.excess_above = [0.0] * len(self.above)
+        self.excess_below = [0.0] * len(self.below)
+        self.last = None
+
+    def update(self, t, x):
+        self.count += 1
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.last is not None:
+            lt, lx = self.last
+            dt = t - lt
+            if 0 < dt <= self.max_gap:
+                self.time += dt
+                self.integral += 0.5 * (x + lx) * dt
+                # Dwell times hold the previous sample's state over the interval
+                for i, limit in enumerate(self.above):
+                    if lx > limit:
+                        self.time_above[i] += dt
+                        self.excess_above[i] += (lx - limit) * dt
+                for i, limit in enumerate(self.below):
+                    if lx < limit:
+                        self.time_below[i] += dt
+                        self.excess_below[i] += (limit - lx) * dt
+        self.last = (t, x)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': round(self.mean, 2),
+            'stddev': round(math.sqrt(self.variance), 2),
+            'integral': round(self.integral, 1),
+            'seconds': round(self.time, 1),
+            'above': {str(limit): round(self.time_above[i], 1) for i, limit in enumerate(self.above)},
+            'below': {str(limit): round(self.time_below[i], 1) for i, limit in enumerate(self.below)},
+        }
+
+
+class PlantStats:
+    """
+    Daily metrics of one plant.
+
+    Args:
+        name (str): Plant name
+        ppfd_full_scale (float): PPFD (umol/m2/s) that reads as 100% light
+        temp_high (float): Hot limit in C
+        temp_low (float): Cold limit in C
+        dry (float): Moisture % below which the soil counts as dry
+        wet (float): Moisture % above which dry soil counts as watered
+        days (int): Number of closed days to keep
+    """
+
+    def __init__(self, name, ppfd_full_scale=1000.0, temp_high=30.0, temp_low=22.0, dry=10.0, wet=50.0,
+                 days=7, max_gap=300.0):
+        self.name = name
+        self.ppfd_full_scale = ppfd_full_scale
+        self.temp_high = temp_high
+        self.temp_low = temp_low
+        self.dry = dry
+        self.wet = wet
+        self.light = ChannelStats(max_gap=max_gap)
+        self.moisture = ChannelStats(below=(dry,), max_gap=max_gap)
+        self.temperature = ChannelStats(above=(temp_high,), below=(temp_low,), max_gap=max_gap)
+        self.history = deque(maxlen=days)
+        self.day = None
+        self.wet_cycles = 0
+        self.soil_dry = None
+
+    def update(self, t, light, moisture, temperature):
+        """
+        Add one sample.
+
+        Args:
+            t (float): Unix time
+            light (float): Light %
+            moisture (float): Moisture %
+            temperature (float): Temperature in C
+        """
+        day = time.strftime('%Y-%m-%d', time.localtime(t))
+        if day != self.day:
+            if self.day is not None:
+                self.history.append(self.snapshot())
+                for channel in (self.light, self.moisture, self.temperature):
+                    channel.reset()
+                self.wet_cycles = 0
+            self.day = day
+        self.light.update(t, light)
+        self.moisture.update(t, moisture)
+        self.temperature.update(t, temperature)
+        # Dry/wet cycle with hysteresis between the two limits
+        if moisture < self.dry:
+            self.soil_dry = True
+        elif moisture > self.wet:
+            if self.soil_dry:
+                self.wet_cycles += 1
+            self.soil_dry = False
+
+    @property
+    def dli(self):
+        """Daily light integral so far, mol/m2/day."""
+        # integral is in %*s; % -> umol/m2/s, then umol -> mol
+        return self.light.integral / 100.0 * self.ppfd_full_scale / 1e6
+
+    def snapshot(self):
+        """Current day's metrics as a plain dict."""
+        return {
+            'plant': self.name,
+            'date': self.day,
+            'dli': round(self.dli, 2),
+            'hot_hours': round(self.temperature.time_above[0] / 3600.0, 2),
+            'hot_degree_hours': round(self.temperature.excess_above[0] / 3600.0, 2),
+            'cold_hours': round(self.temperature.time_below[0] / 3600.0, 2),
+            'cold_degree_hours': round(self.temperature.excess_below[0] / 3600.0, 2),
+            'dry_hours': round(self.moisture.time_below[0] / 3600.0, 2),
+            'wet_cycles': self.wet_cycles,
+            'light': self.light.snapshot(),
+            'moisture': self.moisture.snapshot(),
+            'temperature': self.temperature.snapshot(),
+        }
+
+    def write(self, path):
+        """Write {'today': ..., 'days': [...]} as JSON, replacing the file atomically."""
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'today': self.snapshot(), 'days': list(self.history)}, f, indent=1)
+        os.replace(tmp, path)
@@ -0,0 +1,166 @@
+"""
+publisher.py - Emotion publisher that survives display server restarts
+
+sensors.py used to connect to main.py once at startup: it crashed if the
+display server was not up yet, and a failed send killed sampling. A
+Publisher instead runs as an asyncio task next to the sampling loop.
+publish() never blocks or raises; it queues the message in a small bounded
+backlog. While connected the task writes the backlog in order. While the
+connection is down it retries with exponential backoff (with jitter), and
+after reconnecting only the newest state of each kind is sent (the last
+published emotion and light level, also when they were already delivered
+before the display server restarted), since the display only cares about
+the current ones. Messages that were replaced or pushed out of the backlog
+are counted as dropped.
+
+Usage:
+    publisher = Publisher(('127.0.0.1', 1013), name='fyto')
+    asyncio.create_task(publisher.run())
+    publisher.publish('thirs')
+    publisher.publish('L042%', key='light')
+    print(publisher.stats())
+"""
+
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+
+
+class Publisher:
+    """
+    Send emotion messages to one display server, reconnecting as needed.
+
+    Args:
+        server (tuple): (host, port) of the display server
+        name (str): Used in log messages
+        backlog (int): Messages kept while the writer is behind or disconnected
+        min_backoff (float): First retry delay in seconds
+        max_backoff (float): Longest retry delay in seconds
+        connect_timeout (float): Give up on a connection attempt after this long
+    """
+
+    def __init__(self, server, name=None, backlog=8, min_backoff=0.5, max_backoff=30.0, connect_timeout=5.0):
+        self.server = server
+        self.name = name or '%s:%d' % server
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.backlog = deque(maxlen=backlog)
+        self.states = {}
+        self.connected = False
+        self.sent = 0
+        self.dropped = 0
+        self.connects = 0
+        self.failures = 0
+        self.reconnect_times = []
+        self.down_since = time.monotonic()
+        self._wakeup = None
+        self._writer = None
+
+    def publish(self, message, key='emotion'):
+        """
+        Queue a message; never blocks. key names the state it belongs to,
+        the newest one per key is re-sent after a reconnect.
+
+        Returns:
+            bool: False if an older message was dropped
+        """
+        full = len(self.backlog) == self.backlog.maxlen
+        if full:
+            self.dropped += 1
+        self.backlog.append(message)
+        self.states[key] = message
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return not full
+
+    def stats(self):
+        """Connection state, counters and reconnect times in seconds."""
+        times = self.reconnect_times
+        return {
+            'connected': self.connected,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'queued': len(self.backlog),
+            'connects': self.connects,
+            'failures': self.failures,
+            'reconnect_last': times[-1] if times else None,
+            'reconnect_max': max(times) if times else None,
+            'reconnect_mean': sum(times) / len(times) if times else None,
+        }
+
+    async def run(self):
+        """Connect, send and reconnect forever; cancel the task to stop."""
+        self._wakeup = asyncio.Event()
+        delay = self.min_backoff
+        attempts = 0
+        try:
+            while True:
+                try:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(*self.server), self.connect_timeout)
+                except (OSError, asyncio.TimeoutError) as error:
+                    self.failures += 1
+                    attempts += 1
+                    if attempts == 1 or delay >= self.max_backoff:
+                        logging.warning('%s: display server unavailable (%s), retrying', self.name, error)
+                    await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                    delay = min(delay * 2, self.max_backoff)
+                    continue
+                delay = self.min_backoff
+                attempts = 0
+                self._connected(writer)
+                try:
+                    await self._serve(reader, writer)
+                except (OSError, ConnectionError) as error:
+                    logging.warning('%s: connection lost (%s)', self.name, error)
+                finally:
+                    self._disconnected()
+        finally:
+            self._disconnected()
+
+    def _connected(self, writer):
+        self.reconnect_times.append(time.monotonic() - self.down_since)
+        del self.reconnect_times[:-100]
+        self.connects += 1
+        self.connected = True
+        self._writer = writer
+        logging.info('%s: connected to %s:%d after %.2f s', self.name, self.server[0], self.server[1],
+                     self.reconnect_times[-1])
+        # Only the newest state of each kind matters to a display that just (re)appeared.
+        self.dropped += max(0, len(self.backlog) - len(self.states))
+        self.backlog.clear()
+        self.backlog.extend(self.states.values())
+
+    def _disconnected(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        self.connected = False
+        self.down_since = time.monotonic()
+
+    async def _serve(self, reader, writer):
+        # main.py never writes back, so a completed read means it went away.
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            while True:
+                while self.backlog:
+                    message = self.backlog[0]
+                    writer.write(bytes(message, 'utf-8'))
+                    await writer.drain()
+                    # Sent; it may already have been pushed out by a publish()
+                    if self.backlog and self.backlog[0] is message:
+                        self.backlog.popleft()
+                    self.sent += 1
+                self._wakeup.clear()
+                wakeup = asyncio.ensure_future(self._wakeup.wait())
+                await asyncio.wait((wakeup, closed), return_when=asyncio.FIRST_COMPLETED)
+                wakeup.cancel()
+                if closed.done():
+                    closed.result()
+                    raise ConnectionResetError('closed by peer')
+        finally:
+            closed.cancel()
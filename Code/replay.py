@@ -0,0 +1,233 @@
+"""
+replay.py - Replay recorded sensor readings through the emotion thresholds
+
+Feeds recorded readings through the same emotion rules sensors.py uses
+(rules.RuleEngine with rules.json) and sends the resulting messages to the display
+server, so a sensor sequence can be reproduced without the hardware.
+
+Sources:
+    - a tsdb history directory (--store history/fyto --since 24)
+    - a CSV file as written by `python3 tsdb.py history` (raw ADC values)
+    - a sensors.py log: telemetry.py records (line or JSON format), or the
+      older "Temperature = ..." console lines. Those may start with a Unix
+      timestamp (journalctl -o short-unix), otherwise samples are spaced
+      --interval seconds apart.
+
+Usage:
+    python3 replay.py yesterday.csv                 # real time
+    python3 replay.py yesterday.csv --speed 60      # 60x faster
+    python3 replay.py --store history/fyto --since 24 --speed 0   # as fast as possible
+    python3 replay.py sensors.log --dry-run         # only print the report
+
+Stop sensors.py first: main.py serves a single sensor connection.
+"""
+
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+from collections import Counter
+
+from rules import RuleEngine
+from trend import MoistureTrend
+from thresholds import EMOTIONS, convert, load_calibration
+
+_LOG_FIELDS = (
+    ('temperature', re.compile(r'Temperature =\s*(-?\d+)')),
+    ('ldr', re.compile(r'Light Intensity =\s*(-?\d+)')),
+    ('moisture', re.compile(r'Moisture % =\s*(-?\d+)')),
+)
+_LOG_TIME = re.compile(r'^\s*(\d+(?:\.\d+)?)\s')
+_TELEMETRY = re.compile(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d) \S+ n=\d+ light=(-?[\d.]+)\S* '
+                        r'moisture=(-?[\d.]+)\S* temperature=(-?[\d.]+)')
+
+
+def _telemetry_record(line):
+    """Return (time, light, moisture, temperature) of a telemetry.py record, or None."""
+    m = _TELEMETRY.search(line)
+    if m is not None:
+        stamp = m.group(1)
+        values = m.group(2, 3, 4)
+    elif '{' in line:
+        try:
+            record = json.loads(line[line.index('{'):])
+            stamp = record['time']
+            values = record['light'], record['moisture'], record['temperature']
+        except (ValueError, KeyError, TypeError):
+            return None
+    else:
+        return None
+    t = time.mktime(time.strptime(stamp, '%Y-%m-%dT%H:%M:%S'))
+    return (t,) + tuple(int(float(v)) for v in values)
+
+
+def read_csv(path, calibration):
+    """Yield (time, light %, moisture %, temperature) from a raw-value CSV dump."""
+    with open(path) as f:
+        header = None
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            cols = line.split(',')
+            if header is None:
+                header = cols
+                continue
+            row = dict(zip(header, cols))
+            yield (float(row['time']),) + convert(int(row['ldr']), int(row['moisture']), int(row['temperature']), calibration)
+
+
+def read_log(path, interval=1.0):
+    """Yield (time, light %, moisture %, temperature) from sensors.py output."""
+    sample = {}
+    t = None
+    n = 0
+    with open(path, errors='replace') as f:
+        for line in f:
+            record = _telemetry_record(line)
+            if record is not None:
+                yield record
+                n += 1
+                continue
+            for name, pattern in _LOG_FIELDS:
+                m = pattern.search(line)
+                if m is None:
+                    continue
+                sample[name] = int(m.group(1))
+                stamp = _LOG_TIME.match(line)
+                if stamp is not None:
+                    t = float(stamp.group(1))
+                if name == 'moisture' and len(sample) == 3:
+                    yield (t if t is not None else n * interval,
+                           sample['ldr'], sample['moisture'], sample['temperature'])
+                    sample = {}
+                    n += 1
+                break
+
+
+def read_store(path, since, calibration):
+    """Yield (time, light %, moisture %, temperature) from a tsdb history directory."""
+    from tsdb import TimeSeriesStore
+    store = TimeSeriesStore(path, channels=('ldr', 'moisture', 'temperature'))
+    end = time.time() + 1
+    for t, values in store.query(end - since * 3600, end):
+        yield (t,) + convert(*values, calibration=calibration)
+
+
+class Replay:
+    """
+    Drive the rule engine with recorded readings and pace the output.
+
+    Args:
+        send (callable): Called with each message string, or None for a dry run
+        speed (float): 1 = real time, N = N times faster, 0 = as fast as possible
+        engine (RuleEngine): Rules to replay through (default rules.json)
+    """
+
+    def __init__(self, send=None, speed=1.0, engine=None):
+        self.send = send
+        self.speed = speed
+        self.engine = engine or RuleEngine.from_file()
+        self.trend = MoistureTrend()
+        self.timeline = []      # (sample time, message)
+        self.samples = 0
+        self.switches = 0
+        self.shown = 'happy'    # main.py starts on happy
+        self.elapsed = 0.0      # wall time of the last run()
+        self.span = 0.0         # sample time it covered
+
+    def run(self, readings):
+        start_wall = None
+        first = last = None
+        try:
+            for t, ldr, moisture, temperature in readings:
+                if first is None:
+                    first = t
+                    start_wall = time.monotonic()
+                if self.speed > 0:
+                    delay = start_wall + (t - first) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                last = t
+                self.samples += 1
+                slope = self.trend.update(t, moisture)
+                message = self.engine.update({'light': ldr, 'moisture': moisture, 'temperature': temperature,
+                                              'moisture_slope': slope}, t)
+                if message is None:
+                    continue
+                self.timeline.append((t, message))
+                # main.py only restarts the animation when the message changes
+                if message != self.shown:
+                    self.switches += 1
+                    self.shown = message
+                if self.send is not None:
+                    self.send(message)
+        finally:
+            # Also after Ctrl-C, so report() covers what was replayed
+            self.elapsed = time.monotonic() - start_wall if start_wall is not None else 0.0
+            self.span = (last - first) if first is not None else 0.0
+
+    def report(self, out=sys.stdout, timeline=True):
+        if timeline and self.timeline:
+            first = self.timeline[0][0]
+            print('Emotion timeline:', file=out)
+            for t, message in self.timeline:
+                print('  %s  +%9.1fs  %s -> %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t)),
+                                                 t - first, message, EMOTIONS.get(message, message)), file=out)
+        counts = Counter(message for _, message in self.timeline)
+        print('Samples replayed: %d (%.1f s of data in %.2f s wall time)' % (self.samples, self.span, self.elapsed), file=out)
+        if self.elapsed > 0:
+            print('Throughput: %.0f samples/s, %.1fx real time' % (self.samples / self.elapsed, self.span / self.elapsed), file=out)
+        print('Messages sent: %d, display switches: %d' % (len(self.timeline), self.switches), file=out)
+        for message, count in counts.most_common():
+            print('  %-8s %d' % (EMOTIONS.get(message, message), count), file=out)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Replay recorded Fyto sensor readings')
+    parser.add_argument('source', nargs='?', help='CSV dump or sensors.py log file')
+    parser.add_argument('--store', help='tsdb history directory to replay instead of a file')
+    parser.add_argument('--since', type=float, default=24, help='hours of history to replay from --store')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed-up factor, 0 = as fast as possible')
+    parser.add_argument('--interval', type=float, default=1.0, help='sample spacing for logs without timestamps')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1013)
+    parser.add_argument('--rules', help='rules file (default rules.json)')
+    parser.add_argument('--calibration', help='calibration profile for raw values (default calibration.json)')
+    parser.add_argument('--dry-run', action='store_true', help='do not connect to the display server')
+    parser.add_argument('--no-timeline', action='store_true')
+    args = parser.parse_args(argv)
+
+    calibration = load_calibration(args.calibration) if args.calibration else load_calibration()
+    if args.store:
+        readings = read_store(args.store, args.since, calibration)
+    elif args.source is None:
+        parser.error('give a source file or --store')
+    elif args.source.endswith('.csv'):
+        readings = read_csv(args.source, calibration)
+    else:
+        readings = read_log(args.source, args.interval)
+
+    client = None
+    send = None
+    if not args.dry_run:
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.connect((args.host, args.port))
+        send = lambda message: client.sendall(bytes(message, 'utf-8'))
+
+    engine = RuleEngine.from_file(args.rules) if args.rules else None
+    replay = Replay(send=send, speed=args.speed, engine=engine)
+    try:
+        replay.run(readings)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if client is not None:
+            client.close()
+    replay.report(timeline=not args.no_timeline)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
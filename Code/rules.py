@@ -0,0 +1,202 @@
+"""
+rules.py - Table-driven emotion rule engine
+
+Replaces the *_DataSent flags that sensors.py used to keep. Each rule in
+rules.json is a threshold on one input channel:
+
+    {"emotion": "thirs", "channel": "moisture", "below": 10, "hysteresis": 2, "priority": 50}
+
+    emotion     message sent to main.py while the rule wins
+    channel     input name passed to update() (light, moisture, temperature,
+                moisture_slope in %/min from trend.MoistureTrend)
+    signal      "value" (default) or "delta", the change since the previous sample
+    above/below threshold; the rule turns on when the signal crosses it
+    hysteresis  the rule turns off only once the signal is back past
+                threshold -/+ hysteresis (default 0)
+    for         seconds the threshold must stay crossed before the rule
+                turns on (default 0)
+    hold        minimum seconds a rule stays on once triggered (default 0)
+    priority    highest active rule wins; ties go to the earlier rule
+
+When no rule is active the "default" emotion is shown. The engine tracks
+which rules are on and only reports a message when the winning emotion
+changes, so main.py is not sent the same emotion again and again.
+
+Usage:
+    engine = RuleEngine.from_file('rules.json')
+    message = engine.update({'light': 55, 'moisture': 40, 'temperature': 24}, time.time())
+    if message is not None:
+        client.send(bytes(message, 'utf-8'))
+"""
+
+import os
+import json
+import time
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+SIGNALS = ('value', 'delta')
+
+
+class Rule:
+    """One compiled rule: precomputed on/off thresholds for a single channel."""
+
+    __slots__ = ('emotion', 'channel', 'signal', 'above', 'on', 'off', 'delay', 'hold', 'priority', 'order',
+                 'active', 'since', 'pending')
+
+    def __init__(self, emotion, channel, above, threshold, hysteresis=0, delay=0, hold=0, priority=0,
+                 signal='value', order=0):
+        self.emotion = emotion
+        self.channel = channel
+        self.signal = signal
+        self.above = above
+        self.on = threshold
+        self.off = threshold - hysteresis if above else threshold + hysteresis
+        self.delay = delay
+        self.hold = hold
+        self.priority = priority
+        self.order = order
+        self.active = False
+        self.since = None
+        self.pending = None
+
+    def check(self, x, now):
+        """Update the rule with a new signal value; returns True if its state changed."""
+        if self.above:
+            hit = x > (self.off if self.active else self.on)
+        else:
+            hit = x < (self.off if self.active else self.on)
+        if hit == self.active:
+            self.pending = None
+            return False
+        if hit and self.delay:
+            if self.pending is None:
+                self.pending = now
+            if now - self.pending < self.delay:
+                return False
+        if not hit and self.hold and now - self.since < self.hold:
+            return False
+        self.active = hit
+        self.since = now
+        self.pending = None
+        return True
+
+    def waiting(self):
+        """True while the rule is timing a for/hold period and must be re-checked."""
+        return self.pending is not None or (self.active and self.hold > 0)
+
+    def __repr__(self):
+        return 'Rule(%s: %s %s %s %g)' % (self.emotion, self.channel, self.signal,
+                                          '>' if self.above else '<', self.on)
+
+
+def compile_rules(entries):
+    """
+    Build Rule objects from config entries.
+
+    Raises:
+        ValueError: If an entry is missing fields or has unknown ones
+    """
+    rules = []
+    for i, entry in enumerate(entries):
+        entry = dict(entry)
+        try:
+            emotion = entry.pop('emotion')
+            channel = entry.pop('channel')
+        except KeyError as e:
+            raise ValueError('rule %d: missing %s' % (i, e))
+        if ('above' in entry) == ('below' in entry):
+            raise ValueError('rule %d (%s): give exactly one of above/below' % (i, emotion))
+        above = 'above' in entry
+        threshold = float(entry.pop('above' if above else 'below'))
+        signal = entry.pop('signal', 'value')
+        if signal not in SIGNALS:
+            raise ValueError('rule %d (%s): signal must be one of %s' % (i, emotion, ', '.join(SIGNALS)))
+        rule = Rule(emotion, channel, above, threshold,
+                    hysteresis=float(entry.pop('hysteresis', 0)),
+                    delay=float(entry.pop('for', 0)),
+                    hold=float(entry.pop('hold', 0)),
+                    priority=int(entry.pop('priority', 0)),
+                    signal=signal, order=i)
+        if entry:
+            raise ValueError('rule %d (%s): unknown fields %s' % (i, emotion, ', '.join(sorted(entry))))
+        rules.append(rule)
+    return rules
+
+
+class RuleEngine:
+    """
+    Evaluates compiled rules incrementally, one sample at a time.
+
+    Args:
+        rules (list): Rule objects (see compile_rules)
+        default (str): Emotion shown when no rule is active
+    """
+
+    def __init__(self, rules, default='happy'):
+        self.rules = rules
+        self.default = default
+        self._by_channel = {}
+        for rule in rules:
+            self._by_channel.setdefault(rule.channel, []).append(rule)
+        self._last = {}
+        self.emotion = None     # last emotion reported
+        self.evaluations = 0
+        self.transitions = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(compile_rules(config.get('rules', [])), default=config.get('default', 'happy'))
+
+    @classmethod
+    def from_file(cls, path=RULES_FILE):
+        with open(path) as f:
+            return cls.from_config(json.load(f))
+
+    def update(self, values, now=None):
+        """
+        Feed one sample.
+
+        Args:
+            values (dict): channel name -> reading
+            now (float): Sample time in seconds (default time.time())
+
+        Returns:
+            str: The new emotion message if the winner changed, else None
+        """
+        if now is None:
+            now = time.time()
+        changed = False
+        for channel, value in values.items():
+            rules = self._by_channel.get(channel)
+            if rules is None:
+                continue
+            previous = self._last.get(channel)
+            self._last[channel] = value
+            delta = 0 if previous is None else value - previous
+            for rule in rules:
+                if rule.signal == 'value':
+                    # Unchanged input cannot flip a value rule, unless it is timing for/hold
+                    if value == previous and not rule.waiting():
+                        continue
+                    x = value
+                else:
+                    x = delta
+                self.evaluations += 1
+                if rule.check(x, now):
+                    changed = True
+        if not changed and self.emotion is not None:
+            return None
+        emotion = self.winner()
+        if emotion == self.emotion:
+            return None
+        self.emotion = emotion
+        self.transitions += 1
+        return emotion
+
+    def winner(self):
+        """Emotion of the highest priority active rule, or the default."""
+        best = None
+        for rule in self.rules:
+            if rule.active and (best is None or rule.priority > best.priority):
+                best = rule
+        return self.default if best is None else best.emotion
@@ -0,0 +1,151 @@
+"""
+sampler.py - Adaptive per-channel sampling rate
+
+Each channel is read at its own interval. While the signal is moving
+(smoothed derivative or standard deviation above the channel's threshold)
+the channel is read at max_rate; once it is flat again the interval grows
+by `backoff` per quiet read until it reaches 1 / min_rate. Soil moisture is
+therefore polled every few seconds at most while drying, but at 5 Hz while
+the plant is being watered.
+
+Thresholds are in raw ADC counts (per second for the derivative) and are
+read from sampling.json:
+
+    "moisture": {"min_rate": 0.05, "max_rate": 5, "derivative": 40, "stddev": 400}
+
+Usage:
+    sampler = AdaptiveSampler.from_file('sampling.json')
+    while True:
+        now = time.monotonic()
+        for name in sampler.due(now):
+            sampler.record(name, read(name), now)
+        time.sleep(sampler.sleep_time(time.monotonic()))
+"""
+
+import os
+import json
+import math
+
+SAMPLING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sampling.json')
+
+
+class ChannelSchedule:
+    """
+    Sampling state of one channel.
+
+    Args:
+        min_rate (float): Slowest rate in Hz, used while the signal is flat
+        max_rate (float): Fastest rate in Hz, used while the signal changes
+        derivative (float): |d value / dt| (counts/s) that counts as activity
+        stddev (float): Running standard deviation (counts) that counts as activity
+        backoff (float): Interval multiplier per quiet read
+        smoothing (float): EWMA factor for the mean/derivative/variance estimates
+    """
+
+    def __init__(self, min_rate, max_rate, derivative, stddev, backoff=1.5, smoothing=0.3):
+        if min_rate <= 0 or max_rate < min_rate:
+            raise ValueError('need 0 < min_rate <= max_rate')
+        self.min_interval = 1.0 / max_rate
+        self.max_interval = 1.0 / min_rate
+        self.derivative_limit = derivative
+        self.variance_limit = stddev * stddev
+        self.backoff = backoff
+        self.alpha = smoothing
+        self.interval = self.min_interval
+        self.next_time = 0.0
+        self.last_time = None
+        self.mean = None
+        self.variance = 0.0
+        self.derivative = 0.0
+        self.value = None
+        self.reads = 0
+
+    def record(self, value, now):
+        """Fold in a new reading and schedule the next one."""
+        self.reads += 1
+        self.value = value
+        if self.mean is None:
+            self.mean = float(value)
+        else:
+            dt = now - self.last_time
+            diff = value - self.mean
+            mean = self.mean + self.alpha * diff
+            if dt > 0:
+                self.derivative = (mean - self.mean) / dt
+            self.variance = (1 - self.alpha) * (self.variance + self.alpha * diff * diff)
+            self.mean = mean
+        self.last_time = now
+        if self.active():
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        self.next_time = now + self.interval
+
+    def active(self):
+        return abs(self.derivative) > self.derivative_limit or self.variance > self.variance_limit
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class AdaptiveSampler:
+    """
+    Decides which channels are due for a read.
+
+    Args:
+        channels (dict): name -> ChannelSchedule
+    """
+
+    def __init__(self, channels):
+        self.channels = channels
+        self._start = None
+
+    @classmethod
+    def from_config(cls, config, roles=None):
+        """
+        Args:
+            config (dict): Parsed sampling.json
+            roles (dict): channel -> sensor type whose settings it uses,
+                e.g. {'0x49:2': 'moisture'}. Default: one channel per entry.
+        """
+        backoff = config.get('backoff', 1.5)
+        smoothing = config.get('smoothing', 0.3)
+        if roles is None:
+            roles = {name: name for name in config['channels']}
+        channels = {}
+        for name, role in roles.items():
+            entry = config['channels'][role]
+            channels[name] = ChannelSchedule(entry['min_rate'], entry['max_rate'], entry['derivative'],
+                                             entry['stddev'], backoff=entry.get('backoff', backoff),
+                                             smoothing=entry.get('smoothing', smoothing))
+        return cls(channels)
+
+    @classmethod
+    def from_file(cls, path=SAMPLING_FILE, roles=None):
+        with open(path) as f:
+            return cls.from_config(json.load(f), roles)
+
+    def due(self, now):
+        """Names of channels whose next read time has passed."""
+        if self._start is None:
+            self._start = now
+        return [name for name, ch in self.channels.items() if now >= ch.next_time]
+
+    def record(self, name, value, now):
+        self.channels[name].record(value, now)
+
+    def sleep_time(self, now):
+        """Seconds until the next channel is due (0 if one is overdue)."""
+        return max(0.0, min(ch.next_time for ch in self.channels.values()) - now)
+
+    def report(self, now):
+        """
+        Reads per channel against a fixed poll at each channel's max_rate.
+
+        Returns:
+            dict: name -> (reads, reads a fixed fast poll would have done, current rate in Hz)
+        """
+        elapsed = 0.0 if self._start is None else now - self._start
+        return {name: (ch.reads, int(elapsed / ch.min_interval) + 1, 1.0 / ch.interval)
+                for name, ch in self.channels.items()}
@@ -1,106 +1,121 @@
+import sys
 import time
-import socket
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-
-i2c = busio.I2C(board.SCL, board.SDA)
-ads = ADS.ADS1115(i2c)
-Moisture_channel = AnalogIn(ads, ADS.P2)
-LDR_channel = AnalogIn(ads, ADS.P3)
-LM35_channel = AnalogIn(ads, ADS.P1)
-
-ADC_16BIT_MAX = 65536
-lm35_constant = 10.0/1000
-ads_InputRange = 4.096 #For Gain = 1; Otherwise change accordingly
-ads_bit_Voltage = (ads_InputRange * 2) / (ADC_16BIT_MAX - 1)
-
-#Initialising Variables
-Moisture_Recent = 100
-HighIn_DataSent = 0
-LowIn_DataSent = 0
-Thirsty_DataSent = 0
-Savory_DataSent = 0
-Happy_DataSent = 0
-TemperatureDataSent = 0
-
-# Map function
-def _map(x, in_min, in_max, out_min, out_max):
-    return int((x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min)
-
-#Setup Client for communication
-client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client.connect(('0.0.0.0', 1013))
-
-
-while True:
-    
-    # Read the specified ADC channels using the previously set gain value.
-    LDR_Value = LDR_channel.value
-    LDR_Percent = _map(LDR_Value, 22500, 50, 0, 100)
-    Moisture_Value = Moisture_channel.value
-    Moisture_Percent = _map(Moisture_Value, 31000, 15500, 0, 100)
-    ads_ch0 = LM35_channel.value
-    ads_Voltage_ch0 = ads_ch0 * ads_bit_Voltage
-    Temperature = int(ads_Voltage_ch0 / lm35_constant)
-    print("Temperature = ", Temperature)
-    print("Light Intensity = ", LDR_Percent)
-    print("Moisture % = ", Moisture_Percent)
-    if (LDR_Percent < 20):
-        if(LowIn_DataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('sleep','utf-8'))
-            #client.close()
-            HighIn_DataSent = 0
-            LowIn_DataSent = 1
-    elif (LDR_Percent > 20):
-        if(HighIn_DataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('happy','utf-8'))
-            #client.close()
-            HighIn_DataSent = 1
-            LowIn_DataSent = 0
-        
-    if (Moisture_Percent < 10):
-        Moisture_Recent = Moisture_Percent
-        if(Thirsty_DataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('thirs','utf-8'))
-            #client.close()
-            Thirsty_DataSent = 1
-            Savory_DataSent = 0
-            Happy_DataSent = 0
-    elif (Moisture_Percent>10 and Moisture_Recent < Moisture_Percent and Moisture_Percent < 90):
-        Moisture_Recent = Moisture_Percent
-        if(Savory_DataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('savor','utf-8'))
-            #client.close()
-            Savory_DataSent = 1
-            Thirsty_DataSent = 0
-            Happy_DataSent = 0
-    elif (Moisture_Percent > 90):
-        Moisture_Recent = Moisture_Percent
-        if(Happy_DataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('savor','utf-8'))
-            #client.close()
-            Happy_DataSent = 1
-            Savory_DataSent = 0
-            Thirsty_DataSent = 0
-
-    if(Temperature>30):
-        if(TemperatureDataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('hotty','utf-8'))
-            #client.close()
-            TemperatureDataSent = 1
-    elif(Temperature<22):
-        if(TemperatureDataSent == 0):
-            #client.connect(('0.0.0.0', 8080))
-            client.send(bytes('freez','utf-8'))
-            #client.close()
-            TemperatureDataSent = 1
-    else:
-            TemperatureDataSent = 0
+import signal
+import asyncio
+import broker
+import cpusched
+from adc import open_i2c
+from multiads import RoundRobin
+from plants import load_plants, channel_roles
+from publisher import Publisher
+from sampler import AdaptiveSampler
+from telemetry import TelemetryLogger
+from thresholds import light_message
+
+#Sampling (and the telemetry writer thread started below) off the display core, see scheduling.json
+sched = cpusched.setup('sensors')
+
+#Boards and channel-to-plant mapping, see plants.json
+boards, plants = load_plants()
+
+#Share the bus through broker.py when it is running, otherwise own it
+if broker.available():
+    bus = broker.BrokerClient()
+else:
+    bus = RoundRobin(open_i2c(), boards)
+
+#Setup Client for communication (one display server per plant that has one).
+#Publishers connect in the background and reconnect when main.py restarts.
+clients = {}
+for plant in plants:
+    if plant.server is not None:
+        clients[plant.name] = Publisher(plant.server, name=plant.name)
+
+#Per-channel adaptive read rates, see sampling.json
+roles = channel_roles(plants)
+sampler = AdaptiveSampler.from_file(roles=roles)
+raw = {}
+
+#Readings are logged on change or once a minute, see telemetry.json
+telemetry = TelemetryLogger.from_file()
+telemetry.event('sched', cpus=','.join(map(str, sched['cpus'])), policy=sched['policy'],
+                priority=sched['priority'], nice=sched['nice'])
+
+REPORT_INTERVAL = 60
+#The display scales its frame rate and backlight with the ambient light
+#(framerate.py); a new level is sent when it moved by this many %
+LIGHT_STEP = 2
+light_sent = {}
+
+
+def read(channels):
+    global bus
+    try:
+        return bus.read(channels)
+    except OSError as e:
+        if not isinstance(bus, broker.BrokerClient):
+            raise
+        #broker.py stopped updating its snapshot: take over the bus
+        telemetry.event('bus', broker='lost', reason=str(e))
+        bus = RoundRobin(open_i2c(), boards)
+        return bus.read(channels)
+
+
+async def sample():
+    last_report = time.monotonic()
+    while True:
+
+        # Read the channels that are due, pipelined across the ADS1115 boards.
+        now = time.monotonic()
+        due = sampler.due(now)
+        values = read(due)
+        for channel, value in values.items():
+            raw[channel] = value
+            sampler.record(channel, value, now)
+        if len(values) < len(due):
+            # I2C glitch (e.g. errno 121), the missing channels stay due
+            await asyncio.sleep(0.1)
+        for plant in plants:
+            if not values.keys() & plant.channels.values() or not all(c in raw for c in plant.channels.values()):
+                continue
+            message = plant.update(raw, values, now)
+            telemetry.record(plant.name, {'light': plant.light, 'moisture': plant.moisture,
+                                          'temperature': plant.temperature}, now)
+            if message is not None:
+                telemetry.event(plant.name, emotion=message)
+                if plant.name in clients:
+                    clients[plant.name].publish(message)
+            light = max(0, min(100, plant.light))
+            if plant.name in clients and abs(light - light_sent.get(plant.name, -LIGHT_STEP)) >= LIGHT_STEP:
+                light_sent[plant.name] = light
+                clients[plant.name].publish(light_message(light), key='light')
+        if now - last_report >= REPORT_INTERVAL:
+            rate, busy, errors = bus.throughput()
+            telemetry.event('bus', samples_per_s=rate, busy_pct=busy * 100, i2c_errors=errors,
+                            channels=len(roles), plants=len(plants), log_dropped=telemetry.dropped)
+            for name, client in clients.items():
+                stats = client.stats()
+                telemetry.event(name, connected=int(stats['connected']), reconnects=stats['connects'],
+                                reconnect_s=stats['reconnect_last'] or 0.0, dropped=stats['dropped'])
+            for plant in plants:
+                plant.write_stats()
+            last_report = now
+        await asyncio.sleep(sampler.sleep_time(time.monotonic()))
+
+
+async def main():
+    for client in clients.values():
+        asyncio.ensure_future(client.run())
+    await sample()
+
+
+#systemd stops services with SIGTERM; exit through the finally below
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    pass
+finally:
+    #Buffered history and the rollups still being filled go to disk
+    for plant in plants:
+        plant.close()
@@ -0,0 +1,360 @@
+"""
+simads.py - Simulated ADS1115 on a simulated I2C bus
+
+Drop-in stand-in for `adafruit_ads1x15.ads1115` / `analog_in` and
+`busio.I2C` so sensors.py and calibration.py run on any Linux host. Each
+ADC input is driven by a waveform (daily light cycle, drying soil with
+watering events, temperature drift), with Gaussian noise, ADS1115
+conversion time, I2C transfer time and injected I2C errors.
+
+Select it by setting FYTO_SIMULATE=1 (see adc.py):
+
+    FYTO_SIMULATE=1 python3 sensors.py
+    FYTO_SIMULATE=1 FYTO_SIM_SPEED=3600 python3 sensors.py   # one hour per second
+
+Benchmark the sampler and threshold logic on the host:
+
+    python3 simads.py --bench 2000
+    python3 simads.py --bench 2000 --no-delay --error-rate 0.01
+"""
+
+import math
+import time
+import random
+import logging
+
+P0 = 0
+P1 = 1
+P2 = 2
+P3 = 3
+
+_PGA_RANGE = {2/3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+_DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+_DIFF_CHANNELS = {(0, 1): 0, (0, 3): 1, (1, 3): 2, (2, 3): 3}
+
+
+class Mode:
+    """Conversion modes, same values as adafruit_ads1x15.ads1x15.Mode."""
+    CONTINUOUS = 0x0000
+    SINGLE = 0x0100
+
+
+class SimClock:
+    """
+    Simulated wall clock.
+
+    Args:
+        speed (float): Simulated seconds per real second
+        start (float): Simulated Unix time at creation (default: now)
+    """
+
+    def __init__(self, speed=1.0, start=None):
+        self.speed = speed
+        self.start = time.time() if start is None else start
+        self._t0 = time.monotonic()
+        self.offset = 0.0
+
+    def now(self):
+        return self.start + (time.monotonic() - self._t0) * self.speed + self.offset
+
+    def advance(self, seconds):
+        """Move simulated time forward without sleeping."""
+        self.offset += seconds
+
+
+# Waveforms: callables of simulated Unix time returning volts at the ADC pin
+
+def _hour_of_day(t):
+    lt = time.localtime(t)
+    return lt.tm_hour + lt.tm_min / 60.0 + (t % 60) / 3600.0
+
+
+class Constant:
+    def __init__(self, volts):
+        self.volts = volts
+
+    def __call__(self, t):
+        return self.volts
+
+
+class DailyLight:
+    """
+    LDR divider over a day: dark_volts at night, bright_volts at noon.
+
+    The defaults match the LDR calibration in thresholds.convert()
+    (22500 dark, 50 bright at gain 1).
+    """
+
+    def __init__(self, dark_volts=2.81, bright_volts=0.006, sunrise=7.0, sunset=20.0, clouds=0.15):
+        self.dark_volts = dark_volts
+        self.bright_volts = bright_volts
+        self.sunrise = sunrise
+        self.sunset = sunset
+        self.clouds = clouds
+        self._cloud = 0.0
+
+    def __call__(self, t):
+        h = _hour_of_day(t)
+        if h < self.sunrise or h > self.sunset:
+            level = 0.0
+        else:
+            level = math.sin(math.pi * (h - self.sunrise) / (self.sunset - self.sunrise))
+            # Slowly wandering cloud cover
+            self._cloud = min(1.0, max(0.0, self._cloud + random.gauss(0, 0.01)))
+            level *= 1.0 - self.clouds * self._cloud
+        return self.dark_volts + (self.bright_volts - self.dark_volts) * level
+
+
+class DryingSoil:
+    """
+    Capacitive moisture sensor: exponential drying, watered every `period` seconds.
+
+    Watering ramps the output from the current level to wet_volts over
+    `watering_time` seconds. Defaults match thresholds.convert()
+    (31000 dry, 15500 wet at gain 1).
+    """
+
+    def __init__(self, wet_volts=1.94, dry_volts=3.87, tau=2.5 * 86400, period=4 * 86400,
+                 watering_time=60.0, phase=0.5):
+        self.wet_volts = wet_volts
+        self.dry_volts = dry_volts
+        self.tau = tau
+        self.period = period
+        self.watering_time = watering_time
+        self.phase = phase
+
+    def _dried(self, age):
+        return self.dry_volts - (self.dry_volts - self.wet_volts) * math.exp(-age / self.tau)
+
+    def __call__(self, t):
+        age = (t + self.phase * self.period) % self.period
+        if age < self.watering_time:
+            before = self._dried(self.period)
+            return before + (self.wet_volts - before) * age / self.watering_time
+        return self._dried(age - self.watering_time)
+
+
+class TemperatureDrift:
+    """LM35 (10 mV/C): daily sinusoid around `mean` C plus a bounded random walk."""
+
+    def __init__(self, mean=25.0, amplitude=4.0, peak_hour=15.0, walk=0.05, walk_limit=3.0):
+        self.mean = mean
+        self.amplitude = amplitude
+        self.peak_hour = peak_hour
+        self.walk = walk
+        self.walk_limit = walk_limit
+        self._drift = 0.0
+
+    def __call__(self, t):
+        h = _hour_of_day(t)
+        self._drift = min(self.walk_limit, max(-self.walk_limit, self._drift + random.gauss(0, self.walk)))
+        celsius = self.mean + self.amplitude * math.cos(2 * math.pi * (h - self.peak_hour) / 24.0) + self._drift
+        return celsius * 0.010
+
+
+# Fyto wiring: A1 LM35, A2 moisture, A3 LDR, A0 open
+def default_channels():
+    return {P0: Constant(0.0), P1: TemperatureDrift(), P2: DryingSoil(), P3: DailyLight()}
+
+
+class I2C:
+    """
+    Simulated I2C bus, stands in for busio.I2C.
+
+    Args:
+        frequency (int): Bus clock in Hz, used for transfer time
+        error_rate (float): Probability that a transaction fails with OSError 121
+        clock (SimClock): Shared simulated clock
+        realtime (bool): Sleep for conversion/transfer time instead of only
+            advancing the simulated clock
+    """
+
+    def __init__(self, scl=None, sda=None, frequency=100000, error_rate=0.0, clock=None, realtime=True):
+        self.frequency = frequency
+        self.error_rate = error_rate
+        self.clock = clock or SimClock()
+        self.realtime = realtime
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def elapsed(self):
+        """Bus time in seconds: real time, or the sum of simulated waits without realtime."""
+        return time.monotonic() if self.realtime else self.busy_time
+
+    def wait(self, seconds):
+        self.busy_time += seconds
+        if self.realtime:
+            time.sleep(seconds)
+        else:
+            self.clock.advance(seconds)
+
+    def transfer(self, address, nbytes):
+        """Account for one transaction of nbytes (plus the address byte)."""
+        self.transactions += 1
+        self.bytes += nbytes + 1
+        # 9 clocks per byte (8 data + ACK) plus start/stop
+        self.wait(((nbytes + 1) * 9 + 2) / float(self.frequency))
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            raise OSError(121, 'Remote I/O error (simulated, address 0x%02x)' % address)
+
+    def deinit(self):
+        pass
+
+
+class ADS1115:
+    """
+    Simulated ADS1115, same constructor and read() as the Adafruit driver.
+
+    Args:
+        i2c (I2C): Simulated bus
+        gain (float): PGA gain, one of 2/3, 1, 2, 4, 8, 16
+        data_rate (int): Samples per second (default 128)
+        mode (int): Mode.SINGLE or Mode.CONTINUOUS
+        address (int): I2C address
+        channels (dict): pin -> waveform, default default_channels()
+        noise (float): Gaussian noise in volts added to every conversion
+    """
+
+    bits = 16
+
+    def __init__(self, i2c, gain=1, data_rate=None, mode=Mode.SINGLE, address=0x48, channels=None, noise=0.002):
+        if gain not in _PGA_RANGE:
+            raise ValueError('Gain must be one of: {0}'.format(list(_PGA_RANGE)))
+        self.i2c = i2c
+        self.gain = gain
+        self.data_rate = data_rate or 128
+        if self.data_rate not in _DATA_RATES:
+            raise ValueError('Data rate must be one of: {0}'.format(list(_DATA_RATES)))
+        self.mode = mode
+        self.address = address
+        self.channels = default_channels() if channels is None else channels
+        self.noise = noise
+        self._last_pin_read = None
+        self._pending = None
+
+    def _convert(self, pin, is_differential):
+        t = self.i2c.clock.now()
+        if is_differential:
+            pos, neg = [pair for pair, cfg in _DIFF_CHANNELS.items() if cfg == pin][0]
+            volts = self.channels.get(pos, Constant(0.0))(t) - self.channels.get(neg, Constant(0.0))(t)
+        else:
+            volts = self.channels.get(pin, Constant(0.0))(t)
+        if self.noise:
+            volts += random.gauss(0, self.noise)
+        fsr = _PGA_RANGE[self.gain]
+        code = int(volts / fsr * 32768)
+        return max(-32768, min(32767, code))
+
+    def read(self, pin, is_differential=False):
+        """Perform an ADC read and return the signed 16 bit result."""
+        conversion = 1.0 / self.data_rate
+        if self.mode == Mode.CONTINUOUS and self._last_pin_read == pin:
+            self.i2c.transfer(self.address, 2)
+            return self._convert(pin, is_differential)
+        self._last_pin_read = pin
+        # Write config register (pointer + 2 bytes), starts the conversion
+        self.i2c.transfer(self.address, 3)
+        if self.mode == Mode.SINGLE:
+            # Poll the OS bit until the conversion is done
+            self.i2c.wait(conversion * random.uniform(1.0, 1.1))
+            self.i2c.transfer(self.address, 3)
+        else:
+            self.i2c.wait(2 * conversion)
+        # Read conversion register
+        self.i2c.transfer(self.address, 3)
+        return self._convert(pin, is_differential)
+
+    def start_conversion(self, pin):
+        """Start a single-shot conversion and return without waiting (see adc.start_conversion)."""
+        self.i2c.transfer(self.address, 3)
+        self._last_pin_read = pin
+        self._pending = (pin, self.i2c.elapsed() + random.uniform(1.0, 1.1) / self.data_rate)
+
+    def read_conversion(self):
+        """Wait for the conversion started by start_conversion() and return it."""
+        pin, ready = self._pending
+        self._pending = None
+        remaining = ready - self.i2c.elapsed()
+        if remaining > 0:
+            self.i2c.wait(remaining)
+        self.i2c.transfer(self.address, 3)
+        return self._convert(pin, False)
+
+
+class AnalogIn:
+    """Same interface as adafruit_ads1x15.analog_in.AnalogIn."""
+
+    def __init__(self, ads, positive_pin, negative_pin=None):
+        self._ads = ads
+        self._pin_setting = positive_pin
+        self.is_differential = False
+        if negative_pin is not None:
+            pins = (positive_pin, negative_pin)
+            if pins not in _DIFF_CHANNELS:
+                raise ValueError('Differential channels must be one of: {0}'.format(list(_DIFF_CHANNELS)))
+            self._pin_setting = _DIFF_CHANNELS[pins]
+            self.is_differential = True
+
+    @property
+    def value(self):
+        """16 bit ADC value (signed for the ADS1115)."""
+        return self._ads.read(self._pin_setting, is_differential=self.is_differential) << (16 - self._ads.bits)
+
+    @property
+    def voltage(self):
+        return self.value * _PGA_RANGE[self._ads.gain] / 32767
+
+
+def bench(samples, realtime=True, error_rate=0.0, data_rate=128, speed=3600.0):
+    """Run the sensors.py sample path (read, convert, trend, rules) against the simulator."""
+    from rules import RuleEngine
+    from thresholds import convert
+    from trend import MoistureTrend
+
+    clock = SimClock(speed=speed)
+    i2c = I2C(clock=clock, realtime=realtime, error_rate=error_rate)
+    ads = ADS1115(i2c, data_rate=data_rate)
+    moisture_ch = AnalogIn(ads, P2)
+    ldr_ch = AnalogIn(ads, P3)
+    lm35_ch = AnalogIn(ads, P1)
+    engine = RuleEngine.from_file()
+    trend = MoistureTrend()
+    messages = 0
+    failed = 0
+    start = time.perf_counter()
+    cpu = time.process_time()
+    for _ in range(samples):
+        try:
+            values = (ldr_ch.value, moisture_ch.value, lm35_ch.value)
+        except OSError:
+            failed += 1
+            continue
+        light, moisture, temperature = convert(*values)
+        now = clock.now()
+        slope = trend.update(now, moisture)
+        if engine.update({'light': light, 'moisture': moisture, 'temperature': temperature,
+                          'moisture_slope': slope}, now) is not None:
+            messages += 1
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    print('Samples: %d (%d failed on injected I2C errors), messages: %d' % (samples, failed, messages))
+    print('Wall time: %.3f s, %.1f samples/s, %.2f ms/sample' % (wall, samples / wall, 1000 * wall / samples))
+    print('CPU time: %.3f s, %.1f us/sample' % (cpu, 1e6 * cpu / samples))
+    print('Simulated I2C: %d transactions, %d bytes, %.3f s busy, %d errors'
+          % (i2c.transactions, i2c.bytes, i2c.busy_time, i2c.errors))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulated ADS1115 benchmark')
+    parser.add_argument('--bench', type=int, default=1000, metavar='SAMPLES')
+    parser.add_argument('--no-delay', action='store_true', help='do not sleep for conversion/transfer time')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--data-rate', type=int, default=128)
+    parser.add_argument('--speed', type=float, default=3600.0, help='simulated seconds per real second')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    bench(args.bench, realtime=not args.no_delay, error_rate=args.error_rate, data_rate=args.data_rate, speed=args.speed)
@@ -0,0 +1,262 @@
+"""
+splash.py - Raw first frame for a fast display boot
+
+Most of main.py's start-up time goes to importing PIL, NumPy and the LCD
+drivers, and to decoding the first PNG. The splash file skips all of that:
+it holds the exact GPIO writes, delays and SPI bytes the driver sends to
+reset and initialize the panel and show one frame, recorded once on a
+mock backend. show() replays them with only spidev and the GPIO backend
+loaded, so the panel lights up before the heavy modules are imported.
+
+The file is rebuilt automatically when the source frame or the pin and
+SPI configuration changes (main.py does it in the background after its
+first start), or by hand:
+
+    python3 splash.py                       # emotion/happy/frame0.png
+    python3 splash.py --emotion sleepy --frame 10
+    FYTO_DISPLAY=mock python3 splash.py --show
+
+File layout: b'FYSP', a length-prefixed JSON header (source, pins, SPI
+clock), then records of one kind byte each: G pin level (GPIO write),
+S microseconds (delay), W length bytes (SPI write, DC as last set).
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import logging
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+SPLASH_FILE = os.path.join(CODE_DIR, 'cache', 'splash.raw')
+MAGIC = b'FYSP'
+VERSION = 1
+
+
+def process_age():
+    """Seconds since this process was started (Linux), None where unknown."""
+    try:
+        with open('/proc/self/stat') as f:
+            # starttime is field 22, in clock ticks after boot; the name may contain spaces
+            start = int(f.read().rsplit(')', 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def source_frame(emotion='happy', frame=0):
+    return os.path.join(CODE_DIR, 'emotion', emotion, 'frame%d.png' % frame)
+
+
+def _config(source, rst, dc, bl, bus, device, speed):
+    st = os.stat(source)
+    return {
+        'version': VERSION,
+        'source': os.path.abspath(source),
+        'mtime': st.st_mtime,
+        'size': st.st_size,
+        'rst': rst, 'dc': dc, 'bl': bl,
+        'bus': bus, 'device': device,
+        'speed': speed,
+    }
+
+
+def read(path=SPLASH_FILE):
+    """(header, records) of a splash file; raises OSError or ValueError."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError('%s is not a splash file' % path)
+    n, = struct.unpack_from('<I', data, 4)
+    header = json.loads(data[8:8 + n].decode('utf-8'))
+    if header.get('version') != VERSION:
+        raise ValueError('%s: unsupported splash version %r' % (path, header.get('version')))
+    records = []
+    pos = 8 + n
+    view = memoryview(data)
+    while pos < len(data):
+        kind = data[pos:pos + 1]
+        if kind == b'G':
+            pin, level = struct.unpack_from('<BB', data, pos + 1)
+            records.append(('gpio', pin, level))
+            pos += 3
+        elif kind == b'S':
+            us, = struct.unpack_from('<I', data, pos + 1)
+            records.append(('sleep', us / 1e6, None))
+            pos += 5
+        elif kind == b'W':
+            length, = struct.unpack_from('<I', data, pos + 1)
+            records.append(('spi', view[pos + 5:pos + 5 + length], None))
+            pos += 5 + length
+        else:
+            raise ValueError('%s: bad record %r at %d' % (path, kind, pos))
+    return header, records
+
+
+def current(path=SPLASH_FILE, source=None, rst=27, dc=25, bl=18, bus=0, device=0, speed=90000000):
+    """True if the splash file exists and matches the source frame and configuration."""
+    source = source or source_frame()
+    try:
+        with open(path, 'rb') as f:
+            if f.read(4) != MAGIC:
+                return False
+            n, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(n).decode('utf-8'))
+        return header == _config(source, rst, dc, bl, bus, device, speed)
+    except (OSError, ValueError, struct.error):
+        return False
+
+
+def show(path=SPLASH_FILE, backend=None, rst=27, dc=25, bl=18, bus=0, device=0, speed=90000000, backlight=None):
+    """
+    Replay a splash file on the panel. Never raises: a missing or stale file
+    (other pins, other SPI device) just means no splash.
+
+    Args:
+        backend: hwbackend backend to drive; default from FYTO_DISPLAY
+        backlight: 'auto', 'sysfs', 'gpio' or 'soft', picked like the driver does
+
+    Returns:
+        float or None: seconds from process start to the last pixel written,
+        None if nothing was shown
+    """
+    try:
+        header, records = read(path)
+    except (OSError, ValueError) as e:
+        logging.info('splash: not shown (%s)', e)
+        return None
+    wanted = {'rst': rst, 'dc': dc, 'bl': bl, 'bus': bus, 'device': device, 'speed': speed}
+    if any(header.get(key) != value for key, value in wanted.items()):
+        logging.info('splash: %s was recorded for another configuration', path)
+        return None
+    try:
+        if backend is None:
+            from lib import hwbackend
+            backend = hwbackend.open_backend()
+        gpio = backend.GPIO
+        gpio.setmode(gpio.BCM)
+        gpio.setwarnings(False)
+        gpio.setup(rst, gpio.OUT)
+        gpio.setup(dc, gpio.OUT)
+        spi = backend.SpiDev(bus, device)
+        spi.max_speed_hz = speed
+        spi.mode = 0b00
+        write = getattr(spi, 'writebytes2', None)
+        for kind, what, value in records:
+            if kind == 'gpio':
+                gpio.output(what, value)
+            elif kind == 'sleep':
+                backend.sleep(what)
+            elif write is not None:
+                write(what)
+            else:
+                for i in range(0, len(what), 4096):
+                    spi.writebytes(list(what[i:i + 4096]))
+        spi.close()
+    except (ImportError, OSError, RuntimeError) as e:
+        logging.warning('splash: display not available (%s)', e)
+        return None
+    try:
+        # Full on through the same backlight backend the driver opens, so a
+        # hardware PWM pin stays in its PWM function; close() stops a soft PWM
+        # thread, the driver starts its own
+        from lib import backlight as _backlight
+        mode = backlight or os.environ.get('FYTO_BACKLIGHT') or backend.backlight
+        _backlight.open_backlight(gpio, bl, mode=mode).close(100)
+    except (OSError, RuntimeError, ValueError) as e:
+        logging.warning('splash: backlight not switched on (%s)', e)
+    age = process_age()
+    logging.info('splash: first frame on the panel %s after process start',
+                 '?' if age is None else '%.3f s' % age)
+    return age
+
+
+def record(image, driver=None, rst=27, dc=25, bl=18, bus=0, device=0, speed=90000000):
+    """
+    Records the driver sends to reset, initialize and show image (already
+    rotated the way main.py shows it).
+
+    Returns:
+        list: ('gpio', pin, level), ('sleep', seconds, None), ('spi', bytes, None)
+    """
+    from lib import hwbackend
+    if driver is None:
+        from lib import LCD_2inch
+        driver = LCD_2inch.LCD_2inch
+
+    records = []
+
+    class Recorder(hwbackend.MockBackend):
+        def _gpio(self, pin, value, previous):
+            super()._gpio(pin, value, previous)
+            if pin in (rst, dc):
+                records.append(('gpio', pin, value))
+
+        def sleep(self, seconds):
+            super().sleep(seconds)
+            records.append(('sleep', seconds, None))
+
+        def _spi(self, spidev, data):
+            super()._spi(spidev, data)
+            data = bytes(v & 0xFF for v in data)
+            # Merge writes between DC changes: one ioctl per run at boot
+            if records and records[-1][0] == 'spi':
+                records[-1] = ('spi', records[-1][1] + data, None)
+            else:
+                records.append(('spi', data, None))
+
+    disp = driver(spi=(bus, device), spi_freq=speed, rst=rst, dc=dc, bl=bl,
+                  backend=Recorder(), backlight='gpio')
+    disp.Init()
+    disp.ShowImage(image)
+    return records
+
+
+def build(path=SPLASH_FILE, source=None, rst=27, dc=25, bl=18, bus=0, device=0, speed=90000000):
+    """Write the splash file for source (default the first happy frame); returns path."""
+    from PIL import Image
+    source = source or source_frame()
+    header = _config(source, rst, dc, bl, bus, device, speed)
+    with Image.open(source) as image:
+        records = record(image.convert('RGB').rotate(180), rst=rst, dc=dc, bl=bl,
+                         bus=bus, device=device, speed=speed)
+    blob = json.dumps(header, sort_keys=True).encode('utf-8')
+    out = [MAGIC, struct.pack('<I', len(blob)), blob]
+    for kind, what, value in records:
+        if kind == 'gpio':
+            out.append(b'G' + struct.pack('<BB', what, value))
+        elif kind == 'sleep':
+            out.append(b'S' + struct.pack('<I', int(round(what * 1e6))))
+        else:
+            out.append(b'W' + struct.pack('<I', len(what)) + what)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write and rename so a crash never leaves a half file for the next boot
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b''.join(out))
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Build or show the raw boot frame')
+    parser.add_argument('--emotion', default='happy', help='emotion folder of the frame')
+    parser.add_argument('--frame', type=int, default=0, help='frame number')
+    parser.add_argument('--output', default=SPLASH_FILE, help='splash file')
+    parser.add_argument('--show', action='store_true', help='replay the file instead of building it')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.show:
+        return 0 if show(args.output) is not None else 1
+    path = build(args.output, source_frame(args.emotion, args.frame))
+    header, records = read(path)
+    nbytes = sum(len(what) for kind, what, value in records if kind == 'spi')
+    delay = sum(what for kind, what, value in records if kind == 'sleep')
+    print('%s: %d records, %d SPI bytes, %.0f ms of delays' % (path, len(records), nbytes, delay * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
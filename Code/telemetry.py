@@ -0,0 +1,267 @@
+"""
+telemetry.py - Rate-limited structured telemetry for the sensor loop
+
+Readings are folded into per-source aggregates (count, min, max, mean, last)
+and a record is emitted only when a value moved by more than its change
+threshold since the last emitted record, or when the interval has elapsed.
+Events (emotion changes, bus statistics) are emitted right away.
+
+Records are queued in a bounded buffer and written by a background thread,
+so a slow stdout (journald under load) or disk never blocks sampling. When
+the buffer is full the oldest records are dropped and counted.
+
+Output is a compact line
+
+    2026-10-19T07:01:36 fyto n=12 light=52.1 moisture=43.0[41.2,44.0] temperature=24.3
+
+(the [min,max] range is shown when it differs from the last value by more
+than the change threshold) or one JSON object per line. Settings are read
+from telemetry.json:
+
+    {"format": "line", "interval": 60, "change": {"moisture": 2}, "output": null, "buffer": 1024}
+
+"output" is a file path to append to, or null for stdout.
+
+Usage:
+    log = TelemetryLogger.from_file()
+    log.record('fyto', {'light': 52.1, 'moisture': 43.0, 'temperature': 24.3})
+    log.event('fyto', emotion='thirs')
+    log.close()
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+
+TELEMETRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telemetry.json')
+FORMATS = ('line', 'json')
+
+
+class Aggregate:
+    """Running count, min, max, sum and last value of one field between emits."""
+
+    __slots__ = ('count', 'min', 'max', 'total', 'last')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.last = None
+
+    def add(self, value):
+        if self.count == 0:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+        self.last = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class _Source:
+    """Aggregates of one source (plant) and what was last emitted for it."""
+
+    def __init__(self):
+        self.fields = {}
+        self.count = 0
+        self.emitted = {}
+        self.emit_time = None
+
+
+class TelemetryLogger:
+    """
+    Emit aggregated readings on change or at an interval, written asynchronously.
+
+    Args:
+        interval (float): Longest time (s) between two records of a source
+        change (dict): field -> absolute change that triggers a record early
+        format (str): 'line' or 'json'
+        stream: File-like object to write to (default sys.stdout)
+        path (str): Append to this file instead of stream
+        buffer (int): Records held while the writer is behind
+        precision (int): Decimals in the line format
+    """
+
+    def __init__(self, interval=60.0, change=None, format='line', stream=None, path=None, buffer=1024, precision=1):
+        if format not in FORMATS:
+            raise ValueError('format must be one of %s' % ', '.join(FORMATS))
+        self.interval = interval
+        self.change = dict(change or {})
+        self.format = format
+        self.precision = precision
+        self._own_stream = path is not None
+        if path is not None:
+            self.stream = open(path, 'a', buffering=1)
+        else:
+            self.stream = stream if stream is not None else sys.stdout
+        self.sources = {}
+        self.records = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self._queue = deque()
+        self._capacity = buffer
+        self._lock = threading.Condition()
+        self._closed = False
+        self._writing = False
+        self._writer = threading.Thread(target=self._drain, name='telemetry', daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        options = dict(interval=config.get('interval', 60.0), change=config.get('change'),
+                       format=config.get('format', 'line'), path=config.get('output'),
+                       buffer=config.get('buffer', 1024), precision=config.get('precision', 1))
+        options.update(kwargs)
+        return cls(**options)
+
+    @classmethod
+    def from_file(cls, path=TELEMETRY_FILE, **kwargs):
+        """Read telemetry.json, falling back to the defaults if it is missing."""
+        try:
+            with open(path) as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            config = {}
+        return cls.from_config(config, **kwargs)
+
+    def record(self, source, values, now=None):
+        """
+        Fold readings into the source's aggregate; emit if due.
+
+        Args:
+            source (str): Plant or subsystem name
+            values (dict): field -> number
+            now (float): time.monotonic() of the readings
+
+        Returns:
+            bool: True if a record was emitted
+        """
+        if now is None:
+            now = time.monotonic()
+        state = self.sources.get(source)
+        if state is None:
+            state = self.sources[source] = _Source()
+        state.count += 1
+        changed = state.emit_time is None
+        for field, value in values.items():
+            aggregate = state.fields.get(field)
+            if aggregate is None:
+                aggregate = state.fields[field] = Aggregate()
+            aggregate.add(value)
+            limit = self.change.get(field)
+            if limit is not None and not changed:
+                previous = state.emitted.get(field)
+                changed = previous is None or abs(value - previous) >= limit
+        if not changed and now - state.emit_time < self.interval:
+            return False
+        self._put(self._format_reading(source, state))
+        for field, aggregate in state.fields.items():
+            state.emitted[field] = aggregate.last
+            aggregate.reset()
+        state.count = 0
+        state.emit_time = now
+        return True
+
+    def event(self, source, **fields):
+        """Emit a record right away (emotion change, periodic statistics)."""
+        if self.format == 'json':
+            record = {'time': self._timestamp(), 'source': source}
+            record.update(fields)
+            self._put(json.dumps(record, separators=(',', ':')))
+        else:
+            parts = [self._timestamp(), source]
+            parts.extend('%s=%s' % (k, self._number(v)) for k, v in fields.items())
+            self._put(' '.join(parts))
+
+    def flush(self, timeout=None):
+        """Wait until the writer has caught up (or timeout seconds passed)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while (self._queue or self._writing) and self._writer.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    def close(self, timeout=2.0):
+        """Write what is still buffered and stop the writer thread."""
+        self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._writer.join(timeout)
+        if self._own_stream:
+            self.stream.close()
+
+    def _timestamp(self):
+        return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def _number(self, value):
+        if isinstance(value, float):
+            return '%.*f' % (self.precision, value)
+        return str(value)
+
+    def _format_reading(self, source, state):
+        if self.format == 'json':
+            record = {'time': self._timestamp(), 'source': source, 'count': state.count}
+            for field, a in state.fields.items():
+                if a.count == 0:
+                    continue
+                record[field] = a.last
+                if a.count > 1:
+                    record[field + '_min'] = a.min
+                    record[field + '_max'] = a.max
+                    record[field + '_mean'] = a.mean
+            return json.dumps(record, separators=(',', ':'))
+        parts = [self._timestamp(), source, 'n=%d' % state.count]
+        for field, a in state.fields.items():
+            if a.count == 0:
+                continue
+            text = '%s=%s' % (field, self._number(a.last))
+            limit = self.change.get(field, 0)
+            if a.count > 1 and (a.last - a.min > limit or a.max - a.last > limit):
+                text += '[%s,%s]' % (self._number(a.min), self._number(a.max))
+            parts.append(text)
+        return ' '.join(parts)
+
+    def _put(self, line):
+        with self._lock:
+            if len(self._queue) >= self._capacity:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(line)
+            self.records += 1
+            self._lock.notify_all()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._lock.wait()
+                if not self._queue:
+                    return
+                lines = list(self._queue)
+                self._queue.clear()
+                self._writing = True
+            try:
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+            except (OSError, ValueError):
+                self.write_errors += 1
+            with self._lock:
+                self._writing = False
+                self._lock.notify_all()
@@ -0,0 +1,201 @@
+"""
+thermal.py - Thermal playback governor
+
+Next to a grow lamp the Pi Zero 2W reaches the firmware's 80 C soft limit,
+where the clock is cut and frame pacing falls apart. The governor reads
+the SoC temperature from /sys/class/thermal and the CPU frequency limits
+from /sys/devices/system/cpu/cpu0/cpufreq. It steps playback down before
+that happens: first a lower frame rate, then a minimal one, then a static
+frame. A step is left only when the temperature is `hysteresis` degrees
+below its threshold, and only one step per reading on the way down. A
+frequency cap already applied by the kernel's cooling device
+(scaling_max_freq below cpuinfo_max_freq) counts as at least the first
+step.
+
+thermal.json:
+
+    "zone": "cpu-thermal",                  # thermal_zone*/type, else the first zone
+    "interval": 2,                          # seconds between sysfs reads
+    "hysteresis": 5,
+    "steps": [
+        {"name": "reduced", "above": 70, "scale": 0.5},
+        {"name": "minimal", "above": 75, "scale": 0.25},
+        {"name": "static", "above": 78, "scale": 0}
+    ]
+
+All paths are below `root`, so the governor runs against a fake tree:
+
+    root = fake_sysfs('/tmp/sys', temperature=72.0)
+    governor = ThermalGovernor.from_file(root=root)
+    governor.update()                   # -> 1 (reduced)
+    set_temperature(root, 60.0)
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import logging
+
+THERMAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thermal.json')
+SYSFS_ROOT = '/sys'
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+class ThermalGovernor:
+    """
+    Playback level from the SoC temperature and CPU frequency cap.
+
+    Args:
+        steps (list): {"name", "above": C, "scale": fps factor}, coolest first
+        hysteresis (float): Degrees below a step's threshold needed to leave it
+        interval (float): Minimum seconds between sysfs reads in update()
+        zone (str): Thermal zone type to watch
+        root (str): sysfs mount point (a fake tree for tests)
+    """
+
+    def __init__(self, steps=(), hysteresis=5.0, interval=2.0, zone='cpu-thermal', root=SYSFS_ROOT):
+        self.steps = sorted((dict(step) for step in steps), key=lambda step: step['above'])
+        self.hysteresis = hysteresis
+        self.interval = interval
+        self.root = root
+        self.zone_path = self._find_zone(zone)
+        self.cpufreq = os.path.join(root, 'devices', 'system', 'cpu', 'cpu0', 'cpufreq')
+        self.level = 0
+        self.temperature = None
+        self.frequency = None
+        self.capped = False
+        self.changes = 0
+        self._last = None
+
+    @classmethod
+    def from_config(cls, config, root=SYSFS_ROOT):
+        return cls(config.get('steps', ()), config.get('hysteresis', 5.0), config.get('interval', 2.0),
+                   config.get('zone', 'cpu-thermal'), root)
+
+    @classmethod
+    def from_file(cls, path=THERMAL_FILE, root=SYSFS_ROOT):
+        with open(path) as f:
+            return cls.from_config(json.load(f), root)
+
+    def _find_zone(self, zone):
+        zones = sorted(glob.glob(os.path.join(self.root, 'class', 'thermal', 'thermal_zone*')))
+        for path in zones:
+            try:
+                if _read(os.path.join(path, 'type')) == zone:
+                    return path
+            except OSError:
+                continue
+        return zones[0] if zones else None
+
+    def read(self):
+        """(temperature in C or None, current kHz or None, capped) from sysfs."""
+        temperature = frequency = None
+        capped = False
+        try:
+            temperature = int(_read(os.path.join(self.zone_path, 'temp'))) / 1000.0
+        except (OSError, TypeError, ValueError):
+            pass
+        try:
+            frequency = int(_read(os.path.join(self.cpufreq, 'scaling_cur_freq')))
+            capped = int(_read(os.path.join(self.cpufreq, 'scaling_max_freq'))) < \
+                int(_read(os.path.join(self.cpufreq, 'cpuinfo_max_freq')))
+        except (OSError, ValueError):
+            pass
+        return temperature, frequency, capped
+
+    def update(self, now=None):
+        """Re-read sysfs if interval has passed and return the level (0 = normal)."""
+        now = time.monotonic() if now is None else now
+        if self._last is not None and now - self._last < self.interval:
+            return self.level
+        self._last = now
+        self.temperature, self.frequency, self.capped = self.read()
+        level = self.level
+        if self.temperature is not None:
+            # Up at once to the hottest step exceeded, down one step at a time past the hysteresis
+            hot = sum(1 for step in self.steps if self.temperature >= step['above'])
+            if hot > level:
+                level = hot
+            elif level > 0 and self.temperature < self.steps[level - 1]['above'] - self.hysteresis:
+                level -= 1
+        if self.capped and self.steps:
+            level = max(level, 1)
+        if level != self.level:
+            self.changes += 1
+            logging.info('thermal: %s C%s, playback %s', '?' if self.temperature is None else '%.1f' % self.temperature,
+                         ' (clock capped)' if self.capped else '', self.name(level))
+            self.level = level
+        return level
+
+    def name(self, level=None):
+        level = self.level if level is None else level
+        return self.steps[level - 1].get('name', str(level)) if level else 'normal'
+
+    def scale(self):
+        """Frame rate factor of the current level; 0 = static frame."""
+        return self.steps[self.level - 1].get('scale', 1.0) if self.level else 1.0
+
+    def status(self):
+        return {
+            'temperature': self.temperature,
+            'frequency_khz': self.frequency,
+            'capped': self.capped,
+            'level': self.level,
+            'name': self.name(),
+            'scale': self.scale(),
+            'changes': self.changes,
+        }
+
+
+def fake_sysfs(root, temperature=45.0, zone='cpu-thermal', cur_khz=1000000, max_khz=1000000):
+    """Create thermal_zone0 and cpu0/cpufreq under root; returns root."""
+    zone_path = os.path.join(root, 'class', 'thermal', 'thermal_zone0')
+    os.makedirs(zone_path, exist_ok=True)
+    with open(os.path.join(zone_path, 'type'), 'w') as f:
+        f.write(zone + '\n')
+    set_temperature(root, temperature)
+    set_frequency(root, cur_khz, max_khz, max_khz)
+    return root
+
+
+def set_temperature(root, temperature, zone=0):
+    with open(os.path.join(root, 'class', 'thermal', 'thermal_zone%d' % zone, 'temp'), 'w') as f:
+        f.write('%d\n' % int(temperature * 1000))
+
+
+def set_frequency(root, cur_khz, max_khz=None, cpuinfo_max_khz=None):
+    """Current clock, policy limit and hardware maximum in kHz (None keeps a value)."""
+    path = os.path.join(root, 'devices', 'system', 'cpu', 'cpu0', 'cpufreq')
+    os.makedirs(path, exist_ok=True)
+    for name, value in (('scaling_cur_freq', cur_khz), ('scaling_max_freq', max_khz),
+                        ('cpuinfo_max_freq', cpuinfo_max_khz)):
+        if value is not None:
+            with open(os.path.join(path, name), 'w') as f:
+                f.write('%d\n' % value)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Thermal playback governor status')
+    parser.add_argument('--config', default=THERMAL_FILE, help='governor file')
+    parser.add_argument('--root', default=SYSFS_ROOT, help='sysfs root')
+    parser.add_argument('--watch', action='store_true', help='keep printing every interval')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    governor = ThermalGovernor.from_file(args.config, args.root)
+    while True:
+        governor.update()
+        print(json.dumps(governor.status()))
+        if not args.watch:
+            return 0
+        time.sleep(governor.interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
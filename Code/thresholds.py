@@ -0,0 +1,89 @@
+"""
+thresholds.py - Sensor conversions shared by the sensor loop and replay
+
+Converts raw ADS1115 readings to percentages / degrees and lists the
+5 character emotion messages understood by the display server (main.py),
+plus the ambient light report ("L042%") its frame rate policy uses.
+Which message to send is decided by the rule engine in rules.py.
+
+The raw end points come from calibration.json, written by calibration.py;
+without it the original hand-calibrated values are used.
+"""
+
+import os
+import json
+
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')
+
+# Raw ADC end points for 0% / 100% and the LM35 offset in degrees C
+DEFAULT_CALIBRATION = {
+    'light': {'dark': 22500, 'bright': 50},
+    'moisture': {'dry': 31000, 'wet': 15500},
+    'temperature': {'offset': 0.0},
+}
+
+ADC_16BIT_MAX = 65536
+lm35_constant = 10.0/1000
+ads_InputRange = 4.096 #For Gain = 1; Otherwise change accordingly
+ads_bit_Voltage = (ads_InputRange * 2) / (ADC_16BIT_MAX - 1)
+
+# Message sent over the socket -> folder in Code/emotion
+EMOTIONS = {
+    'happy': 'happy',
+    'sleep': 'sleepy',
+    'thirs': 'thirsty',
+    'savor': 'savory',
+    'hotty': 'hot',
+    'freez': 'freeze',
+}
+
+# Ambient light report for the display's frame rate policy (framerate.py)
+def light_message(percent):
+    return 'L%03d%%' % max(0, min(100, int(percent)))
+
+
+def parse_light(message):
+    """Light % from a light_message(), None for any other message."""
+    if len(message) == 5 and message[0] == 'L' and message[4] == '%' and message[1:4].isdigit():
+        return int(message[1:4])
+    return None
+
+
+# Map function
+def _map(x, in_min, in_max, out_min, out_max):
+    return int((x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min)
+
+
+def load_calibration(path=CALIBRATION_FILE):
+    """
+    Load a calibration profile, falling back to DEFAULT_CALIBRATION per value.
+
+    Args:
+        path (str): Profile written by calibration.py
+    """
+    calibration = {name: dict(values) for name, values in DEFAULT_CALIBRATION.items()}
+    if os.path.exists(path):
+        with open(path) as f:
+            profile = json.load(f)
+        for name, values in profile.get('channels', {}).items():
+            calibration.setdefault(name, {}).update(values)
+    return calibration
+
+
+def convert(ldr_value, moisture_value, lm35_value, calibration=DEFAULT_CALIBRATION):
+    """
+    Convert raw ADC values to (light %, moisture %, temperature in C).
+
+    Args:
+        ldr_value (int): Raw LDR channel value
+        moisture_value (int): Raw moisture channel value
+        lm35_value (int): Raw LM35 channel value
+        calibration (dict): Profile from load_calibration()
+    """
+    light = calibration['light']
+    moisture = calibration['moisture']
+    LDR_Percent = _map(ldr_value, light['dark'], light['bright'], 0, 100)
+    Moisture_Percent = _map(moisture_value, moisture['dry'], moisture['wet'], 0, 100)
+    Temperature = int(lm35_value * ads_bit_Voltage / lm35_constant + calibration['temperature']['offset'])
+    return LDR_Percent, Moisture_Percent, Temperature
+
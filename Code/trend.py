@@ -0,0 +1,138 @@
+"""
+trend.py - Streaming least-squares trend of a sensor channel
+
+SlopeWindow keeps the running sums of a linear regression over a sliding
+time window, so adding a sample and reading the slope are O(1) (samples
+leaving the window are subtracted back out). MoistureTrend runs a short
+window for detecting watering and a long one for the drying rate, which
+is used to forecast when the plant gets thirsty.
+
+Usage:
+    trend = MoistureTrend()
+    slope = trend.update(time.monotonic(), moisture_percent)   # %/min, short window
+    seconds = trend.time_to(10)   # until 10% at the current drying rate, or None
+"""
+
+from collections import deque
+
+# Re-base timestamps once they get this far from the reference, keeps the
+# sums of t*t well inside float precision on long runs.
+_REBASE_AFTER = 1e5
+
+
+class SlopeWindow:
+    """
+    Least-squares fit of y = a + b*t over the last `window` seconds.
+
+    Args:
+        window (float): Window length in seconds
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = deque()
+        self.t0 = None
+        self.n = 0
+        self.st = 0.0
+        self.sy = 0.0
+        self.stt = 0.0
+        self.sty = 0.0
+
+    def add(self, t, y):
+        if self.t0 is None:
+            self.t0 = t
+        elif t - self.t0 > _REBASE_AFTER:
+            self._rebase(t - self.window)
+        x = t - self.t0
+        self.samples.append((x, y))
+        self.n += 1
+        self.st += x
+        self.sy += y
+        self.stt += x * x
+        self.sty += x * y
+        cutoff = x - self.window
+        while self.samples[0][0] < cutoff:
+            ox, oy = self.samples.popleft()
+            self.n -= 1
+            self.st -= ox
+            self.sy -= oy
+            self.stt -= ox * ox
+            self.sty -= ox * oy
+
+    def _rebase(self, t0):
+        """Shift the time origin to t0, adjusting the sums in place."""
+        d = t0 - self.t0
+        self.samples = deque((x - d, y) for x, y in self.samples)
+        self.stt += -2 * d * self.st + self.n * d * d
+        self.sty -= d * self.sy
+        self.st -= self.n * d
+        self.t0 = t0
+
+    @property
+    def slope(self):
+        """Units of y per second, None until two distinct times are in the window."""
+        if self.n < 2:
+            return None
+        den = self.n * self.stt - self.st * self.st
+        if den <= 1e-9:
+            return None
+        return (self.n * self.sty - self.st * self.sy) / den
+
+    @property
+    def span(self):
+        """Seconds between the oldest and newest sample in the window."""
+        if not self.samples:
+            return 0.0
+        return self.samples[-1][0] - self.samples[0][0]
+
+    def predict(self, t):
+        """Fitted y at time t, None if there is no fit."""
+        b = self.slope
+        if b is None:
+            return None
+        a = (self.sy - b * self.st) / self.n
+        return a + b * (t - self.t0)
+
+
+class MoistureTrend:
+    """
+    Watering and drying trends of the moisture channel.
+
+    Args:
+        window (float): Short window (s) used for the watering slope
+        drying_window (float): Long window (s) used for the drying rate
+    """
+
+    def __init__(self, window=120.0, drying_window=6 * 3600.0):
+        self.fast = SlopeWindow(window)
+        self.slow = SlopeWindow(drying_window)
+        self.last_time = None
+
+    def update(self, t, moisture):
+        """Add a sample; returns the short-window slope in %/min (0 until known)."""
+        self.fast.add(t, moisture)
+        self.slow.add(t, moisture)
+        self.last_time = t
+        return self.slope
+
+    @property
+    def slope(self):
+        """Short-window slope in %/min."""
+        b = self.fast.slope
+        return 0.0 if b is None else b * 60.0
+
+    @property
+    def drying_rate(self):
+        """Long-window slope in %/hour (negative while drying), None if unknown."""
+        b = self.slow.slope
+        return None if b is None else b * 3600.0
+
+    def time_to(self, level):
+        """Seconds until moisture falls to `level` at the drying rate, None if not drying."""
+        b = self.slow.slope
+        if b is None or b >= 0 or self.last_time is None:
+            return None
+        now = self.slow.predict(self.last_time)
+        if now <= level:
+            return 0.0
+        return (level - now) / b
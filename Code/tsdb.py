@@ -0,0 +1,505 @@
+"""
+tsdb.py - Compact append-only time-series store for sensor history
+
+Readings are stored as fixed-width little-endian records in append-only
+segment files, one directory per resolution tier:
+
+    history/raw/<segment start>.seg   raw ADC readings (decimated to raw_interval)
+    history/1m/<segment start>.seg    1 minute min/max/mean rollups
+    history/1h/<segment start>.seg    1 hour rollups
+    history/1d/<segment start>.seg    1 day rollups
+
+Every reading passed to append() feeds the rollups, so the 1m/1h/1d tiers
+cover all samples even though the raw tier is thinned out. Writes are
+buffered and flushed (with a single fsync) every flush_interval seconds or
+flush_records records to keep SD-card wear down. Old raw and 1m segments are
+pruned by retention; hourly and daily rollups are kept forever. With the
+defaults (1 raw record/s kept 2 days, 1m kept 30 days) a plant with three
+channels uses roughly 3.5 MB steady state plus ~0.2 MB per year.
+
+Range queries mmap the segment files and bisect on the timestamp column.
+
+close() saves the rollup buckets still being filled to open-buckets.json;
+the next start picks them up (and writes the ones whose period ended in
+the meantime), so a restart does not lose samples. After a crash they are
+rebuilt from the finer tiers instead, which for the 1m tier means the
+decimated raw records.
+
+Version 1 files stored the rollup sample count as u16, which a day of
+1 Hz readings already overflows; they are converted to the u32 layout of
+version 2 when the store is opened.
+
+Usage:
+    from tsdb import TimeSeriesStore
+
+    store = TimeSeriesStore('history', channels=('ldr', 'moisture', 'temperature'))
+    store.append(time.time(), (ldr_raw, moisture_raw, lm35_raw))
+    rows = store.query(time.time() - 3600, time.time(), resolution='1m')
+    store.close()
+
+    # Dump a tier as CSV:
+    python3 tsdb.py history --res 1h --since 48
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import logging
+from bisect import bisect_left
+from collections import namedtuple
+
+MAGIC = b'FYTS'
+VERSION = 2
+# magic, version, tier id, channel count, record size
+HEADER = struct.Struct('<4sHHHH')
+
+RAW = 'raw'
+TIERS = ('1m', '1h', '1d')
+TIER_SECONDS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# Segment span per tier in seconds and how long segments are kept (None = forever)
+SEGMENT_SPAN = {RAW: 86400, '1m': 86400, '1h': 30 * 86400, '1d': 366 * 86400}
+RETENTION = {RAW: 2 * 86400, '1m': 30 * 86400, '1h': None, '1d': None}
+
+Rollup = namedtuple('Rollup', 'time count min max mean')
+OPEN_BUCKETS = 'open-buckets.json'
+
+
+def _clamp16(v):
+    return -32768 if v < -32768 else 32767 if v > 32767 else int(v)
+
+
+class _Bucket:
+    """Running min/max/sum/count for one rollup bucket."""
+
+    __slots__ = ('start', 'count', 'mins', 'maxs', 'sums')
+
+    def __init__(self, start, nch):
+        self.start = start
+        self.count = 0
+        self.mins = [32767] * nch
+        self.maxs = [-32768] * nch
+        self.sums = [0] * nch
+
+    def add(self, values):
+        self.count += 1
+        for i, v in enumerate(values):
+            if v < self.mins[i]:
+                self.mins[i] = v
+            if v > self.maxs[i]:
+                self.maxs[i] = v
+            self.sums[i] += v
+
+    def merge(self, count, mins, maxs, means):
+        """Fold a finer rollup record into this bucket."""
+        self.count += count
+        for i in range(len(mins)):
+            if mins[i] < self.mins[i]:
+                self.mins[i] = mins[i]
+            if maxs[i] > self.maxs[i]:
+                self.maxs[i] = maxs[i]
+            self.sums[i] += means[i] * count
+
+    def means(self):
+        return [_clamp16(round(s / self.count)) for s in self.sums]
+
+    def state(self):
+        return {'start': self.start, 'count': self.count, 'mins': self.mins, 'maxs': self.maxs, 'sums': self.sums}
+
+    @classmethod
+    def from_state(cls, state, nch):
+        bucket = cls(int(state['start']), nch)
+        bucket.count = int(state['count'])
+        if not len(state['mins']) == len(state['maxs']) == len(state['sums']) == nch:
+            raise ValueError('bucket has %d channels, expected %d' % (len(state['mins']), nch))
+        bucket.mins = [int(v) for v in state['mins']]
+        bucket.maxs = [int(v) for v in state['maxs']]
+        bucket.sums = list(state['sums'])
+        return bucket
+
+
+class _Tier:
+    """One resolution level: a directory of append-only segment files."""
+
+    def __init__(self, root, name, tier_id, nch, record, legacy=None):
+        self.name = name
+        self.tier_id = tier_id
+        self.nch = nch
+        self.record = record
+        self.time_field = struct.Struct(record.format[:2])
+        self.path = os.path.join(root, name)
+        self.span = SEGMENT_SPAN[name]
+        self.retention = RETENTION[name]
+        self.pending = []
+        self.last_time = None
+        self._fd = None
+        self._seg_start = None
+        os.makedirs(self.path, exist_ok=True)
+        self._upgrade(legacy)
+        self._repair_tail()
+
+    def segments(self):
+        """Sorted list of (segment start, path)."""
+        segs = []
+        for name in os.listdir(self.path):
+            if name.endswith('.seg'):
+                try:
+                    segs.append((int(name[:-4]), os.path.join(self.path, name)))
+                except ValueError:
+                    continue
+        segs.sort()
+        return segs
+
+    def _upgrade(self, legacy):
+        """Rewrite segments with legacy records (same fields, older layout) in the current one."""
+        for _, path in self.segments():
+            with open(path, 'rb') as f:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size or HEADER.unpack(header)[4] == self.record.size:
+                    continue
+                size = HEADER.unpack(header)[4]
+                if legacy is None or size != legacy.size:
+                    # Unknown layout: keep the file for inspection, out of the way of queries
+                    logging.warning("tsdb: %s has %d byte records, expected %d; renamed to .old",
+                                    path, size, self.record.size)
+                    os.replace(path, path + '.old')
+                    continue
+                body = f.read()
+            body = body[:len(body) - len(body) % size]
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.tier_id, self.nch, self.record.size))
+                f.write(b''.join(self.record.pack(*rec) for rec in legacy.iter_unpack(body)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            logging.info("tsdb: converted %s to version %d", path, VERSION)
+
+    def _repair_tail(self):
+        """Drop a torn trailing record left by a power cut and recover last_time."""
+        segs = self.segments()
+        if not segs:
+            return
+        path = segs[-1][1]
+        size = os.path.getsize(path)
+        if size < HEADER.size:
+            os.remove(path)
+            return self._repair_tail()
+        body = size - HEADER.size
+        extra = body % self.record.size
+        if extra:
+            logging.warning("tsdb: truncating %d torn bytes from %s", extra, path)
+            with open(path, 'r+b') as f:
+                f.truncate(size - extra)
+            body -= extra
+        if body:
+            with open(path, 'rb') as f:
+                f.seek(HEADER.size + body - self.record.size)
+                self.last_time = self.record.unpack(f.read(self.record.size))[0]
+
+    def _open_segment(self, t, fsync):
+        start = int(t) - int(t) % self.span
+        if self._fd is not None and start == self._seg_start:
+            return
+        if self._fd is not None:
+            if fsync:
+                os.fsync(self._fd)
+            os.close(self._fd)
+        path = os.path.join(self.path, '%d.seg' % start)
+        fresh = not os.path.exists(path)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._seg_start = start
+        if fresh:
+            os.write(self._fd, HEADER.pack(MAGIC, VERSION, self.tier_id, self.nch, self.record.size))
+            self._prune(t)
+
+    def _prune(self, now):
+        if self.retention is None:
+            return
+        for start, path in self.segments():
+            if start + self.span < now - self.retention and start != self._seg_start:
+                os.remove(path)
+
+    def add(self, t, packed):
+        # Bisecting relies on monotonic time within a tier; drop clock steps backwards
+        if self.last_time is not None and t <= self.last_time:
+            return False
+        self.last_time = t
+        self.pending.append((t, packed))
+        return True
+
+    def flush(self, fsync):
+        """Write pending records with one write() per segment touched."""
+        if not self.pending:
+            return
+        seconds = 1000 if self.name == RAW else 1
+        chunk = []
+        for t, packed in self.pending:
+            start = (t // seconds) - (t // seconds) % self.span
+            if chunk and start != self._seg_start:
+                os.write(self._fd, b''.join(chunk))
+                chunk = []
+            self._open_segment(t // seconds, fsync)
+            chunk.append(packed)
+        os.write(self._fd, b''.join(chunk))
+        if fsync:
+            os.fsync(self._fd)
+        self.pending = []
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._seg_start = None
+
+    def query(self, start, end):
+        """Yield unpacked records with start <= time < end (time in tier units)."""
+        seconds = 1000 if self.name == RAW else 1
+        size = self.record.size
+        for seg_start, path in self.segments():
+            if seg_start * seconds >= end or (seg_start + self.span) * seconds <= start:
+                continue
+            with open(path, 'rb') as f:
+                length = os.fstat(f.fileno()).st_size
+                count = (length - HEADER.size) // size
+                if count <= 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    times = _TimeColumn(mm, HEADER.size, size, count, self.time_field)
+                    lo = bisect_left(times, start)
+                    hi = bisect_left(times, end, lo)
+                    for rec in self.record.iter_unpack(mm[HEADER.size + lo * size:HEADER.size + hi * size]):
+                        yield rec
+        for t, packed in self.pending:
+            if start <= t < end:
+                yield self.record.unpack(packed)
+
+
+class _TimeColumn:
+    """Sequence view over the leading timestamp of each mmapped record, for bisect."""
+
+    def __init__(self, mm, offset, size, count, fmt):
+        self.mm = mm
+        self.offset = offset
+        self.size = size
+        self.count = count
+        self.fmt = fmt
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.fmt.unpack_from(self.mm, self.offset + i * self.size)[0]
+
+
+class TimeSeriesStore:
+    """
+    Embedded time-series store for one plant.
+
+    Args:
+        path (str): Root directory of the store
+        channels (tuple): Channel names, in the order values are passed to append()
+        raw_interval (float): Minimum seconds between stored raw records
+        flush_interval (float): Maximum seconds readings stay buffered in memory
+        flush_records (int): Flush early once this many records are pending
+        fsync (bool): fsync segment files on every flush
+    """
+
+    def __init__(self, path, channels=('ldr', 'moisture', 'temperature'), raw_interval=1.0,
+                 flush_interval=60.0, flush_records=256, fsync=True):
+        self.path = path
+        self.channels = tuple(channels)
+        self.raw_interval_ms = int(raw_interval * 1000)
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.fsync = fsync
+        nch = len(self.channels)
+        self._raw_record = struct.Struct('<q' + 'h' * nch)
+        # time, sample count (u32: 1 Hz for a day is 86400), then min/max/mean per channel
+        self._rollup_record = struct.Struct('<II' + 'hhh' * nch)
+        legacy = struct.Struct('<IH' + 'hhh' * nch)     # version 1, u16 count
+        self.tiers = {RAW: _Tier(path, RAW, 0, nch, self._raw_record)}
+        for tier_id, name in enumerate(TIERS, 1):
+            self.tiers[name] = _Tier(path, name, tier_id, nch, self._rollup_record, legacy)
+        self._buckets = {}
+        self._last_flush = time.monotonic()
+        self._resume()
+
+    def _load_open_buckets(self):
+        """Buckets saved by close(); the file is used up, so a later crash does not reuse it."""
+        path = os.path.join(self.path, OPEN_BUCKETS)
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            os.remove(path)
+            return {name: _Bucket.from_state(saved[name], len(self.channels)) for name in TIERS if name in saved}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.warning("tsdb: ignoring %s (%s)", path, e)
+            return {}
+
+    def _resume(self):
+        """Restore the open rollup buckets saved by close(), else rebuild them from finer tiers."""
+        now = int(time.time())
+        self._buckets = self._load_open_buckets()
+        for name in TIERS:
+            # Periods that ended while the store was closed are complete: write them
+            bucket = self._buckets.get(name)
+            if bucket is not None and bucket.start < now - now % TIER_SECONDS[name]:
+                del self._buckets[name]
+                self._emit(name, bucket)
+        finer = RAW
+        for name in TIERS:
+            secs = TIER_SECONDS[name]
+            start = now - now % secs
+            if name in self._buckets:
+                finer = name
+                continue
+            bucket = _Bucket(start, len(self.channels))
+            last = self.tiers[name].last_time
+            if last is None or last < start:
+                if finer == RAW:
+                    for rec in self.tiers[RAW].query(start * 1000, (start + secs) * 1000):
+                        bucket.add(rec[1:])
+                else:
+                    for rec in self.tiers[finer].query(start, start + secs):
+                        r = self._unpack_rollup(rec)
+                        bucket.merge(r.count, r.min, r.max, r.mean)
+            if bucket.count:
+                self._buckets[name] = bucket
+            finer = name
+
+    def append(self, t, values):
+        """
+        Record one reading.
+
+        Args:
+            t (float): Unix timestamp of the reading
+            values (sequence): Raw channel values, same order as channels
+        """
+        values = [_clamp16(v) for v in values]
+        ms = int(t * 1000)
+        raw = self.tiers[RAW]
+        if raw.last_time is None or ms - raw.last_time >= self.raw_interval_ms:
+            raw.add(ms, self._raw_record.pack(ms, *values))
+        self._roll(int(t), values)
+        if (sum(len(tier.pending) for tier in self.tiers.values()) >= self.flush_records
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def _roll(self, t, values):
+        bucket = self._buckets.get('1m')
+        start = t - t % 60
+        if bucket is not None and bucket.start != start:
+            self._emit('1m', bucket)
+            bucket = None
+        if bucket is None:
+            bucket = self._buckets['1m'] = _Bucket(start, len(values))
+        bucket.add(values)
+
+    def _emit(self, name, bucket):
+        """Write a finished bucket and fold it into the next coarser tier."""
+        mins, maxs, means = bucket.mins, bucket.maxs, bucket.means()
+        fields = []
+        for i in range(len(mins)):
+            fields += (mins[i], maxs[i], means[i])
+        self.tiers[name].add(bucket.start, self._rollup_record.pack(bucket.start, min(bucket.count, 0xFFFFFFFF), *fields))
+        idx = TIERS.index(name)
+        if idx + 1 == len(TIERS):
+            return
+        coarser = TIERS[idx + 1]
+        secs = TIER_SECONDS[coarser]
+        start = bucket.start - bucket.start % secs
+        parent = self._buckets.get(coarser)
+        if parent is not None and parent.start != start:
+            self._emit(coarser, parent)
+            parent = None
+        if parent is None:
+            parent = self._buckets[coarser] = _Bucket(start, len(mins))
+        parent.merge(bucket.count, mins, maxs, means)
+
+    def flush(self):
+        """Write all buffered records, with one fsync per touched tier."""
+        for tier in self.tiers.values():
+            tier.flush(self.fsync)
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush, and save the rollup buckets still being filled for the next start."""
+        if self._buckets:
+            path = os.path.join(self.path, OPEN_BUCKETS)
+            with open(path + '.tmp', 'w') as f:
+                json.dump({name: bucket.state() for name, bucket in self._buckets.items()}, f)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+        self.flush()
+        for tier in self.tiers.values():
+            tier.close()
+
+    def _unpack_rollup(self, rec):
+        n = len(self.channels)
+        return Rollup(rec[0], rec[1],
+                      tuple(rec[2 + 3 * i] for i in range(n)),
+                      tuple(rec[3 + 3 * i] for i in range(n)),
+                      tuple(rec[4 + 3 * i] for i in range(n)))
+
+    def query(self, start, end, resolution=RAW):
+        """
+        Return readings with start <= time < end.
+
+        Args:
+            start (float): Range start, Unix time
+            end (float): Range end, Unix time
+            resolution (str): 'raw', '1m', '1h' or '1d'
+
+        Returns:
+            list: (time, values) tuples for 'raw', Rollup tuples otherwise.
+            Buffered readings that are not flushed yet are included.
+        """
+        if resolution == RAW:
+            return [(rec[0] / 1000.0, rec[1:]) for rec in self.tiers[RAW].query(int(start * 1000), int(end * 1000))]
+        if resolution not in self.tiers:
+            raise ValueError('Unknown resolution %r' % resolution)
+        return [self._unpack_rollup(rec) for rec in self.tiers[resolution].query(int(start), int(end))]
+
+    def disk_usage(self):
+        """Bytes used on disk per tier."""
+        return {name: sum(os.path.getsize(p) for _, p in tier.segments()) for name, tier in self.tiers.items()}
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Dump Fyto sensor history as CSV')
+    parser.add_argument('path', nargs='?', default='history')
+    parser.add_argument('--res', default=RAW, choices=(RAW,) + TIERS)
+    parser.add_argument('--since', type=float, default=24, help='hours of history to dump')
+    parser.add_argument('--channels', default='ldr,moisture,temperature')
+    args = parser.parse_args(argv)
+
+    channels = args.channels.split(',')
+    store = TimeSeriesStore(args.path, channels=channels)
+    end = time.time() + 1
+    start = end - args.since * 3600
+    if args.res == RAW:
+        print('time,' + ','.join(channels))
+        for t, values in store.query(start, end):
+            print('%.3f,%s' % (t, ','.join(str(v) for v in values)))
+    else:
+        print('time,count,' + ','.join('%s_min,%s_max,%s_mean' % (c, c, c) for c in channels))
+        for r in store.query(start, end, args.res):
+            cols = []
+            for i in range(len(channels)):
+                cols += (r.min[i], r.max[i], r.mean[i])
+            print('%d,%d,%s' % (r.time, r.count, ','.join(str(v) for v in cols)))
+    for name, size in store.disk_usage().items():
+        print('# %s: %d bytes' % (name, size), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])